@@ -0,0 +1,95 @@
+# Measures what a job lifecycle costs against the offline cluster simulator:
+# round trips, bytes and simulated latency for submit, status, fetch and
+# cleanup (one job at a time and in bulk), at several numbers of jobs.
+#
+#   python benchmarks/job_lifecycle.py [--jobs 1 100 10000] [--latency 0.05]
+#                                      [--agent]
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from jobservant.cluster_account import ClusterAccount  # noqa: E402
+from jobservant.simulator import SimulatedCluster  # noqa: E402
+
+
+OPERATIONS = ['submit', 'status', 'fetch', 'bulk fetch', 'cleanup',
+              'bulk clean']
+
+
+def measure(cluster, results, operation, function):
+    cluster.reset_stats()
+    function()
+    results[operation] = cluster.totals()
+
+
+def run_lifecycle(jobs, agent=False, **kwargs):
+    cluster = SimulatedCluster(**kwargs)
+    account = ClusterAccount('simulated.cluster',
+                             username=cluster.username,
+                             workspace=cluster.workspace,
+                             client_factory=cluster.client,
+                             log_level='none', agent=agent)
+    account.connect()
+    account.measure_clock_offset()
+    results = {}
+    specs = [{'text': 'echo job %d\n' % i, 'account': 'def-bench'}
+             for i in range(jobs)]
+    collection = None
+
+    def submit():
+        nonlocal collection
+        collection = account.submit_many(specs)
+
+    def fetch():
+        for job in collection:
+            job.fetch_output()
+
+    def cleanup():
+        for job in collection:
+            job.cleanup()
+
+    def bulk_cleanup():
+        collection.cleanup()
+
+    measure(cluster, results, 'submit', submit)
+    measure(cluster, results, 'status', collection.statuses)
+    cluster.advance(cluster.pending_seconds + cluster.run_seconds)
+    account.status_cache.invalidate()
+    measure(cluster, results, 'fetch', fetch)
+    measure(cluster, results, 'bulk fetch', collection.fetch_files)
+    measure(cluster, results, 'cleanup', cleanup)
+    measure(cluster, results, 'bulk clean', bulk_cleanup)
+    account.pool.close()
+    return results
+
+
+def report(jobs, results):
+    print('%d job(s)' % jobs)
+    print('  %-10s %10s %10s %12s %12s %12s' %
+          ('', 'channels', 'trips', 'bytes out', 'bytes in', 'latency (s)'))
+    for operation in OPERATIONS:
+        result = results[operation]
+        print('  %-10s %10d %10d %12d %12d %12.2f' %
+              (operation, result['channels'], result['round_trips'],
+               result['bytes_out'], result['bytes_in'], result['seconds']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--jobs', type=int, nargs='+',
+                        default=[1, 100, 10000])
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Simulated seconds per round trip')
+    parser.add_argument('--bandwidth', type=float, default=10e6,
+                        help='Simulated bytes per second')
+    parser.add_argument('--agent', action='store_true',
+                        help='Run commands through the remote agent')
+    args = parser.parse_args()
+    for jobs in args.jobs:
+        report(jobs, run_lifecycle(jobs, args.agent, latency=args.latency,
+                                   bandwidth=args.bandwidth))
+
+
+if __name__ == '__main__':
+    main()
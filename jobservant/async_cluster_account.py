@@ -0,0 +1,109 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from .cluster_account import ClusterAccount
+
+
+class AsyncClusterAccount:
+    # paramiko is blocking, so calls run on a small shared thread pool. All
+    # of them share the account's SSH transport, each on its own channel.
+    MAX_CONCURRENCY = 8
+
+    def __init__(self, server=None, **kwargs):
+        if kwargs.get('cluster_account') is not None:
+            self.cluster_account = kwargs['cluster_account']
+        else:
+            self.cluster_account = ClusterAccount(server, **kwargs)
+        self.executor = ThreadPoolExecutor(
+            max_workers=kwargs.get('max_concurrency', self.MAX_CONCURRENCY))
+
+    async def call(self, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(function, *args, **kwargs))
+
+    async def connect(self):
+        return await self.call(self.cluster_account.connect)
+
+    async def run(self, command):
+        # Returns (exit code, stdout bytes, stderr bytes)
+        def run_command():
+            stdin, stdout, stderr = self.cluster_account.exec_command(command)
+            out = stdout.read()
+            err = stderr.read()
+            return stdout.channel.recv_exit_status(), out, err
+        return await self.call(run_command)
+
+    async def simple_exec(self, command):
+        return await self.call(self.cluster_account.simple_exec, command)
+
+    async def create_job(self, **kwargs):
+        # Job creation may check the workspace, so it runs in a thread too
+        job = await self.call(self.cluster_account.create_job, **kwargs)
+        return AsyncClusterJob(job, self)
+
+    async def submit_job(self, **kwargs):
+        job = await self.call(self.cluster_account.submit_job, **kwargs)
+        return AsyncClusterJob(job, self)
+
+    async def submit_many(self, specs, **kwargs):
+        collection = await self.call(self.cluster_account.submit_many,
+                                     specs, **kwargs)
+        return [AsyncClusterJob(job, self) for job in collection]
+
+    async def statuses(self, jobs):
+        # Status of many jobs with a single squeue call
+        collection = self.cluster_account.create_job_collection(
+            [job.cluster_job for job in jobs])
+        return await self.call(collection.statuses)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class AsyncClusterJob:
+    def __init__(self, cluster_job, async_cluster_account):
+        self.cluster_job = cluster_job
+        self.async_cluster_account = async_cluster_account
+
+    @property
+    def jobid(self):
+        return self.cluster_job.jobid
+
+    async def call(self, function, *args, **kwargs):
+        return await self.async_cluster_account.call(function, *args,
+                                                     **kwargs)
+
+    async def submit(self, **kwargs):
+        return await self.call(self.cluster_job.submit, **kwargs)
+
+    async def status(self):
+        return await self.call(self.cluster_job.status)
+
+    async def fetch_output(self):
+        return await self.call(self.cluster_job.fetch_output)
+
+    async def fetch_error(self):
+        return await self.call(self.cluster_job.fetch_error)
+
+    async def new_output(self, final=False):
+        return await self.call(self.cluster_job.new_output, final)
+
+    async def stream_output(self, **kwargs):
+        # Async generator yielding output text until the job finishes
+        poll_seconds = kwargs.get('poll_seconds',
+                                  self.cluster_job.OUTPUT_POLL_SECONDS)
+        while True:
+            finished = (await self.status())['status'] == 'finished'
+            text = await self.new_output(finished)
+            if len(text) > 0:
+                yield text
+            if finished:
+                return
+            await asyncio.sleep(poll_seconds)
+
+    async def cancel(self):
+        return await self.call(self.cluster_job.cancel)
+
+    async def cleanup(self):
+        return await self.call(self.cluster_job.cleanup)
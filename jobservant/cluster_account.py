@@ -1,13 +1,61 @@
-import paramiko
 import getpass
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from .cluster_job import ClusterJob
+from .cluster_job_collection import ClusterJobCollection
+from .command_stats import CommandStats
+from .connection_pool import ConnectionPool
+from .daemon_client import DaemonClient, DaemonUnavailable
+from .job_accounting import JobAccounting
+from .job_registry import JobRegistry
+from .polling_scheduler import PollingScheduler
+from .queue_record import QueueRecordParser
+from .remote_agent import RemoteAgent
+from .state_feed import StateFeed
+from .status_cache import StatusCache
 from .has_a_logger import HasALogger
+from .remote_transfer import RemoteTransfer
+from .token_bucket import TokenBucket
 
 
 class ClusterAccount(HasALogger):
+    # Seconds between remote clock offset measurements
+    CLOCK_OFFSET_REFRESH = 600.0
+    # Parallel submissions in submit_many(), kept below OpenSSH's default
+    # MaxSessions of 10
+    SUBMIT_CONCURRENCY = 8
+    # Seconds squeue results are shared between callers
+    STATUS_CACHE_TTL = 5.0
+    # squeue's error when none of the jobs asked about are known
+    SQUEUE_UNKNOWN_JOBS = 'Invalid job id specified'
+    # Seconds between evictions of old memoized jobs
+    MEMOIZE_EVICT_INTERVAL = 600.0
+    # Directories removed by one rm command
+    REMOVE_BATCH = 1000
+    # Workspace directories changed more recently than this (in seconds)
+    # are never collected, as a job may be being set up in them
+    WORKSPACE_GC_MIN_AGE = 3600.0
+
     def __init__(self, server, **kwargs):
         self.server = server
         self.ssh = None
+        self.pool = None
+        self.connection_options = dict(
+            (key, kwargs[key]) for key in ConnectionPool.OPTIONS
+            if key in kwargs)
+        self.transfer = None
+        self.transfer_options = dict(
+            (key, kwargs[key]) for key in RemoteTransfer.OPTIONS
+            if key in kwargs)
+        self.accounting = None
+        self.scheduler = None
+        self.background = None
+        self.background_lock = threading.Lock()
+        self.scheduler_options = kwargs.get('polling', {})
+        self.feed = None
+        self.feed_options = kwargs.get('state_feed', {})
 
         self.username = kwargs.get('username', getpass.getuser())
         self.workspace = kwargs.get('workspace',
@@ -16,19 +64,132 @@ class ClusterAccount(HasALogger):
         self.init_logging(**kwargs)
 
         self.workspace_verified = False
+        self.fast_submit = kwargs.get('fast_submit', False)
+
+        # 'compact' asks squeue for only the fields in queue_fields, 'all'
+        # for every field with "%all"
+        self.squeue_format = kwargs.get('squeue_format', 'compact')
+        if self.squeue_format not in ['compact', 'all']:
+            raise ValueError('Bad squeue_format')
+        self.queue_record_parser = \
+            QueueRecordParser(kwargs.get('queue_fields'))
+        self.status_cache = StatusCache(
+            self, kwargs.get('status_cache_ttl', self.STATUS_CACHE_TTL),
+            log_level=self.log_level)
+
+        self.clock_offset_refresh = kwargs.get('clock_offset_refresh',
+                                               self.CLOCK_OFFSET_REFRESH)
+        self.remote_clock_offset = None
+        self.clock_offset_measured_at = None
+
+        # Submitted jobs are recorded in the registry (a JobRegistry or the
+        # path of its database) if there is one
+        self.registry = kwargs.get('registry')
+        if isinstance(self.registry, str):
+            self.registry = JobRegistry(self.registry,
+                                        **self.logging_options())
+
+        # With memoize set, submit_job() reuses an earlier job with the same
+        # submit script and inputs (which needs a registry). Reusable jobs
+        # older than memoize_max_age seconds, or past memoize_max_bytes in
+        # total, are removed.
+        self.memoize = kwargs.get('memoize', False)
+        self.memoize_max_age = kwargs.get('memoize_max_age')
+        self.memoize_max_bytes = kwargs.get('memoize_max_bytes')
+        self.memoize_evicted_at = None
+
+        # With agent set, commands are run by a RemoteAgent over one
+        # long-lived channel, unless they need a channel of their own
+        self.use_agent = kwargs.get('agent', False)
+        self.agent = None
+        self.agent_lock = threading.Lock()
+
+        # With daemon_socket set (the path of its socket, or True for the
+        # default), commands, squeue queries and watches go through a local
+        # jobservant daemon, sharing its SSH connections and squeue results
+        # with other processes
+        self.daemon_socket = kwargs.get('daemon_socket')
+        self.daemon = None
+        self.daemon_lock = threading.Lock()
+
+        # Latency, bytes and exit codes of the remote commands run
+        self.command_stats = None
+        if kwargs.get('instrument', True):
+            self.command_stats = CommandStats()
+
+    def connection_pool(self):
+        if self.pool is None:
+            self.pool = ConnectionPool(self, log_level=self.log_level,
+                                       **self.connection_options)
+        return self.pool
 
     def connect(self):
-        if (self.ssh is None):
-            self.log('info', 'Connecting to %s@%s' %
-                     (self.username, self.server))
-            self.ssh = paramiko.SSHClient()
-            self.ssh.load_system_host_keys()
-            self.ssh.connect(self.server, username=self.username)
-
-    def exec_command(self, command):
-        self.connect()
+        self.ssh = self.connection_pool().client(0)
+
+    def remote_agent(self):
+        # The running agent, started if need be. If it can't be started,
+        # commands go back to having channels of their own.
+        with self.agent_lock:
+            if self.agent is not None and self.agent.alive:
+                return self.agent
+            agent = RemoteAgent(self)
+            try:
+                agent.start()
+            except Exception as e:
+                self.log('info', 'Not using the remote agent: %s', e)
+                self.use_agent = False
+                return None
+            self.agent = agent
+            return agent
+
+    def daemon_client(self):
+        with self.daemon_lock:
+            if self.daemon is None:
+                path = self.daemon_socket
+                if path is True:
+                    path = None
+                self.daemon = DaemonClient(self, path)
+            return self.daemon
+
+    def exec_command(self, command, kind=None, direct=False):
+        # kind names the command in the command statistics, by default the
+        # first program it runs. Commands that write to stdin, or stream a
+        # lot of output, need direct set so they get their own channel when
+        # using the remote agent.
         self.log('debug', command)
-        return self.ssh.exec_command(command)
+        streams = None
+        if self.daemon_socket:
+            try:
+                streams = self.daemon_client().exec_command(command)
+            except DaemonUnavailable as e:
+                self.log('info', 'Not using the jobservant daemon: %s', e)
+        if streams is None and self.use_agent and not direct:
+            agent = self.remote_agent()
+            try:
+                streams = agent and agent.exec_command(command)
+            except ValueError as e:
+                self.log('info', 'Remote agent failed: %s', e)
+        if streams is None:
+            streams = self.connection_pool().exec_command(command)
+        if self.command_stats is None:
+            return streams
+        return self.command_stats.instrument(
+            streams, kind or CommandStats.command_kind(command), len(command))
+
+    def command_statistics(self):
+        # Returns a hash of command kind => count, bytes_out, bytes_in,
+        # exit_codes (code => count), seconds, mean_seconds, max_seconds and
+        # histogram (a list of (upper bound in seconds, count) pairs)
+        if self.command_stats is None:
+            return {}
+        return self.command_stats.stats()
+
+    def reset_command_statistics(self):
+        if self.command_stats is not None:
+            self.command_stats.reset()
+
+    def open_sftp(self):
+        return self.connection_pool().open_sftp()
 
     # TODO: YUCK?
     def simple_exec(self, command):
@@ -38,6 +199,21 @@ class ClusterAccount(HasALogger):
             return True
         return False
 
+    def remote_transfer(self):
+        if self.transfer is None:
+            self.transfer = RemoteTransfer(self, **self.transfer_options)
+        return self.transfer
+
+    def upload_file(self, remote_path, contents, compress=None):
+        return self.remote_transfer().upload(remote_path, contents, compress)
+
+    def download_file(self, remote_path, fileobj, compress=None):
+        return self.remote_transfer().download(remote_path, fileobj,
+                                               compress)
+
+    def read_file(self, remote_path, compress=None):
+        return self.remote_transfer().read(remote_path, compress)
+
     def does_directory_exist(self, directory):
         command = 'test -d ' + directory
         return self.simple_exec(command)
@@ -56,11 +232,492 @@ class ClusterAccount(HasALogger):
         command = 'mkdir -p ' + directory
         return self.simple_exec(command)
 
+    def queue_status_hashes(self, jobids, expand_arrays=False):
+        # Returns a hash of jobid => squeue fields for the jobids still
+        # in the queue, using a single squeue call. Array job tasks are
+        # keyed as jobid_taskid, one per task if expand_arrays is set.
+        # Results are shared for status_cache_ttl seconds.
+        if self.registry is not None:
+            # Jobs the registry knows have finished aren't asked about
+            finished = self.registry.finished_jobids(self.server, jobids)
+            jobids = [jobid for jobid in jobids if jobid not in finished]
+        if len(jobids) == 0:
+            return {}
+        # Always through the status cache, which tracks state transitions
+        # for subscribers even when results aren't reused (ttl <= 0)
+        hashes = self.status_cache.queue_status_hashes(jobids, expand_arrays)
+        if self.registry is not None:
+            self.registry.update_states(self.server,
+                                        self.registry_states(jobids, hashes))
+        return hashes
+
+    def registry_states(self, jobids, queue_statuses):
+        # Registry state of each jobid from squeue results, where an array
+        # job is running if any of its tasks are
+        codes = dict((jobid, set()) for jobid in jobids)
+        for queue_jobid, queue_status in queue_statuses.items():
+            jobid = queue_jobid.split('_')[0]
+            for key in [queue_jobid, jobid]:
+                if key in codes:
+                    codes[key].add(queue_status.get('ST'))
+        states = {}
+        for jobid, job_codes in codes.items():
+            if len(job_codes) == 0:
+                states[jobid] = 'finished'
+            elif job_codes & set(['R', 'CG']):
+                states[jobid] = 'running'
+            else:
+                states[jobid] = 'waiting'
+        return states
+
+    def subscribe(self, callback, jobids=None):
+        # Calls callback(jobid, old_state, new_state) whenever a status
+        # check sees a job change state
+        return self.status_cache.subscribe(callback, jobids)
+
+    def unsubscribe(self, subscriber):
+        self.status_cache.unsubscribe(subscriber)
+
+    def polling_scheduler(self):
+        # Shared by everything watching this account's jobs
+        if self.scheduler is None:
+            self.scheduler = PollingScheduler(self, log_level=self.log_level,
+                                              **self.scheduler_options)
+        return self.scheduler
+
+    def watch(self, cluster_job, callback):
+        if self.daemon_socket:
+            return self.daemon_client().watch(cluster_job, callback)
+        return self.polling_scheduler().watch(cluster_job, callback)
+
+    def state_feed(self):
+        if self.feed is None:
+            self.feed = StateFeed(self, **self.feed_options)
+        return self.feed
+
+    def state_changes(self, jobids=None):
+        # Returns a hash of jobid => {'state', 'exit_code', 'end'} for the
+        # jobs (only those in jobids, if set) that changed state since the
+        # last call, with one sacct call over just that time window
+        changes = self.state_feed().poll(jobids)
+        finished = [jobid for jobid, change in changes.items()
+                    if change['state'] in StateFeed.STATES]
+        if len(finished) > 0:
+            self.status_cache.invalidate(
+                set(jobid.split('_')[0] for jobid in finished))
+            if self.registry is not None:
+                self.registry.update_states(self.server, dict(
+                    (jobid, 'finished') for jobid in finished
+                    if '_' not in jobid))
+        return changes
+
+    def query_queue_status_hashes(self, jobids, expand_arrays=False):
+        if self.daemon_socket:
+            try:
+                return self.daemon_client().queue_status_hashes(
+                    jobids, expand_arrays)
+            except DaemonUnavailable as e:
+                self.log('info', 'Not using the jobservant daemon: %s', e)
+        if self.squeue_format == 'compact':
+            return self.queue_records(jobids, expand_arrays)
+
+        command = 'squeue -j ' + ','.join(jobids) + ' -o "%all"'
+        if expand_arrays:
+            command += ' -r'
+        stdin, stdout, stderr = self.exec_command(command)
+        out = stdout.readlines()
+        if stdout.channel.recv_exit_status() > 0:
+            return self.squeue_failed(stderr)
+
+        self.log('debug', lambda: 'squeue output:\n' + ''.join(out))
+        if len(out) < 2:
+            # Probably jobs finished
+            return {}
+
+        header = out[0].strip().split('|')
+        output_hash = {}
+        for line in out[1:]:
+            queue_status = self.parse_queue_status_line(header, line)
+            jobid = self.queue_status_jobid(queue_status)
+            if jobid:
+                output_hash[jobid] = queue_status
+        return output_hash
+
+    def squeue_failed(self, stderr):
+        # squeue also fails when it knows none of the jobs, which means they
+        # have all left the queue. Anything else (slurmctld timing out, ...)
+        # says nothing about the jobs, so it mustn't look like they finished.
+        error = stderr.read()
+        if isinstance(error, bytes):
+            error = error.decode('utf-8', errors='replace')
+        if self.SQUEUE_UNKNOWN_JOBS in error:
+            return {}
+        raise ValueError('squeue failed: ' + error.strip())
+
+    def queue_records(self, jobids, expand_arrays=False):
+        # Like queue_status_hashes(), but only fetching the selected fields
+        # into QueueRecords. With jobids None, all the user's jobs.
+        selection = '-u ' + self.username
+        if jobids is not None:
+            selection = '-j ' + ','.join(jobids)
+        command = "squeue -h %s -o '%s'" % \
+            (selection, self.queue_record_parser.format)
+        if expand_arrays:
+            command += ' -r'
+        stdin, stdout, stderr = self.exec_command(command)
+        out = stdout.readlines()
+        if stdout.channel.recv_exit_status() > 0:
+            return self.squeue_failed(stderr)
+
+        self.log('debug', lambda: 'squeue output:\n' + ''.join(out))
+        records = {}
+        for record in self.queue_record_parser.parse_lines(out):
+            records[self.queue_status_jobid(record)] = record
+        return records
+
+    @staticmethod
+    def queue_status_jobid(queue_status):
+        task_id = queue_status.get('ARRAY_TASK_ID', 'N/A')
+        if task_id in ('N/A', ''):
+            return queue_status.get('JOBID')
+        return queue_status['ARRAY_JOB_ID'] + '_' + task_id
+
+    @staticmethod
+    def parse_queue_status_line(header, line):
+        fields = line.strip().split('|')
+        output_hash = {}
+
+        # This is gross ... FEATURES field might have '|' in it
+        field_diff = len(fields) - len(header)
+
+        field_i = 0
+        for i in range(len(header)):
+            if (header[i] == 'FEATURES') and field_diff > 0:
+                # Reassemble features field
+                features_field = '|'.join(fields[field_i:
+                                                 field_i + field_diff + 1])
+                output_hash[header[i]] = features_field
+                field_i += field_diff
+            elif len(header[i]) > 0:
+                output_hash[header[i]] = fields[field_i]
+
+            field_i += 1
+
+        return output_hash
+
+    def measure_clock_offset(self):
+        command = 'date --iso-8601=seconds'
+        before = time.time()
+        stdin, stdout, stderr = self.exec_command(command)
+        out = stdout.readlines()
+        after = time.time()
+        # Ensure timezone and carriage return are stripped off. Slurm
+        # reports times in the cluster's local time without a timezone, so
+        # the offset is measured in that same frame (any timezone difference
+        # is folded into it).
+        remote = datetime.fromisoformat(out[0][:19]).timestamp()
+        # Assume the remote clock was read halfway through the round trip
+        self.remote_clock_offset = remote - (before + after) / 2.0
+        self.clock_offset_measured_at = after
+        self.log('debug', 'Remote clock offset %.1f seconds',
+                 self.remote_clock_offset)
+        return self.remote_clock_offset
+
+    def clock_offset(self):
+        # Seconds to add to the local clock to get the remote clock
+        if self.remote_clock_offset is None or \
+           time.time() - self.clock_offset_measured_at > \
+           self.clock_offset_refresh:
+            self.measure_clock_offset()
+        return self.remote_clock_offset
+
+    def remote_now(self):
+        return time.time() + self.clock_offset()
+
+    def job_accounting(self):
+        if self.accounting is None:
+            self.accounting = JobAccounting(self)
+        return self.accounting
+
+    def efficiency_hashes(self, jobids):
+        # Returns a hash of jobid => efficiency fields, with one sacct call
+        if self.registry is None:
+            return self.job_accounting().efficiency_hashes(jobids)
+
+        efficiencies = self.registry.efficiencies(self.server, jobids)
+        missing = [jobid for jobid in jobids if jobid not in efficiencies]
+        if len(missing) > 0:
+            fetched = self.job_accounting().efficiency_hashes(missing)
+            self.registry.save_efficiencies(self.server, dict(
+                (jobid, efficiency) for jobid, efficiency in fetched.items()
+                if self.job_accounting().is_finished(efficiency)))
+            efficiencies.update(fetched)
+        return efficiencies
+
+    def job_submitted(self, cluster_job):
+        if self.registry is not None:
+            self.registry.record(self.server, cluster_job)
+
+    def registered_jobs(self, state=None, jobids=None):
+        # A collection of the jobs in the registry for this cluster (those
+        # in state, or with the given jobids, if set), to pick up where an
+        # earlier session left off
+        if self.registry is None:
+            raise ValueError('No job registry')
+        return self.create_job_collection(
+            self.registry.jobs(self, state, jobids))
+
+    def registered_job(self, jobid):
+        jobs = self.registered_jobs(jobids=[str(jobid)])
+        if len(jobs) == 0:
+            raise ValueError('Job %s is not in the registry' % jobid)
+        return jobs[0]
+
     def create_job(self, **kwargs):
-        self.ensure_workspace_exists()
+        if not self.fast_submit:
+            # Fast submits find out about a missing workspace anyway
+            self.ensure_workspace_exists()
         return ClusterJob(cluster_account=self, **kwargs)
 
     def submit_job(self, **kwargs):
+        # memoize overrides the account's setting for this job
+        memoize = kwargs.pop('memoize', self.memoize)
         job = self.create_job(**kwargs)
+        if memoize:
+            job.memo_key = job.content_hash()
+            memoized = self.memoized_job(job.memo_key)
+            if memoized is not None:
+                self.log('info', 'Reusing job %s', memoized.jobid)
+                return memoized
         job.submit()
+        if memoize:
+            self.evict_memoized_if_due()
         return job
+
+    def memoized_job(self, memo_key):
+        # The newest earlier job with this memo key that is still queued, or
+        # that finished successfully and whose work directory is still there
+        if self.registry is None:
+            raise ValueError('Memoizing jobs needs a job registry')
+        for job in reversed(self.registry.jobs(self, memo_key=memo_key)):
+            if job.status()['status'] != 'finished':
+                return job
+            if self.job_succeeded(job) and \
+               self.does_directory_exist(job.work_directory):
+                return job
+        return None
+
+    def job_succeeded(self, cluster_job):
+        jobids = [cluster_job.jobid]
+        if cluster_job.is_array():
+            jobids = [cluster_job.task_jobid(task_id)
+                      for task_id in cluster_job.task_ids()]
+        efficiencies = self.efficiency_hashes(jobids)
+        return all(efficiencies.get(jobid, {}).get('state', '').startswith(
+            'COMPLETED') for jobid in jobids)
+
+    def directory_sizes(self, directories):
+        # Returns a hash of directory => bytes used, with one du call
+        if len(directories) == 0:
+            return {}
+        stdin, stdout, stderr = self.exec_command(
+            'du -sb ' + ' '.join(directories))
+        sizes = {}
+        for line in stdout.readlines():
+            fields = line.rstrip('\n').split('\t', 1)
+            if len(fields) == 2 and fields[0].isdigit():
+                sizes[fields[1]] = int(fields[0])
+        return sizes
+
+    def evict_memoized_if_due(self):
+        if self.memoize_max_age is None and self.memoize_max_bytes is None:
+            return []
+        if self.memoize_evicted_at is not None and \
+           time.time() - self.memoize_evicted_at < \
+           self.MEMOIZE_EVICT_INTERVAL:
+            return []
+        return self.evict_memoized()
+
+    def evict_memoized(self, max_age=None, max_bytes=None):
+        # Removes reusable finished jobs (and their work directories) older
+        # than max_age seconds, then the oldest until those left use at most
+        # max_bytes. Returns the removed jobids.
+        if self.registry is None:
+            raise ValueError('Memoizing jobs needs a job registry')
+        if max_age is None:
+            max_age = self.memoize_max_age
+        if max_bytes is None:
+            max_bytes = self.memoize_max_bytes
+        self.memoize_evicted_at = time.time()
+
+        entries = self.registry.memoized_entries(self.server)
+        evicted = []
+        if max_age is not None:
+            evicted = [entry for entry in entries
+                       if self.memoize_evicted_at - entry[2] > max_age]
+        kept = [entry for entry in entries if entry not in evicted]
+        if max_bytes is not None:
+            sizes = self.directory_sizes([entry[1] for entry in kept])
+            total = sum(sizes.values())
+            for entry in kept:
+                if total <= max_bytes:
+                    break
+                total -= sizes.get(entry[1], 0)
+                evicted.append(entry)
+
+        if len(evicted) == 0:
+            return []
+        self.log('info', 'Evicting %d memoized jobs', len(evicted))
+        self.remove_directories([entry[1] for entry in evicted])
+        jobids = [entry[0] for entry in evicted]
+        self.registry.forget(self.server, jobids)
+        return jobids
+
+    def background_executor(self):
+        # Runs slow housekeeping like removing directories, one at a time
+        with self.background_lock:
+            if self.background is None:
+                self.background = ThreadPoolExecutor(max_workers=1)
+            return self.background
+
+    def remove_directories(self, directories, background=False):
+        # Removes the directories with one rm command (per REMOVE_BATCH).
+        # With background set, returns a Future instead of waiting.
+        directories = list(directories)
+        if background:
+            return self.background_executor().submit(
+                self.remove_directories, directories)
+        removed = True
+        for i in range(0, len(directories), self.REMOVE_BATCH):
+            batch = directories[i:i + self.REMOVE_BATCH]
+            removed = self.simple_exec('rm -rf ' + ' '.join(batch)) and \
+                removed
+        return removed
+
+    def workspace_directories(self):
+        # Returns a hash of the workspace's cluster_job_* directories =>
+        # (bytes used, last modified on the remote clock), with one du call
+        command = 'du -sb --time --time-style=+%Y-%m-%dT%H:%M:%S ' + \
+            self.workspace + '/cluster_job_*'
+        stdin, stdout, stderr = self.exec_command(command)
+        directories = {}
+        for line in stdout.readlines():
+            fields = line.rstrip('\n').split('\t', 2)
+            if len(fields) == 3 and fields[0].isdigit():
+                modified = datetime.fromisoformat(fields[1]).timestamp()
+                directories[fields[2]] = (int(fields[0]), modified)
+        return directories
+
+    def queued_work_directories(self):
+        # Work directories of all the user's jobs in the queue. squeue gives
+        # them with symlinks resolved, so those in the workspace are given
+        # under the workspace path as used here instead, like du's.
+        command = "readlink -f %s && squeue -h -u %s -o '%%Z'" % \
+            (self.workspace, self.username)
+        stdin, stdout, stderr = self.exec_command(command)
+        out = stdout.readlines()
+        if stdout.channel.recv_exit_status() > 0:
+            return set(self.squeue_failed(stderr))
+
+        resolved = out[0].strip() + '/' if len(out) > 0 else None
+        directories = set()
+        for line in out[1:]:
+            directory = line.strip()
+            if resolved is not None and directory.startswith(resolved):
+                directory = self.workspace + '/' + directory[len(resolved):]
+            if directory:
+                directories.add(directory)
+        return directories
+
+    def collect_workspace(self, max_age=None, max_bytes=None, keep=None,
+                          background=False):
+        # Removes the workspace's cluster_job_* directories that aren't used
+        # by a queued job, a registered job or anything in keep (ClusterJobs
+        # or directories): those older than max_age seconds, then the oldest
+        # until the workspace uses at most max_bytes (all of them if neither
+        # is set). Directories changed in the last WORKSPACE_GC_MIN_AGE
+        # seconds are left alone. Returns the directories removed.
+        directories = self.workspace_directories()
+        kept = self.queued_work_directories()
+        if self.registry is not None:
+            kept |= self.registry.work_directories(self.server)
+        for item in keep or []:
+            kept.add(getattr(item, 'work_directory', item))
+
+        now = self.remote_now()
+        candidates = sorted(
+            (modified, directory)
+            for directory, (size, modified) in directories.items()
+            if directory not in kept and
+            now - modified >= self.WORKSPACE_GC_MIN_AGE)
+        if max_age is None and max_bytes is None:
+            reclaimed = [directory for modified, directory in candidates]
+        else:
+            reclaimed = []
+            if max_age is not None:
+                reclaimed = [directory for modified, directory in candidates
+                             if now - modified > max_age]
+            if max_bytes is not None:
+                total = sum(size for directory, (size, modified)
+                            in directories.items()
+                            if directory not in reclaimed)
+                for modified, directory in candidates:
+                    if total <= max_bytes:
+                        break
+                    if directory not in reclaimed:
+                        reclaimed.append(directory)
+                        total -= directories[directory][0]
+
+        if len(reclaimed) > 0:
+            self.log('info', 'Removing %d unused work directories',
+                     len(reclaimed))
+            self.remove_directories(reclaimed, background)
+        return reclaimed
+
+    def submit_many(self, specs, **kwargs):
+        # Submits a job for each hash of create_job() arguments in specs,
+        # several at a time over the one SSH connection. rate_limit is in
+        # submissions per second. Failures are recorded in the returned
+        # collection instead of stopping the other submissions.
+        max_concurrency = kwargs.get('max_concurrency',
+                                     self.SUBMIT_CONCURRENCY)
+        fast = kwargs.get('fast', True)
+        bucket = None
+        if kwargs.get('rate_limit'):
+            bucket = TokenBucket(kwargs['rate_limit'],
+                                 kwargs.get('burst', 1))
+
+        if not self.daemon_socket:
+            self.connect()
+        if not fast:
+            self.ensure_workspace_exists()
+        collection = self.create_job_collection()
+        pending = []
+        for spec in specs:
+            try:
+                job = ClusterJob(cluster_account=self, **spec)
+                pending.append(job)
+            except Exception as e:
+                # Recorded against a blank job that is never submitted
+                self.log('info', 'Job creation failed: %s', e)
+                job = ClusterJob(cluster_account=self, text='')
+                collection.add_error(job, e)
+            collection.add(job)
+
+        def submit(job):
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                job.submit(fast=fast)
+            except Exception as e:
+                self.log('info', 'Job submission failed: %s', e)
+                collection.add_error(job, e)
+
+        self.log('info', 'Submitting %d jobs ...', len(pending))
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            list(executor.map(submit, pending))
+
+        return collection
+
+    def create_job_collection(self, jobs=None, **kwargs):
+        return ClusterJobCollection(self, jobs, **kwargs)
@@ -1,9 +1,21 @@
 from datetime import datetime
+import codecs
+import hashlib
+import io
+import os
 import string
+import tempfile
+import time
 import random
-import base64
 import re
 from .has_a_logger import HasALogger
+from .remote_transfer import BufferReader
+
+try:
+    # Only needed for staging arrays
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
 
 
 class ClusterJob(HasALogger):
@@ -11,16 +23,12 @@ class ClusterJob(HasALogger):
     DIRECTORY_RANDOM_CHARACTERS = 20
     DEFAULT_SUBMIT_SCRIPT_NAME = 'job_submit.sh'
     SUBMIT_JOBID_REGEX = r"Submitted batch job (\d+)"
-    ALLOWED_JOB_PARAMS = ['account', 'time', 'mem', 'pmem']
-    SEFF_FIELD_MAP = {
-        'State': 'state',
-        'CPU Utilized': 'cpu_utilized',
-        'CPU Efficiency': 'cpu_efficiency',
-        'Memory Utilized': 'memory_utilized',
-        'Memory Efficiency': 'memory_efficiency',
-        'Job Wall-clock time': 'walltime'
-    }
-    SEFF_EXIT_CODE_REGEX = r"COMPLETED \(exit code (\d+)\)"
+    FAST_SUBMIT_DIRECTORY_REGEX = r"^directory=(.+)$"
+    ALLOWED_JOB_PARAMS = ['account', 'time', 'mem', 'pmem', 'array']
+    ARRAY_RANGE_REGEX = r"^(\d+)(?:-(\d+)(?::(\d+))?)?$"
+    OUTPUT_POLL_SECONDS = 10.0
+    # Fetched arrays bigger than this are memory-mapped
+    ARRAY_MMAP_BYTES = 64 * 1024 * 1024
 
     def __init__(self, **kwargs):
         self.cluster_account = kwargs['cluster_account']
@@ -34,8 +42,15 @@ class ClusterJob(HasALogger):
         self.work_directory = None
         self.submit_script_path = None
         self.jobid = None
-        self.init_logging(log_level=kwargs.get('log_level',
-                                               self.cluster_account.log_level))
+        # Hash of filename => contents, uploaded to the work directory
+        # before the job is submitted
+        self.inputs = dict(kwargs.get('inputs') or {})
+        # Set when the job can be reused by later identical submissions
+        self.memo_key = None
+        self.output_offset = 0
+        self.output_decoder = self.new_output_decoder()
+        self.init_logging(**dict(self.cluster_account.logging_options(),
+                                 **kwargs))
 
     def make_new_work_directory(self):
         self.cluster_account.ensure_workspace_exists()
@@ -85,35 +100,116 @@ class ClusterJob(HasALogger):
         script += self.text
         return script
 
-    def b64file(self, contents):
-        return base64.b64encode(bytes(contents, 'ascii')).decode('ascii')
-
     def get_default_accounting_group():
         # E.g., sacctmgr list account where user=cwant withassoc -p
         raise ValueError('TODO: Not Implemented')
 
-    def create_remote_file(self, filename, contents):
+    def create_remote_file(self, filename, contents, compress=None):
         if not self.work_directory:
             self.make_new_work_directory()
         self.log('info', 'Creating remote file %s ...' % filename)
         file_path = self.work_directory + '/' + filename
-        command = 'echo %s | base64 --decode > %s' % (self.b64file(contents),
-                                                      file_path)
-        if not self.cluster_account.simple_exec(command):
-            raise ValueError('Could not create file')
+        try:
+            self.cluster_account.upload_file(file_path, contents, compress)
+        except ValueError as e:
+            raise ValueError('Could not create file') from e
         self.log('info', 'File %s created' % file_path)
         return file_path
 
+    def array_filename(self, name):
+        if name.endswith('.npy'):
+            return name
+        return name + '.npy'
+
+    def upload_array(self, name, array, compress=None):
+        # Stages array in the work directory as name.npy, sent straight from
+        # the array's buffer
+        if numpy is None:
+            raise ValueError('numpy is needed to upload arrays')
+        array = numpy.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise ValueError("Arrays of objects can't be uploaded")
+        header = io.BytesIO()
+        numpy.lib.format.write_array_header_1_0(
+            header, numpy.lib.format.header_data_from_array_1_0(array))
+        # As raw bytes, since the buffer protocol can't export some dtypes
+        # (datetime64, timedelta64, ...)
+        data = array.reshape(-1).view(numpy.uint8).data
+        contents = BufferReader([header.getvalue(), data])
+        return self.create_remote_file(self.array_filename(name), contents,
+                                       compress)
+
+    def fetch_array(self, name, **kwargs):
+        # Loads name.npy from the work directory. Large arrays (or any, with
+        # mmap=True) are memory-mapped from a local copy, which is kept in
+        # directory if given.
+        if numpy is None:
+            raise ValueError('numpy is needed to fetch arrays')
+        path = '{}/{}'.format(self.work_directory, self.array_filename(name))
+        directory = kwargs.get('directory')
+        fd, local_path = tempfile.mkstemp(suffix='.npy', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as local_file:
+                size = self.cluster_account.download_file(
+                    path, local_file, kwargs.get('compress'))
+        except Exception:
+            os.remove(local_path)
+            raise
+
+        mmap = kwargs.get('mmap')
+        if mmap is None:
+            mmap = size > self.ARRAY_MMAP_BYTES
+        if not mmap:
+            try:
+                return numpy.load(local_path)
+            finally:
+                os.remove(local_path)
+
+        array = numpy.load(local_path, mmap_mode='r')
+        if directory is None and os.name == 'posix':
+            # The mapping stays valid after the file is unlinked
+            os.remove(local_path)
+        return array
+
+    def input_data(self, name):
+        # Inputs are read into memory once, to be hashed and uploaded
+        contents = self.inputs[name]
+        if hasattr(contents, 'read'):
+            contents = contents.read()
+        if isinstance(contents, str):
+            contents = contents.encode('utf-8')
+        self.inputs[name] = bytes(contents)
+        return self.inputs[name]
+
+    def content_hash(self):
+        # Identifies what the job computes: its submit script and inputs
+        digest = hashlib.sha256(
+            self.construct_submit_file_contents().encode('utf-8'))
+        for name in sorted(self.inputs):
+            digest.update(b'\0' + name.encode('utf-8') + b'\0')
+            digest.update(hashlib.sha256(self.input_data(name)).digest())
+        return digest.hexdigest()
+
+    def stage_inputs(self):
+        for name in sorted(self.inputs):
+            self.create_remote_file(name, self.input_data(name))
+
     def construct_submit_script(self):
         contents = self.construct_submit_file_contents()
         self.submit_script_path = \
             self.create_remote_file(self.submit_script_name, contents)
         return True
 
-    def submit(self):
+    def submit(self, **kwargs):
         if self.status()['status'] != 'not_submitted':
             raise ValueError('Job has already been submitted!')
 
+        if len(self.inputs) > 0:
+            self.stage_inputs()
+
+        if kwargs.get('fast', self.cluster_account.fast_submit):
+            return self.fast_submit()
+
         if not self.submit_script_path:
             self.construct_submit_script()
 
@@ -126,18 +222,97 @@ class ClusterJob(HasALogger):
         if m is None:
             raise ValueError('Job did not submit right')
         self.jobid = m.groups()[0]
+        self.cluster_account.job_submitted(self)
+
+        self.log('info', out)
+
+        return True
+
+    def fast_submit_command(self):
+        if self.work_directory:
+            directory_command = 'cd ' + self.work_directory
+        else:
+            # mktemp creates a unique directory atomically, no need to check
+            # for collisions first
+            template = 'cluster_job_' + 'X' * self.DIRECTORY_RANDOM_CHARACTERS
+            directory_command = 'cd %s && d=$(mktemp -d %s) && cd "$d"' % \
+                (self.cluster_account.workspace, template)
+        return ' && '.join([directory_command,
+                            'cat > ' + self.submit_script_name,
+                            'echo "directory=$PWD"',
+                            'sbatch ' + self.submit_script_name])
+
+    def fast_submit(self):
+        # Creates the work directory, writes the submit script (sent on
+        # stdin) and runs sbatch, all in one remote command
+        contents = self.construct_submit_file_contents()
+
+        self.log('info', 'Submitting job ...')
+        command = self.fast_submit_command()
+        stdin, stdout, stderr = self.cluster_account.exec_command(
+            command, 'sbatch', direct=True)
+        stdin.write(contents.encode('utf-8'))
+        stdin.flush()
+        stdin.channel.shutdown_write()
+        out = stdout.read().decode('utf-8', errors='replace')
+
+        m = re.search(self.FAST_SUBMIT_DIRECTORY_REGEX, out, re.MULTILINE)
+        if m is None:
+            raise ValueError("Couldn't create work directory")
+        self.work_directory = m.groups()[0]
+        self.submit_script_path = \
+            self.work_directory + '/' + self.submit_script_name
+        self.cluster_account.workspace_verified = True
+
+        m = re.search(self.SUBMIT_JOBID_REGEX, out)
+        if m is None:
+            raise ValueError('Job did not submit right')
+        self.jobid = m.groups()[0]
+        self.cluster_account.job_submitted(self)
 
         self.log('info', out)
 
         return True
 
+    def is_array(self):
+        return self.job_params.get('array') is not None
+
+    def task_ids(self):
+        # Task ids from an --array spec like "1,3,10-20:2%4"
+        if not self.is_array():
+            return []
+        spec = str(self.job_params['array']).split('%')[0]
+        task_ids = []
+        for part in spec.split(','):
+            m = re.match(self.ARRAY_RANGE_REGEX, part.strip())
+            if m is None:
+                raise ValueError('Bad array spec ' + spec)
+            first, last, step = m.groups()
+            last = last or first
+            for task_id in range(int(first), int(last) + 1, int(step or 1)):
+                task_ids.append(str(task_id))
+        return task_ids
+
+    def task_jobid(self, task_id):
+        return '{}_{}'.format(self.jobid, task_id)
+
     def status(self):
         if self.jobid is None:
             return {'status': 'not_submitted'}
-        stat = {'jobid': self.jobid}
+        return self.status_from_queue_statuses(self.queue_status_hashes())
+
+    def status_from_queue_statuses(self, queue_statuses):
+        # queue_statuses is a hash of jobid => squeue fields, which may
+        # contain other jobs
+        if self.is_array():
+            return self.array_status(self.task_statuses(queue_statuses))
+        return self.status_from_queue_status(
+            queue_statuses.get(self.jobid, {}))
+
+    def status_from_queue_status(self, queue_status, jobid=None):
+        stat = {'jobid': jobid or self.jobid}
         stat['status'] = 'submitted'
 
-        queue_status = self.queue_status_hash()
         if queue_status == {}:
             stat['status'] = 'finished'
             return stat
@@ -158,107 +333,137 @@ class ClusterJob(HasALogger):
             raise ValueError('Unknown job status ' + job_status)
         return stat
 
-    def queue_status_hash(self):
-        command = 'squeue -j ' + self.jobid + ' -o "%all"'
-        stdin, stdout, stderr = self.cluster_account.exec_command(command)
-        if stdout.channel.recv_exit_status() > 0:
-            # Probably job finished
-            return {}
-
-        out = stdout.readlines()
-        self.log('debug', 'squeue output:\n' + ''.join(out))
-        if len(out) < 2:
-            # Probably job finished
-            return {}
-
-        header = out[0].strip().split('|')
-        fields = out[1].strip().split('|')
-        output_hash = {}
-
-        # This is gross ... FEATURES field might have '|' in it
-        field_diff = len(fields) - len(header)
+    def task_statuses(self, queue_statuses=None):
+        # Hash of task id => status, for array jobs
+        if queue_statuses is None:
+            queue_statuses = self.queue_status_hashes()
+        statuses = {}
+        for task_id in self.task_ids():
+            jobid = self.task_jobid(task_id)
+            statuses[task_id] = self.status_from_queue_status(
+                queue_statuses.get(jobid, {}), jobid)
+        return statuses
+
+    def array_status(self, task_statuses):
+        stat = {'jobid': self.jobid, 'tasks': {}}
+        for task_status in task_statuses.values():
+            state = task_status['status']
+            stat['tasks'][state] = stat['tasks'].get(state, 0) + 1
+
+        total = max(len(task_statuses), 1)
+        done = [task_status.get('done', 0.0)
+                for task_status in task_statuses.values()
+                if task_status['status'] != 'finished']
+        if stat['tasks'].get('running'):
+            stat['status'] = 'running'
+            stat['done'] = (stat['tasks'].get('finished', 0) +
+                            sum(done)) / total
+        elif stat['tasks'].get('waiting'):
+            stat['status'] = 'waiting'
+            stat['done'] = max(done)
+        else:
+            stat['status'] = 'finished'
+        return stat
 
-        field_i = 0
-        for i in range(len(header)):
-            if (header[i] == 'FEATURES') and field_diff > 0:
-                # Reassemble features field
-                features_field = '|'.join(fields[field_i:
-                                                 field_i + field_diff + 1])
-                output_hash[header[i]] = features_field
-                field_i += field_diff
-            elif len(header[i]) > 0:
-                output_hash[header[i]] = fields[field_i]
+    def queue_status_hashes(self):
+        return self.cluster_account.queue_status_hashes(
+            [self.jobid], expand_arrays=self.is_array())
 
-            field_i += 1
+    def queue_status_hash(self):
+        return self.queue_status_hash_from(self.queue_status_hashes())
 
-        return output_hash
+    def queue_status_hash_from(self, queue_statuses):
+        if self.is_array():
+            # Any task in the queue represents the array
+            for task_id in self.task_ids():
+                if self.task_jobid(task_id) in queue_statuses:
+                    return queue_statuses[self.task_jobid(task_id)]
+        return queue_statuses.get(self.jobid, {})
 
     def efficiency_hash(self):
-        # TODO: consider using sacct output to create more flexible output
-        command = 'seff -j ' + self.jobid
-        stdin, stdout, stderr = self.cluster_account.exec_command(command)
-        if stdout.channel.recv_exit_status() > 0:
-            # Probably job finished
-            return {}
-
-        out = stdout.readlines()
-        self.log('debug', 'seff output:\n' + ''.join(out))
-        if len(out) < 2:
-            # Probably job finished
-            return {}
-
-        self.log('debug', out)
-
-        output_hash = {}
-        for row in out:
-            (heading, data) = row.strip().split(': ', 1)
-            if heading in self.SEFF_FIELD_MAP:
-                new_heading = self.SEFF_FIELD_MAP[heading]
-                output_hash[new_heading] = data
-
-                if new_heading == 'state':
-                    m = re.match(self.SEFF_EXIT_CODE_REGEX, data)
-                    if m is not None:
-                        output_hash['exit_code'] = m.groups()[0]
-
-                if new_heading == 'state':
-                    m = re.match(self.SEFF_EXIT_CODE_REGEX, data)
-                    if m is not None:
-                        output_hash['exit_code'] = m.groups()[0]
-
-        return output_hash
+        efficiency = self.cluster_account.efficiency_hashes([self.jobid])
+        return efficiency.get(self.jobid, {})
 
     def done_factor(self, after, before):
         if 'N/A' in (before, after):
             return 0.0
-        command = 'date --iso-8601=seconds'
-        stdin, stdout, stderr = self.cluster_account.exec_command(command)
-        out = stdout.readlines()
-        # Ensure timezone and carriage return are stripped off
-        now = out[0][:19]
         before_f = datetime.fromisoformat(before).timestamp()
         after_f = datetime.fromisoformat(after).timestamp()
-        now_f = datetime.fromisoformat(now).timestamp()
+        now_f = self.cluster_account.remote_now()
         denom = after_f - before_f
         if denom < 0.01:
             return 0.0
         return (now_f - before_f) / denom
 
-    def fetch_file(self, filename):
+    def fetch_file(self, filename, compress=None):
         path = '{}/{}'.format(self.work_directory, filename)
-        command = 'cat ' + path
-        stdin, stdout, stderr = self.cluster_account.exec_command(command)
-        if stdout.channel.recv_exit_status() > 0:
+        try:
+            data = self.cluster_account.read_file(path, compress)
+        except ValueError as e:
             raise ValueError("Error fetching, " +
-                             "probably {} doesn't exist".format(path))
-        return stdout.read().decode('ascii')
+                             "probably {} doesn't exist".format(path)) from e
+        return data.decode('utf-8', errors='replace')
+
+    def output_filename(self, task_id=None):
+        if task_id is not None:
+            return 'slurm-{}_{}.out'.format(self.jobid, task_id)
+        return 'slurm-{}.out'.format(self.jobid)
 
     def fetch_output(self):
         stat = self.status()
         if stat['status'] != 'finished':
             raise ValueError('Job is in state ' + stat['status'])
 
-        return self.fetch_file('slurm-{}.out'.format(self.jobid))
+        return self.fetch_file(self.output_filename())
+
+    def new_output_decoder(self):
+        # Incremental, so multibyte characters split across reads survive
+        return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def tail_output(self, since=0, filename=None):
+        # Returns the bytes of the output file after offset since, and the
+        # offset to pass next time. Missing files (e.g., job still waiting)
+        # give no bytes.
+        if self.jobid is None:
+            raise ValueError('Job not submitted!')
+        if filename is None:
+            filename = self.output_filename()
+        path = '{}/{}'.format(self.work_directory, filename)
+        command = 'tail -c +{} {}'.format(since + 1, path)
+        stdin, stdout, stderr = self.cluster_account.exec_command(command)
+        data = stdout.read()
+        if stdout.channel.recv_exit_status() > 0:
+            return b'', since
+        return data, since + len(data)
+
+    def new_output(self, final=False):
+        # Output text written since the last call
+        data, self.output_offset = self.tail_output(self.output_offset)
+        return self.output_decoder.decode(data, final)
+
+    def stream_output(self, since=0, **kwargs):
+        # Generator yielding output text as it is written, until the job
+        # finishes
+        poll_seconds = kwargs.get('poll_seconds', self.OUTPUT_POLL_SECONDS)
+        filename = kwargs.get('filename')
+        decoder = self.new_output_decoder()
+        offset = since
+        while True:
+            finished = self.status()['status'] == 'finished'
+            data, offset = self.tail_output(offset, filename)
+            text = decoder.decode(data, finished)
+            if len(text) > 0:
+                yield text
+            if finished:
+                return
+            time.sleep(poll_seconds)
+
+    def fetch_task_output(self, task_id):
+        stat = self.task_statuses()[str(task_id)]
+        if stat['status'] != 'finished':
+            raise ValueError('Task is in state ' + stat['status'])
+
+        return self.fetch_file(self.output_filename(task_id))
 
     def fetch_error(self):
         stat = self.status()
@@ -279,4 +484,6 @@ class ClusterJob(HasALogger):
         # TODO: check status for pending vs running?
         self.log('info', 'Cancelling job ' + self.jobid)
         command = 'scancel ' + self.jobid
-        return self.cluster_account.simple_exec(command)
+        cancelled = self.cluster_account.simple_exec(command)
+        self.cluster_account.status_cache.invalidate([self.jobid])
+        return cancelled
@@ -0,0 +1,111 @@
+import os
+import shutil
+from .has_a_logger import HasALogger
+
+
+class ClusterJobCollection(HasALogger):
+    def __init__(self, cluster_account, jobs=None, **kwargs):
+        self.cluster_account = cluster_account
+        self.jobs = list(jobs or [])
+        # job => exception, for jobs whose submission failed
+        self.errors = {}
+        self.init_logging(**dict(cluster_account.logging_options(),
+                                 **kwargs))
+
+    def __iter__(self):
+        return iter(self.jobs)
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __getitem__(self, index):
+        return self.jobs[index]
+
+    def add(self, job):
+        self.jobs.append(job)
+
+    def add_error(self, job, error):
+        self.errors[job] = error
+
+    def succeeded(self):
+        return [job for job in self.jobs
+                if job not in self.errors and job.jobid is not None]
+
+    def failed(self):
+        return [job for job in self.jobs if job in self.errors]
+
+    def jobids(self):
+        return [job.jobid for job in self.jobs if job.jobid is not None]
+
+    def queue_status_hashes(self):
+        expand_arrays = any(job.is_array() for job in self.jobs)
+        return self.cluster_account.queue_status_hashes(
+            self.jobids(), expand_arrays=expand_arrays)
+
+    def efficiency_hashes(self):
+        return self.cluster_account.efficiency_hashes(self.jobids())
+
+    def output_filenames(self, job):
+        if job.is_array():
+            return [job.output_filename(task_id)
+                    for task_id in job.task_ids()]
+        return [job.output_filename()]
+
+    def fetch_files(self, filenames=None, **kwargs):
+        # Fetches files from the work directories of the finished jobs (or
+        # all submitted jobs, with only_finished=False) in one tar stream.
+        # filenames are relative to each work directory, by default the
+        # jobs' output files. Returns a hash of jobid => hash of filename =>
+        # text for the files that exist, or with directory set, writes them
+        # to directory/jobid/filename and gives their local paths instead.
+        jobs = [job for job in self.jobs if job.work_directory]
+        if kwargs.get('only_finished', True):
+            statuses = self.statuses()
+            jobs = [job for job, stat in zip(self.jobs, statuses)
+                    if stat['status'] == 'finished' and job.work_directory]
+
+        wanted = {}
+        for job in jobs:
+            for filename in filenames or self.output_filenames(job):
+                path = '{}/{}'.format(job.work_directory, filename)
+                wanted[path] = (job.jobid, filename)
+        results = dict((job.jobid, {}) for job in jobs)
+        if len(wanted) == 0:
+            return results
+
+        directory = kwargs.get('directory')
+        transfer = self.cluster_account.remote_transfer()
+        for path, fileobj in transfer.download_tar(list(wanted),
+                                                   kwargs.get('compress')):
+            if path not in wanted:
+                continue
+            jobid, filename = wanted[path]
+            if directory is None:
+                results[jobid][filename] = \
+                    fileobj.read().decode('utf-8', errors='replace')
+                continue
+            local_path = os.path.join(directory, jobid, filename)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with open(local_path, 'wb') as local_file:
+                shutil.copyfileobj(fileobj, local_file)
+            results[jobid][filename] = local_path
+        return results
+
+    def cleanup(self, background=False):
+        # Removes the jobs' work directories with one command. With
+        # background set, returns a Future instead of waiting.
+        return self.cluster_account.remove_directories(
+            [job.work_directory for job in self.jobs if job.work_directory],
+            background)
+
+    def statuses(self):
+        # Same as calling status() on every job, but with one squeue call
+        queue_status = self.queue_status_hashes()
+
+        statuses = []
+        for job in self.jobs:
+            if job.jobid is None:
+                statuses.append(job.status())
+            else:
+                statuses.append(job.status_from_queue_statuses(queue_status))
+        return statuses
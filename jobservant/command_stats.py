@@ -0,0 +1,172 @@
+import copy
+import re
+import threading
+import time
+
+
+class InstrumentedChannel:
+    def __init__(self, channel, command):
+        self.channel = channel
+        self.command = command
+
+    def __getattr__(self, name):
+        return getattr(self.channel, name)
+
+    def recv_exit_status(self):
+        code = self.channel.recv_exit_status()
+        self.command.finish(code)
+        return code
+
+
+class InstrumentedStream:
+    # Counts the bytes going through one of a command's stdin, stdout or
+    # stderr. The command is finished when its stdout runs out.
+    def __init__(self, stream, command, output=False):
+        self.stream = stream
+        self.command = command
+        self.output = output
+        self.channel = command.channel
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def received(self, data, ended):
+        self.command.add_bytes(0, len(data))
+        if self.output and ended:
+            self.command.output_ended()
+        return data
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        return self.received(data, size is None or size < 0 or not data)
+
+    def readline(self, *args):
+        line = self.stream.readline(*args)
+        return self.received(line, not line)
+
+    def readlines(self, *args):
+        lines = self.stream.readlines(*args)
+        self.received(''.join(lines), True)
+        return lines
+
+    def __iter__(self):
+        return iter(self.readlines())
+
+    def write(self, data):
+        self.command.add_bytes(len(data), 0)
+        return self.stream.write(data)
+
+
+class InstrumentedCommand:
+    def __init__(self, stats, kind, channel, bytes_out):
+        self.stats = stats
+        self.kind = kind
+        self.channel = InstrumentedChannel(channel, self)
+        self.started_at = time.monotonic()
+        self.finished = False
+        self.exit_code = None
+        self.stats.start(kind, bytes_out)
+
+    def add_bytes(self, bytes_out, bytes_in):
+        self.stats.add_bytes(self.kind, bytes_out, bytes_in)
+
+    def output_ended(self):
+        code = None
+        if self.channel.channel.exit_status_ready():
+            code = self.channel.channel.recv_exit_status()
+        self.finish(code)
+
+    def finish(self, code=None):
+        if not self.finished:
+            self.finished = True
+            self.stats.add_latency(self.kind,
+                                   time.monotonic() - self.started_at)
+        if code is not None and self.exit_code is None:
+            self.exit_code = code
+            self.stats.add_exit_code(self.kind, code)
+
+
+class CommandStats:
+    # Per kind of remote command (squeue, sbatch, ...): how many ran, bytes
+    # sent and received, exit codes, and a histogram of latencies (seconds
+    # from running the command to the end of its output)
+    LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                       10.0, 30.0, 60.0]
+    SKIPPED_COMMANDS = ['cd']
+    ASSIGNMENT_REGEX = r"^\w+="
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.kinds = {}
+
+    @classmethod
+    def command_kind(cls, command):
+        # The first program run, past any cd's and variable assignments
+        words = []
+        for segment in command.split('&&'):
+            words = segment.split()
+            if len(words) > 0 and words[0] not in cls.SKIPPED_COMMANDS and \
+               re.match(cls.ASSIGNMENT_REGEX, words[0]) is None:
+                break
+        return words[0] if len(words) > 0 else ''
+
+    def instrument(self, streams, kind, bytes_out):
+        stdin, stdout, stderr = streams
+        command = InstrumentedCommand(self, kind, stdout.channel, bytes_out)
+        return (InstrumentedStream(stdin, command),
+                InstrumentedStream(stdout, command, output=True),
+                InstrumentedStream(stderr, command))
+
+    def kind_stats(self, kind):
+        if kind not in self.kinds:
+            self.kinds[kind] = {
+                'count': 0, 'bytes_out': 0, 'bytes_in': 0, 'exit_codes': {},
+                'seconds': 0.0, 'max_seconds': 0.0,
+                'histogram': [0] * (len(self.LATENCY_BUCKETS) + 1)
+            }
+        return self.kinds[kind]
+
+    def start(self, kind, bytes_out):
+        with self.lock:
+            stats = self.kind_stats(kind)
+            stats['count'] += 1
+            stats['bytes_out'] += bytes_out
+
+    def add_bytes(self, kind, bytes_out, bytes_in):
+        with self.lock:
+            stats = self.kind_stats(kind)
+            stats['bytes_out'] += bytes_out
+            stats['bytes_in'] += bytes_in
+
+    def add_latency(self, kind, seconds):
+        bucket = len(self.LATENCY_BUCKETS)
+        for i, bound in enumerate(self.LATENCY_BUCKETS):
+            if seconds <= bound:
+                bucket = i
+                break
+        with self.lock:
+            stats = self.kind_stats(kind)
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['histogram'][bucket] += 1
+
+    def add_exit_code(self, kind, code):
+        with self.lock:
+            exit_codes = self.kind_stats(kind)['exit_codes']
+            exit_codes[code] = exit_codes.get(code, 0) + 1
+
+    def stats(self):
+        # Returns a hash of kind => stats. The histogram is a list of
+        # (upper bound in seconds, count) pairs.
+        with self.lock:
+            kinds = copy.deepcopy(self.kinds)
+        bounds = self.LATENCY_BUCKETS + [float('inf')]
+        for stats in kinds.values():
+            timed = sum(stats['histogram'])
+            stats['mean_seconds'] = stats['seconds'] / timed if timed else 0.0
+            stats['histogram'] = list(zip(bounds, stats['histogram']))
+        return kinds
+
+    def reset(self):
+        with self.lock:
+            self.kinds = {}
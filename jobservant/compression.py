@@ -0,0 +1,56 @@
+import zlib
+
+try:
+    # Only needed for zstd compression
+    import zstandard
+except ModuleNotFoundError:
+    zstandard = None
+
+
+class GzipCodec:
+    NAME = 'gzip'
+    COMPRESS_COMMAND = 'gzip -c'
+    DECOMPRESS_COMMAND = 'gzip -dc'
+    # gzip wrapper for zlib
+    WBITS = 31
+
+    def compressor(self):
+        return zlib.compressobj(wbits=self.WBITS)
+
+    def decompressor(self):
+        return zlib.decompressobj(wbits=self.WBITS)
+
+
+class ZstdDecompressor:
+    # zstandard's decompressobj() has no flush() in older versions
+    def __init__(self):
+        self.decompressobj = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data):
+        return self.decompressobj.decompress(data)
+
+    def flush(self):
+        return b''
+
+
+class ZstdCodec:
+    NAME = 'zstd'
+    COMPRESS_COMMAND = 'zstd -c -q'
+    DECOMPRESS_COMMAND = 'zstd -dc -q'
+
+    def compressor(self):
+        return zstandard.ZstdCompressor().compressobj()
+
+    def decompressor(self):
+        return ZstdDecompressor()
+
+
+CODECS = {'gzip': GzipCodec, 'zstd': ZstdCodec}
+
+
+def codec(name):
+    if name not in CODECS:
+        raise ValueError('Unknown compression ' + str(name))
+    if name == 'zstd' and zstandard is None:
+        raise ValueError('zstd compression needs the zstandard package')
+    return CODECS[name]()
@@ -0,0 +1,169 @@
+import socket
+import threading
+import time
+import paramiko
+from .has_a_logger import HasALogger
+
+
+class ConnectionPool(HasALogger):
+    # A few SSH connections to one cluster, each limited to max_sessions open
+    # channels (OpenSSH's MaxSessions defaults to 10). Connections get
+    # keepalives and are transparently re-established if they drop.
+    OPTIONS = ['pool_size', 'max_sessions', 'keepalive', 'reconnect_retries',
+               'reconnect_backoff', 'client_factory']
+    POOL_SIZE = 2
+    MAX_SESSIONS = 8
+    KEEPALIVE = 30
+    RECONNECT_RETRIES = 5
+    RECONNECT_BACKOFF = 1.0
+    SESSION_WAIT = 0.05
+    CONNECTION_ERRORS = (paramiko.SSHException, EOFError, socket.error)
+
+    def __init__(self, cluster_account, **kwargs):
+        self.cluster_account = cluster_account
+        self.size = kwargs.get('pool_size', self.POOL_SIZE)
+        self.max_sessions = kwargs.get('max_sessions', self.MAX_SESSIONS)
+        self.keepalive = kwargs.get('keepalive', self.KEEPALIVE)
+        self.reconnect_retries = kwargs.get('reconnect_retries',
+                                            self.RECONNECT_RETRIES)
+        self.reconnect_backoff = kwargs.get('reconnect_backoff',
+                                            self.RECONNECT_BACKOFF)
+        self.client_factory = kwargs.get('client_factory', paramiko.SSHClient)
+
+        self.clients = [None] * self.size
+        # Open channels, channels being opened and the session limit for
+        # each connection
+        self.channels = [[] for i in range(self.size)]
+        self.reserved = [0] * self.size
+        self.session_limits = [self.max_sessions] * self.size
+        self.condition = threading.Condition()
+        self.connect_locks = [threading.Lock() for i in range(self.size)]
+        self.init_logging(**dict(cluster_account.logging_options(),
+                                 **kwargs))
+
+    def new_client(self):
+        self.log('info', 'Connecting to %s@%s', self.cluster_account.username,
+                 self.cluster_account.server)
+        client = self.client_factory()
+        client.load_system_host_keys()
+        client.connect(self.cluster_account.server,
+                       username=self.cluster_account.username)
+        if self.keepalive:
+            client.get_transport().set_keepalive(self.keepalive)
+        return client
+
+    def is_alive(self, client):
+        if client is None:
+            return False
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def connect_with_backoff(self):
+        delay = self.reconnect_backoff
+        for attempt in range(self.reconnect_retries):
+            try:
+                return self.new_client()
+            except self.CONNECTION_ERRORS as e:
+                if attempt == self.reconnect_retries - 1:
+                    raise
+                self.log('info', 'Connection failed (%s), retrying in %.1fs',
+                         e, delay)
+                time.sleep(delay)
+                delay *= 2
+
+    def client(self, index=0):
+        # Connected client, reconnecting if the connection has dropped
+        with self.connect_locks[index]:
+            client = self.clients[index]
+            if not self.is_alive(client):
+                if client is not None:
+                    self.log('info', 'Connection lost, reconnecting ...')
+                    self.reset(index)
+                self.clients[index] = self.connect_with_backoff()
+            return self.clients[index]
+
+    def reset(self, index):
+        with self.condition:
+            client = self.clients[index]
+            self.clients[index] = None
+            self.channels[index] = []
+            self.session_limits[index] = self.max_sessions
+        if client is not None:
+            client.close()
+
+    def open_sessions(self, index):
+        # you are holding the condition
+        self.channels[index] = [channel for channel in self.channels[index]
+                                if not channel.closed]
+        return len(self.channels[index]) + self.reserved[index]
+
+    def acquire_session(self):
+        # Index of a connection with a free session, waiting for one if
+        # all connections are at their limit
+        with self.condition:
+            while True:
+                for index in range(self.size):
+                    if self.open_sessions(index) < \
+                       self.session_limits[index]:
+                        self.reserved[index] += 1
+                        return index
+                # Channels don't announce that they are closed, so poll
+                self.condition.wait(self.SESSION_WAIT)
+
+    def release_session(self, index, channel=None):
+        with self.condition:
+            self.reserved[index] -= 1
+            if channel is not None:
+                self.channels[index].append(channel)
+            self.condition.notify()
+
+    def open_channel(self, opener):
+        # Runs opener(client) with a session slot, returning its result and
+        # the channel it opened
+        delay = self.reconnect_backoff
+        for attempt in range(self.reconnect_retries):
+            index = self.acquire_session()
+            channel = None
+            try:
+                result, channel = self.open_on(index, opener)
+                return result
+            except paramiko.ChannelException as e:
+                if attempt == self.reconnect_retries - 1:
+                    raise
+                # The server refused a new session, so this connection is at
+                # the server's MaxSessions
+                with self.condition:
+                    self.session_limits[index] = \
+                        max(1, len(self.channels[index]))
+                self.log('debug', 'Session refused (%s), limit now %d', e,
+                         self.session_limits[index])
+            finally:
+                self.release_session(index, channel)
+            time.sleep(delay)
+            delay *= 2
+
+    def open_on(self, index, opener):
+        try:
+            return opener(self.client(index))
+        except paramiko.ChannelException:
+            raise
+        except self.CONNECTION_ERRORS:
+            # Dropped connection, try again once on a fresh one
+            self.reset(index)
+            return opener(self.client(index))
+
+    def exec_command(self, command):
+        def opener(client):
+            streams = client.exec_command(command)
+            return streams, streams[1].channel
+        return self.open_channel(opener)
+
+    def open_sftp(self):
+        def opener(client):
+            sftp = client.open_sftp()
+            return sftp, sftp.get_channel()
+        return self.open_channel(opener)
+
+    def close(self):
+        for index in range(self.size):
+            self.reset(index)
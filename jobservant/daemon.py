@@ -0,0 +1,231 @@
+import argparse
+import base64
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from .cluster_account import ClusterAccount
+from .cluster_job import ClusterJob
+from .daemon_client import DEFAULT_SOCKET
+from .has_a_logger import HasALogger
+
+
+class SharedClusterAccount(ClusterAccount):
+    # The daemon's account for one cluster. Every squeue is for all of the
+    # user's jobs and its result is shared by all clients (and the polling
+    # scheduler) for snapshot_ttl seconds, so the squeue load depends on the
+    # number of clusters rather than the number of clients.
+    def __init__(self, server, **kwargs):
+        super().__init__(server, **dict(kwargs, status_cache_ttl=0))
+        self.snapshot_ttl = kwargs.get('status_cache_ttl',
+                                       self.STATUS_CACHE_TTL)
+        self.snapshot_lock = threading.Lock()
+        self.snapshot_at = None
+        self.snapshot = {}
+        # Jobids the snapshot answers for: those in it and those asked about
+        # when it was taken. Anything else (a job just submitted) needs a
+        # fresh snapshot.
+        self.snapshot_jobids = set()
+
+    def query_queue_status_hashes(self, jobids, expand_arrays=False):
+        with self.snapshot_lock:
+            now = time.monotonic()
+            if self.snapshot_at is None or \
+               now - self.snapshot_at >= self.snapshot_ttl or \
+               not self.snapshot_jobids.issuperset(jobids):
+                self.snapshot = self.queue_records(None, expand_arrays=True)
+                self.snapshot_at = now
+                self.snapshot_jobids = set(
+                    jobid.split('_')[0] for jobid in self.snapshot)
+                self.snapshot_jobids.update(jobids)
+            wanted = set(jobids)
+            return dict((jobid, record)
+                        for jobid, record in self.snapshot.items()
+                        if jobid.split('_')[0] in wanted)
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    # One client connection. Each request is served on a thread of its own,
+    # so a slow command doesn't hold up the client's other requests.
+    def handle(self):
+        self.write_lock = threading.Lock()
+        self.watches = {}
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                continue
+            thread = threading.Thread(target=self.serve, args=(request,))
+            thread.daemon = True
+            thread.start()
+        for watch in list(self.watches.values()):
+            self.server.service.unwatch(watch)
+
+    def send(self, message):
+        with self.write_lock:
+            try:
+                self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+                self.wfile.flush()
+            except (OSError, ValueError):
+                # The client is gone
+                pass
+
+    def serve(self, request):
+        try:
+            result = self.server.service.serve(request, self)
+            self.send({'id': request.get('id'), 'result': result})
+        except Exception as e:
+            self.send({'id': request.get('id'), 'error': str(e)})
+
+
+class DaemonServer(socketserver.ThreadingMixIn,
+                   socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class JobservantDaemon(HasALogger):
+    # Owns the SSH connections, the squeue results and the polling scheduler
+    # of each cluster its clients use, and serves them on a Unix socket.
+    # ClusterAccounts created with daemon_socket set are its clients.
+    def __init__(self, path=None, **kwargs):
+        self.path = os.path.expanduser(path or DEFAULT_SOCKET)
+        # Passed on to each cluster's SharedClusterAccount
+        self.account_options = kwargs.get('account_options', {})
+        self.accounts = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.init_logging(**kwargs)
+
+    def account(self, cluster):
+        key = (cluster['server'], cluster['username'])
+        with self.lock:
+            if key not in self.accounts:
+                self.log('info', 'Serving %s@%s', key[1], key[0])
+                options = dict(self.logging_options(), **self.account_options)
+                self.accounts[key] = SharedClusterAccount(
+                    cluster['server'], username=cluster['username'],
+                    **options)
+            return self.accounts[key]
+
+    def serve(self, request, handler):
+        account = self.account(request['cluster'])
+        method = request.get('method')
+        if method == 'exec':
+            return self.exec_command(
+                account, request['command'],
+                base64.b64decode(request.get('stdin', '')))
+        if method == 'queue_status_hashes':
+            records = account.queue_status_hashes(
+                request['jobids'], request.get('expand_arrays', False))
+            return dict((jobid, record.to_hash())
+                        for jobid, record in records.items())
+        if method == 'watch':
+            self.watch(account, request, handler)
+            return True
+        if method == 'unwatch':
+            watch = handler.watches.pop(request['watch'], None)
+            if watch is not None:
+                self.unwatch(watch)
+            return True
+        raise ValueError('Unknown method %s' % method)
+
+    def exec_command(self, account, command, data=b''):
+        stdin, stdout, stderr = account.exec_command(
+            command, direct=len(data) > 0)
+        if len(data) > 0:
+            stdin.write(data)
+            stdin.flush()
+            stdin.channel.shutdown_write()
+        out = stdout.read()
+        err = stderr.read()
+        code = stdout.channel.recv_exit_status()
+        return [code, base64.b64encode(out).decode('ascii'),
+                base64.b64encode(err).decode('ascii')]
+
+    def watch(self, account, request, handler):
+        job = ClusterJob(cluster_account=account, text='',
+                         **request.get('job_params', {}))
+        job.jobid = request['jobid']
+        watch_id = request['watch']
+
+        def callback(status):
+            handler.send({'watch': watch_id, 'status': status})
+            if status['status'] == 'finished':
+                handler.watches.pop(watch_id, None)
+
+        handler.watches[watch_id] = account.watch(job, callback)
+
+    def unwatch(self, watch):
+        watch['active'] = False
+
+    def listen(self):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.server = DaemonServer(self.path, DaemonRequestHandler)
+        self.server.service = self
+        os.chmod(self.path, 0o600)
+        self.log('info', 'Listening on %s', self.path)
+
+    def start(self):
+        # Serves from a background thread
+        self.listen()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def serve_forever(self):
+        # Serves until interrupted or terminated
+        self.listen()
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            self.server.serve_forever()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        self.stop()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        with self.lock:
+            accounts = list(self.accounts.values())
+            self.accounts = {}
+        for account in accounts:
+            if account.scheduler is not None:
+                account.scheduler.stop()
+            if account.pool is not None:
+                account.pool.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m jobservant.daemon',
+        description='Shares SSH connections, squeue results and job '
+        'polling between the jobservant clients of each cluster.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET,
+                        help='Unix socket to listen on (default %(default)s)')
+    parser.add_argument('--status-cache-ttl', type=float,
+                        default=ClusterAccount.STATUS_CACHE_TTL,
+                        help='Seconds squeue results are shared')
+    parser.add_argument('--agent', action='store_true',
+                        help='Run commands through a remote agent')
+    parser.add_argument('--log-level', default='info',
+                        choices=HasALogger.LOG_LEVELS)
+    arguments = parser.parse_args(argv)
+    daemon = JobservantDaemon(
+        arguments.socket, log_level=arguments.log_level,
+        account_options={'status_cache_ttl': arguments.status_cache_ttl,
+                         'agent': arguments.agent})
+    daemon.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
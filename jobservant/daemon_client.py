@@ -0,0 +1,221 @@
+import base64
+import json
+import os
+import socket
+import threading
+from concurrent.futures import Future
+from .has_a_logger import HasALogger
+from .remote_agent import AgentChannel, AgentStream
+
+
+DEFAULT_SOCKET = os.path.join('~', '.jobservant', 'daemon.sock')
+
+
+class DaemonUnavailable(ValueError):
+    # The daemon couldn't be reached, as opposed to a command it ran failing
+    pass
+
+
+class DaemonChannel(AgentChannel):
+    # Stands in for the channel of a command run by the daemon. Input written
+    # to the command goes with it, once the writing side is shut down or the
+    # output is wanted.
+    def __init__(self, client, command):
+        super().__init__(Future())
+        self.client = client
+        self.command = command
+        self.input = []
+        self.sent = False
+
+    def shutdown_write(self):
+        if not self.sent:
+            self.sent = True
+            self.client.send_command(self.command, b''.join(self.input),
+                                     self.future)
+
+    def result(self):
+        self.shutdown_write()
+        return super().result()
+
+    def exit_status_ready(self):
+        return self.sent and self.future.done()
+
+
+class DaemonStdin:
+    def __init__(self, channel):
+        self.channel = channel
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.channel.input.append(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class DaemonClient(HasALogger):
+    # A ClusterAccount's connection to the local jobservant daemon (see
+    # jobservant.daemon), which runs its commands and squeue queries over
+    # SSH connections shared with every other client of the same cluster.
+    # Requests and replies are JSON lines, and many can be in flight at once.
+    def __init__(self, cluster_account, path=None, **kwargs):
+        self.cluster_account = cluster_account
+        self.path = os.path.expanduser(path or DEFAULT_SOCKET)
+        self.lock = threading.Lock()
+        self.socket = None
+        self.next_id = 0
+        # Request id => Future of the reply's result
+        self.pending = {}
+        # Watch id => callback(status)
+        self.watches = {}
+        self.init_logging(**dict(cluster_account.logging_options(),
+                                 **kwargs))
+
+    def cluster(self):
+        return {'server': self.cluster_account.server,
+                'username': self.cluster_account.username}
+
+    def connect(self):
+        # you are holding the lock
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(self.path)
+        except OSError as e:
+            connection.close()
+            raise DaemonUnavailable('No jobservant daemon at %s: %s' %
+                                    (self.path, e)) from e
+        self.socket = connection
+        thread = threading.Thread(target=self.read_messages,
+                                  args=(connection,))
+        thread.daemon = True
+        thread.start()
+
+    def read_messages(self, connection):
+        try:
+            for line in connection.makefile('rb'):
+                message = json.loads(line.decode('utf-8'))
+                if 'watch' in message:
+                    self.watch_event(message['watch'], message['status'])
+                    continue
+                with self.lock:
+                    future = self.pending.pop(message['id'], None)
+                if future is None:
+                    continue
+                if 'error' in message:
+                    future.set_exception(ValueError(message['error']))
+                else:
+                    future.set_result(message['result'])
+        except Exception as e:
+            self.log('info', 'Lost the jobservant daemon: %s', e)
+        self.disconnected(connection)
+
+    def disconnected(self, connection):
+        with self.lock:
+            if self.socket is connection:
+                self.socket = None
+            pending = list(self.pending.values())
+            self.pending = {}
+        connection.close()
+        for future in pending:
+            future.set_exception(
+                DaemonUnavailable('Lost the jobservant daemon'))
+
+    def watch_event(self, watch_id, status):
+        with self.lock:
+            callback = self.watches.get(watch_id)
+            if status['status'] == 'finished':
+                self.watches.pop(watch_id, None)
+        if callback is None:
+            return
+        try:
+            callback(status)
+        except Exception as e:
+            self.log('info', 'Watch callback failed: %s', e)
+
+    def submit(self, method, **params):
+        # Sends a request, returning a Future of its result
+        future = Future()
+        with self.lock:
+            if self.socket is None:
+                self.connect()
+            self.next_id += 1
+            self.pending[self.next_id] = future
+            request = dict(params, id=self.next_id, method=method,
+                           cluster=self.cluster())
+            try:
+                self.socket.sendall(json.dumps(request).encode('utf-8') +
+                                    b'\n')
+            except OSError as e:
+                del self.pending[self.next_id]
+                raise DaemonUnavailable('Lost the jobservant daemon') from e
+        return future
+
+    def call(self, method, **params):
+        return self.submit(method, **params).result()
+
+    def exec_command(self, command):
+        # Same as ClusterAccount.exec_command(): the (stdin, stdout, stderr)
+        # it returns can be used the same way, except that output only comes
+        # once the command has finished
+        with self.lock:
+            if self.socket is None:
+                self.connect()
+        channel = DaemonChannel(self, command)
+        return DaemonStdin(channel), AgentStream(channel, 1), \
+            AgentStream(channel, 2)
+
+    def send_command(self, command, data, result):
+        def decode(future):
+            try:
+                code, out, err = future.result()
+                result.set_result((code, base64.b64decode(out),
+                                   base64.b64decode(err)))
+            except Exception as e:
+                result.set_exception(e)
+
+        try:
+            self.submit('exec', command=command,
+                        stdin=base64.b64encode(data).decode('ascii')
+                        ).add_done_callback(decode)
+        except ValueError as e:
+            result.set_exception(e)
+
+    def queue_status_hashes(self, jobids, expand_arrays=False):
+        return self.call('queue_status_hashes', jobids=list(jobids),
+                         expand_arrays=expand_arrays)
+
+    def watch(self, cluster_job, callback):
+        # The daemon's polling scheduler checks the job, calling
+        # callback(status) here until it is finished
+        with self.lock:
+            self.next_id += 1
+            watch_id = self.next_id
+            self.watches[watch_id] = callback
+        try:
+            self.call('watch', watch=watch_id, jobid=cluster_job.jobid,
+                      job_params=cluster_job.job_params)
+        except ValueError:
+            with self.lock:
+                self.watches.pop(watch_id, None)
+            raise
+        return {'watch': watch_id}
+
+    def unwatch(self, watch):
+        with self.lock:
+            self.watches.pop(watch['watch'], None)
+        self.call('unwatch', watch=watch['watch'])
+
+    def close(self):
+        with self.lock:
+            connection = self.socket
+            self.socket = None
+        if connection is not None:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
@@ -1,16 +1,48 @@
+import logging
+
+
 class HasALogger:
+    LOG_LEVELS = ['none', 'info', 'debug']
+    LOGGING_LEVELS = {'info': logging.INFO, 'debug': logging.DEBUG}
+
     def init_logging(self, **kwargs):
         self.log_level = kwargs.get('log_level', 'info')
-        if self.log_level not in ['none', 'info', 'debug']:
+        if self.log_level not in self.LOG_LEVELS:
             raise ValueError('Bad log_level')
+        # A logging.Logger (or the name of one) to send messages to, instead
+        # of printing them
+        self.logger = kwargs.get('logger')
+        if isinstance(self.logger, str):
+            self.logger = logging.getLogger(self.logger)
+
+    def logging_options(self):
+        # For passing this object's logging settings on to the objects it
+        # creates
+        return {'log_level': self.log_level, 'logger': self.logger}
 
-    def log(self, level, message):
+    def log_enabled(self, level):
         if self.log_level == 'none':
-            return
+            return False
         if self.log_level == 'info' and level == 'debug':
+            return False
+        if self.logger is not None:
+            return self.logger.isEnabledFor(self.LOGGING_LEVELS[level])
+        return True
+
+    def log(self, level, message, *args):
+        # The message is only built if it will be logged: it is %-formatted
+        # with args, and may be a function returning the message
+        if not self.log_enabled(level):
             return
+        if callable(message):
+            message = message()
+        elif len(args) > 0:
+            message = message % args
         self.write_to_log(level, message)
 
     # Override this one for more meaningful logging
     def write_to_log(self, level, message):
+        if self.logger is not None:
+            self.logger.log(self.LOGGING_LEVELS[level], message)
+            return
         print('%s: %s' % (level.upper(), message))
@@ -0,0 +1,149 @@
+import re
+from .has_a_logger import HasALogger
+
+
+class JobAccounting(HasALogger):
+    # Job efficiency from one sacct query for many jobs, with the same
+    # fields as ClusterJob used to get from seff
+    SACCT_FIELDS = ['JobID', 'State', 'ExitCode', 'Elapsed', 'TotalCPU',
+                    'AllocCPUS', 'NNodes', 'MaxRSS', 'ReqMem']
+    # States where the accounting record may still change
+    ACTIVE_STATES = ['PENDING', 'RUNNING', 'REQUEUED', 'RESIZING',
+                     'SUSPENDED', 'COMPLETING', 'CONFIGURING', 'STOPPED']
+    DURATION_REGEX = \
+        r"^(?:(\d+)-)?(?:(\d+):)?(\d+):(\d+(?:\.\d+)?)$"
+    MEMORY_REGEX = r"^(\d+(?:\.\d+)?)([KMGTP]?)([cn]?)$"
+    MEMORY_UNITS = ['', 'K', 'M', 'G', 'T', 'P']
+
+    def __init__(self, cluster_account, **kwargs):
+        self.cluster_account = cluster_account
+        # jobid => efficiency hash, for jobs that are done
+        self.finished = {}
+        self.init_logging(**dict(cluster_account.logging_options(),
+                                 **kwargs))
+
+    def efficiency_hashes(self, jobids):
+        # Returns a hash of jobid => efficiency hash. Array jobs give one
+        # entry per task (jobid_taskid).
+        output_hash = {}
+        uncached = []
+        for jobid in jobids:
+            if jobid in self.finished:
+                output_hash[jobid] = self.finished[jobid]
+            else:
+                uncached.append(jobid)
+        if len(uncached) == 0:
+            return output_hash
+
+        for jobid, efficiency in self.query(uncached).items():
+            output_hash[jobid] = efficiency
+            if self.is_finished(efficiency):
+                self.finished[jobid] = efficiency
+        return output_hash
+
+    def is_finished(self, efficiency):
+        return efficiency['state'].split()[0] not in self.ACTIVE_STATES
+
+    def query(self, jobids):
+        command = 'sacct -P -n -j %s --format=%s' % \
+            (','.join(jobids), ','.join(self.SACCT_FIELDS))
+        stdin, stdout, stderr = self.cluster_account.exec_command(command)
+        out = stdout.readlines()
+        if stdout.channel.recv_exit_status() > 0:
+            return {}
+        self.log('debug', lambda: 'sacct output:\n' + ''.join(out))
+        return self.parse(out)
+
+    def parse(self, lines):
+        # Group the allocation row with its steps (jobid.batch etc)
+        jobs = {}
+        steps = {}
+        for line in lines:
+            fields = line.rstrip('\n').split('|')
+            if len(fields) != len(self.SACCT_FIELDS):
+                continue
+            row = dict(zip(self.SACCT_FIELDS, fields))
+            jobid = row['JobID'].split('.')[0]
+            if jobid == row['JobID']:
+                jobs[jobid] = row
+            else:
+                steps.setdefault(jobid, []).append(row)
+
+        output_hash = {}
+        for jobid, row in jobs.items():
+            output_hash[jobid] = self.efficiency(row, steps.get(jobid, []))
+        return output_hash
+
+    def efficiency(self, row, steps):
+        state = row['State'].split()[0]
+        exit_code = row['ExitCode'].split(':')[0]
+        elapsed = self.seconds(row['Elapsed'])
+        cpu = self.seconds(row['TotalCPU'])
+        cpus = int(row['AllocCPUS'] or 0)
+        core_walltime = elapsed * cpus
+        max_rss = max([self.memory_bytes(step['MaxRSS'], cpus, row)
+                       for step in steps] +
+                      [self.memory_bytes(row['MaxRSS'], cpus, row)])
+        requested = self.memory_bytes(row['ReqMem'], cpus, row)
+
+        output_hash = {
+            'state': '%s (exit code %s)' % (state, exit_code),
+            'exit_code': exit_code,
+            'walltime': self.duration_string(elapsed),
+            'cpu_utilized': self.duration_string(cpu),
+            'cpu_efficiency': '%.2f%% of %s core-walltime' %
+            (self.percent(cpu, core_walltime),
+             self.duration_string(core_walltime)),
+            'memory_utilized': self.memory_string(max_rss),
+            'memory_efficiency': '%.2f%% of %s' %
+            (self.percent(max_rss, requested), self.memory_string(requested))
+        }
+        if state in self.ACTIVE_STATES:
+            output_hash['state'] = state
+            del output_hash['exit_code']
+        return output_hash
+
+    def seconds(self, duration):
+        m = re.match(self.DURATION_REGEX, duration.strip())
+        if m is None:
+            return 0.0
+        days, hours, minutes, seconds = m.groups()
+        return int(days or 0) * 86400 + int(hours or 0) * 3600 + \
+            int(minutes) * 60 + float(seconds)
+
+    def memory_bytes(self, memory, cpus, row):
+        m = re.match(self.MEMORY_REGEX, memory.strip())
+        if m is None:
+            return 0.0
+        value, unit, per = m.groups()
+        memory_bytes = float(value) * 1024 ** self.MEMORY_UNITS.index(unit)
+        # Older Slurm requests memory per cpu (c) or per node (n)
+        if per == 'c':
+            memory_bytes *= cpus
+        elif per == 'n':
+            memory_bytes *= int(row['NNodes'] or 1)
+        return memory_bytes
+
+    def percent(self, used, total):
+        if total <= 0:
+            return 0.0
+        return 100.0 * used / total
+
+    def duration_string(self, seconds):
+        seconds = int(seconds)
+        days, seconds = divmod(seconds, 86400)
+        hours, seconds = divmod(seconds, 3600)
+        minutes, seconds = divmod(seconds, 60)
+        duration = '%02d:%02d:%02d' % (hours, minutes, seconds)
+        if days > 0:
+            duration = '%d-%s' % (days, duration)
+        return duration
+
+    def memory_string(self, memory_bytes):
+        units = ['KB', 'MB', 'GB', 'TB', 'PB']
+        value = memory_bytes / 1024.0
+        for unit in units[:-1]:
+            if value < 1024.0:
+                return '%.2f %s' % (value, unit)
+            value /= 1024.0
+        return '%.2f %s' % (value, units[-1])
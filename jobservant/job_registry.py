@@ -0,0 +1,199 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from .cluster_job import ClusterJob
+from .has_a_logger import HasALogger
+
+
+class JobRegistry(HasALogger):
+    # Local SQLite record of submitted jobs, so they can be picked up again
+    # after a restart. Jobs known to have finished, and their accounting,
+    # are kept so the cluster is never asked about them again.
+    DEFAULT_PATH = os.path.join('~', '.jobservant', 'registry.sqlite3')
+    STATES = ['submitted', 'waiting', 'running', 'finished']
+    # SQLite limits the number of parameters in one statement
+    QUERY_BATCH = 500
+    SCHEMA = [
+        '''CREATE TABLE IF NOT EXISTS jobs (
+               cluster TEXT NOT NULL,
+               jobid TEXT NOT NULL,
+               state TEXT NOT NULL,
+               username TEXT,
+               work_directory TEXT,
+               submit_script_name TEXT,
+               submit_script_path TEXT,
+               text TEXT,
+               job_params TEXT,
+               memo_key TEXT,
+               submitted_at REAL,
+               finished_at REAL,
+               PRIMARY KEY (cluster, jobid))''',
+        '''CREATE INDEX IF NOT EXISTS jobs_by_state
+               ON jobs (cluster, state)''',
+        '''CREATE INDEX IF NOT EXISTS jobs_by_memo_key
+               ON jobs (cluster, memo_key)''',
+        '''CREATE TABLE IF NOT EXISTS accounting (
+               cluster TEXT NOT NULL,
+               jobid TEXT NOT NULL,
+               efficiency TEXT NOT NULL,
+               PRIMARY KEY (cluster, jobid))''',
+    ]
+
+    def __init__(self, path=None, **kwargs):
+        self.path = path or os.path.expanduser(self.DEFAULT_PATH)
+        if self.path != ':memory:':
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+        # One connection shared between threads (submit_many() records jobs
+        # from several), with the lock serializing its use
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(self.path,
+                                          check_same_thread=False)
+        with self.lock, self.connection:
+            for statement in self.SCHEMA:
+                self.connection.execute(statement)
+        self.init_logging(**kwargs)
+
+    def batches(self, jobids):
+        jobids = list(jobids)
+        for i in range(0, len(jobids), self.QUERY_BATCH):
+            yield jobids[i:i + self.QUERY_BATCH]
+
+    def record(self, cluster, job):
+        # Called once a job is submitted
+        with self.lock, self.connection:
+            self.connection.execute(
+                '''INSERT OR REPLACE INTO jobs
+                   (cluster, jobid, state, username, work_directory,
+                    submit_script_name, submit_script_path, text, job_params,
+                    memo_key, submitted_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (cluster, job.jobid, 'submitted',
+                 job.cluster_account.username, job.work_directory,
+                 job.submit_script_name, job.submit_script_path, job.text,
+                 json.dumps(job.job_params), job.memo_key, time.time()))
+
+    def update_states(self, cluster, states):
+        # states is a hash of jobid => state, for jobs that may or may not
+        # be registered. Finished jobs stay finished.
+        now = time.time()
+        rows = [(state, now if state == 'finished' else None, cluster, jobid,
+                 state) for jobid, state in states.items()]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                '''UPDATE jobs SET state = ?, finished_at = ?
+                   WHERE cluster = ? AND jobid = ? AND state != ?
+                   AND state != 'finished' ''', rows)
+
+    def states(self, cluster, jobids):
+        # Returns a hash of jobid => state for the registered jobids
+        states = {}
+        with self.lock:
+            for batch in self.batches(jobids):
+                rows = self.connection.execute(
+                    'SELECT jobid, state FROM jobs WHERE cluster = ? ' +
+                    'AND jobid IN (%s)' % ','.join('?' * len(batch)),
+                    [cluster] + batch)
+                states.update(rows)
+        return states
+
+    def finished_jobids(self, cluster, jobids):
+        return set(jobid for jobid, state in self.states(cluster,
+                                                         jobids).items()
+                   if state == 'finished')
+
+    def rows(self, cluster, state=None, jobids=None, memo_key=None):
+        query = 'SELECT jobid, work_directory, submit_script_name, ' + \
+            'submit_script_path, text, job_params, memo_key FROM jobs ' + \
+            'WHERE cluster = ?'
+        parameters = [cluster]
+        if state is not None:
+            query += ' AND state = ?'
+            parameters.append(state)
+        if memo_key is not None:
+            query += ' AND memo_key = ?'
+            parameters.append(memo_key)
+        with self.lock:
+            if jobids is None:
+                return self.connection.execute(
+                    query + ' ORDER BY submitted_at', parameters).fetchall()
+            rows = []
+            for batch in self.batches(jobids):
+                rows += self.connection.execute(
+                    query + ' AND jobid IN (%s)' % ','.join('?' * len(batch)),
+                    parameters + batch).fetchall()
+            return rows
+
+    def jobs(self, cluster_account, state=None, jobids=None, memo_key=None):
+        # Rebuilds ClusterJob objects for the account's registered jobs,
+        # optionally only those in a state, with the given jobids or with a
+        # memo_key
+        jobs = []
+        for row in self.rows(cluster_account.server, state, jobids, memo_key):
+            jobid, work_directory, script_name, script_path, text, params, \
+                memo_key = row
+            job = ClusterJob(cluster_account=cluster_account, text=text,
+                             **json.loads(params))
+            job.jobid = jobid
+            job.work_directory = work_directory
+            job.submit_script_name = script_name
+            job.submit_script_path = script_path
+            job.memo_key = memo_key
+            jobs.append(job)
+        return jobs
+
+    def work_directories(self, cluster):
+        with self.lock:
+            return set(row[0] for row in self.connection.execute(
+                '''SELECT work_directory FROM jobs WHERE cluster = ?
+                   AND work_directory IS NOT NULL''', [cluster]))
+
+    def memoized_entries(self, cluster):
+        # (jobid, work directory, submitted at) of the finished jobs that
+        # can be reused, oldest first
+        with self.lock:
+            return self.connection.execute(
+                '''SELECT jobid, work_directory, submitted_at FROM jobs
+                   WHERE cluster = ? AND memo_key IS NOT NULL
+                   AND state = 'finished' ORDER BY submitted_at''',
+                [cluster]).fetchall()
+
+    def efficiencies(self, cluster, jobids):
+        # Returns a hash of jobid => stored efficiency hash
+        efficiencies = {}
+        with self.lock:
+            for batch in self.batches(jobids):
+                rows = self.connection.execute(
+                    'SELECT jobid, efficiency FROM accounting ' +
+                    'WHERE cluster = ? AND jobid IN (%s)' %
+                    ','.join('?' * len(batch)), [cluster] + batch)
+                for jobid, efficiency in rows:
+                    efficiencies[jobid] = json.loads(efficiency)
+        return efficiencies
+
+    def save_efficiencies(self, cluster, efficiencies):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                '''INSERT OR REPLACE INTO accounting (cluster, jobid,
+                   efficiency) VALUES (?, ?, ?)''',
+                [(cluster, jobid, json.dumps(efficiency))
+                 for jobid, efficiency in efficiencies.items()])
+
+    def forget(self, cluster, jobids):
+        with self.lock, self.connection:
+            for batch in self.batches(jobids):
+                marks = ','.join('?' * len(batch))
+                self.connection.execute(
+                    'DELETE FROM jobs WHERE cluster = ? AND jobid IN (%s)' %
+                    marks, [cluster] + batch)
+                self.connection.execute(
+                    'DELETE FROM accounting WHERE cluster = ? AND ' +
+                    "(jobid IN (%s) OR substr(jobid, 1, instr(jobid, '_') " %
+                    marks + "- 1) IN (%s))" % marks,
+                    [cluster] + batch + batch)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
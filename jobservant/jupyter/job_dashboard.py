@@ -0,0 +1,148 @@
+import html
+import time
+import ipywidgets
+from IPython.lib import backgroundjobs
+from IPython.display import HTML, display
+from .uses_i18n import t
+
+
+class JobDashboard:
+    # One widget for a whole ClusterJobCollection. Rows are split into
+    # blocks, each its own HTML widget, so an update only sends the blocks
+    # holding rows whose state changed.
+    ROWS_PER_BLOCK = 50
+    REFRESH_SECONDS = 20.0
+    STATUSES = ['submit_failed', 'not_submitted', 'waiting', 'running',
+                'finished']
+
+    def __init__(self, job_collection, **kwargs):
+        self.job_collection = job_collection
+        self.rows_per_block = kwargs.get('rows_per_block',
+                                         self.ROWS_PER_BLOCK)
+        self.refresh_seconds = kwargs.get('refresh_seconds',
+                                          self.REFRESH_SECONDS)
+
+        # Widgets
+        self.widget = None
+        self.summary_field = None
+        self.blocks = []
+
+        self.row_keys = []
+        self.rows = []
+        self.initialized = False
+        self.finished = False
+        self.is_table_style_set = False
+
+    def init(self):
+        if self.initialized:
+            return
+        self.setup_table_style()
+        self.summary_field = ipywidgets.HTML(value=t('initializing_ellipses'))
+        self.row_keys = [None] * len(self.job_collection)
+        self.rows = [''] * len(self.job_collection)
+        block_count = (len(self.rows) + self.rows_per_block - 1) // \
+            self.rows_per_block
+        self.blocks = [ipywidgets.HTML(value='') for i in range(block_count)]
+        self.widget = ipywidgets.VBox([self.summary_field] + self.blocks)
+        display(self.widget)
+        self.initialized = True
+
+    def run(self):
+        self.init()
+        while not self.finished:
+            self.update()
+            if not self.finished:
+                time.sleep(self.refresh_seconds)
+
+    def run_in_background(self):
+        # One thread and one squeue call per refresh, however many jobs
+        self.init()
+        jobs = backgroundjobs.BackgroundJobManager()
+        jobs.new(self.run)
+
+    def update(self):
+        self.update_from_statuses(self.job_collection.statuses())
+
+    def update_from_statuses(self, statuses):
+        changed_blocks = set()
+        counts = {}
+        for i, status in enumerate(statuses):
+            if self.job_collection[i] in self.job_collection.errors:
+                # From submit_many(), never to be submitted
+                status = dict(status, status='submit_failed')
+            counts[status['status']] = counts.get(status['status'], 0) + 1
+            key = self.row_key(status)
+            if key != self.row_keys[i]:
+                self.row_keys[i] = key
+                self.rows[i] = self.render_row(self.job_collection[i], status)
+                changed_blocks.add(i // self.rows_per_block)
+
+        for block in sorted(changed_blocks):
+            self.blocks[block].value = self.render_block(block)
+        self.summary_field.value = self.render_summary(counts)
+        # Done once every submitted job is (failed and unsubmitted jobs
+        # never will be)
+        self.finished = all(status in ['finished', 'submit_failed',
+                                       'not_submitted'] for status in counts)
+
+    def row_key(self, status):
+        # Rows are only re-rendered when this changes
+        return (status['status'], round(status.get('done', 0.0), 2))
+
+    def render_row(self, job, status):
+        done = min(max(status.get('done', 0.0), 0.0), 1.0)
+        if status['status'] == 'finished':
+            done = 1.0
+        return ('<tr class="{}"><td>{}</td><td>{}</td>' +
+                '<td><div class="bar" style="width: {:.0f}%"></div></td>' +
+                '</tr>').format(status['status'],
+                                html.escape(str(job.jobid or '')),
+                                self.i18n_status(status['status']),
+                                done * 100)
+
+    def render_block(self, block):
+        start = block * self.rows_per_block
+        rows = self.rows[start:start + self.rows_per_block]
+        parts = ['<table class="jobservant dashboard">']
+        if block == 0:
+            parts.append('<tr><th>{}</th><th>{}</th><th>{}</th></tr>'.format(
+                t('job_id'), t('status'), t('progress')))
+        parts.extend(rows)
+        parts.append('</table>')
+        return ''.join(parts)
+
+    def render_summary(self, counts):
+        parts = []
+        for status in self.STATUSES:
+            if counts.get(status):
+                parts.append('{}: {}'.format(self.i18n_status(status),
+                                             counts[status]))
+        return ' &middot; '.join(parts)
+
+    def i18n_status(self, status):
+        if status in self.STATUSES:
+            return t(status)
+        return status
+
+    def setup_table_style(self):
+        if self.is_table_style_set:
+            return
+        display(HTML("""
+        <style>
+          table.jobservant.dashboard {
+            table-layout: fixed;
+            width: 100%;
+          }
+          table.jobservant.dashboard div.bar {
+            height: 0.8em;
+            background: #4a90d9;
+          }
+          table.jobservant.dashboard tr.finished div.bar {
+            background: #5cb85c;
+          }
+          table.jobservant.dashboard tr.submit_failed {
+            color: #d9534f;
+          }
+        </style>
+        """))
+        self.is_table_style_set = True
@@ -1,3 +1,4 @@
+from .job_dashboard import JobDashboard
 from .job_progress import JobProgress
 from .job_status_table import JobStatusTable
 
@@ -14,3 +15,14 @@ class JobPresenter:
     def status_table(self, **kwargs):
         status_table = JobStatusTable(self.cluster_job, **kwargs)
         status_table.run()
+
+
+class JobCollectionPresenter:
+
+    def __init__(self, job_collection, **kwargs):
+        self.job_collection = job_collection
+
+    def dashboard(self, **kwargs):
+        dashboard = JobDashboard(self.job_collection, **kwargs)
+        dashboard.run_in_background()
+        return dashboard
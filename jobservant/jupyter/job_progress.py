@@ -1,15 +1,19 @@
+import html
 import time
 import ipywidgets
-from IPython.lib import backgroundjobs
 from IPython.display import display
 from .uses_i18n import t
 
 
 class JobProgress:
+    # Only the end of long outputs is shown
+    OUTPUT_DISPLAY_LIMIT = 100000
 
     def __init__(self, cluster_job, **kwargs):
         self.cluster_job = cluster_job
         self.include_output = kwargs.get('include_output', False)
+        self.output_limit = kwargs.get('output_limit',
+                                       self.OUTPUT_DISPLAY_LIMIT)
 
         # Widgets
         self.waiting_progress = None
@@ -17,7 +21,7 @@ class JobProgress:
         self.status_field = None
         self.output_field = None
 
-        self.output = None
+        self.output = ''
         self.initialized = False
         self.iteration = None
         self.finished = False
@@ -42,8 +46,11 @@ class JobProgress:
             self.wait()
 
     def run_in_background(self):
-        jobs = backgroundjobs.BackgroundJobManager()
-        jobs.new(self.run)
+        # The account's polling scheduler checks all watched jobs from one
+        # thread, so no thread is started per widget
+        self.init()
+        self.cluster_job.cluster_account.watch(self.cluster_job,
+                                               self.update_from_status)
 
     def create_waiting_progress(self):
         self.waiting_progress = ipywidgets.FloatProgress(
@@ -82,21 +89,24 @@ class JobProgress:
         display(self.status_field)
 
     def update(self):
-        self.iteration += 1
         self.status_field.value = \
-            t('checking_iteration', iteration=self.iteration)
-        status = self.cluster_job.status()
+            t('checking_iteration', iteration=self.iteration + 1)
+        self.update_from_status(self.cluster_job.status())
+
+    def update_from_status(self, status):
+        self.iteration += 1
         if status['status'] == 'finished':
             self.finished = True
             self.waiting_done()
             self.running_done()
             if self.include_output:
-                html = '<pre>' + self.cluster_job.fetch_output() + '</pre>'
-                self.output_field.value = html
+                self.update_output(final=True)
         elif status['status'] == 'running':
             self.finished = False
             self.waiting_done()
             self.set_running(status['done'])
+            if self.include_output:
+                self.update_output()
         elif status['status'] == 'waiting':
             self.finished = False
             self.set_waiting(status['done'])
@@ -107,6 +117,14 @@ class JobProgress:
             self.set_running(0.0)
         self.status_field.value = self.i18n_status(status['status'])
 
+    def update_output(self, final=False):
+        # Only the output written since the last update is fetched
+        new_output = self.cluster_job.new_output(final)
+        if len(new_output) == 0:
+            return
+        self.output = (self.output + new_output)[-self.output_limit:]
+        self.output_field.value = '<pre>' + html.escape(self.output) + '</pre>'
+
     def running_done(self):
         self.running_progress.value = 1.0
         self.running_progress.bar_style = 'success'
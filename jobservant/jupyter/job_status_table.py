@@ -65,13 +65,14 @@ class JobStatusTable:
     def start_table(self):
         self.setup_table_style()
 
-        self.html = '<table class="jobservant status-table">'
+        # Parts are joined at the end rather than concatenated as we go
+        self.html = ['<table class="jobservant status-table">']
         self.should_separate_next_line = False
         self.section_class = None
 
     def finish_table(self):
-        self.html += '</table>'
-        display(HTML(self.html))
+        self.html.append('</table>')
+        display(HTML(''.join(self.html)))
 
     def add_separator(self, **kwargs):
         self.should_separate_next_line = True
@@ -88,7 +89,7 @@ class JobStatusTable:
             class_string = ' class="{}"'.format(class_string)
         row = '<th>{}</th>'.format(heading) + \
             '<td>{}</td>'.format(data)
-        self.html += '<tr{}>{}</tr>'.format(class_string, row)
+        self.html.append('<tr{}>{}</tr>'.format(class_string, row))
 
     def setup_table_style(self):
         if self.is_table_style_set:
@@ -0,0 +1,163 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime
+from .has_a_logger import HasALogger
+
+
+class PollingScheduler(HasALogger):
+    # One thread checking any number of watched jobs. Jobs are checked when
+    # due, all due jobs with one squeue call, and the next check is planned
+    # from squeue's estimated start and end times. Jobs due within
+    # min_interval are checked early along with them, so jobs watched from
+    # different places at different times soon share their queries.
+    MIN_INTERVAL = 5.0
+    DEFAULT_INTERVAL = 20.0
+    MAX_INTERVAL = 600.0
+    MAX_RUNNING_INTERVAL = 120.0
+    BACKOFF = 1.5
+
+    def __init__(self, cluster_account, **kwargs):
+        self.cluster_account = cluster_account
+        self.min_interval = kwargs.get('min_interval', self.MIN_INTERVAL)
+        self.default_interval = kwargs.get('default_interval',
+                                           self.DEFAULT_INTERVAL)
+        self.max_interval = kwargs.get('max_interval', self.MAX_INTERVAL)
+        self.max_running_interval = kwargs.get('max_running_interval',
+                                               self.MAX_RUNNING_INTERVAL)
+
+        # (next check, sequence, watch) ordered by next check
+        self.queue = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+        self.init_logging(**dict(cluster_account.logging_options(),
+                                 **kwargs))
+
+    def watch(self, cluster_job, callback):
+        # callback(status) is called with the job's status() every time the
+        # job is checked, until it is finished
+        watch = {'job': cluster_job, 'callback': callback,
+                 'interval': self.default_interval, 'active': True}
+        self.schedule(watch, time.monotonic())
+        self.start()
+        return watch
+
+    def unwatch(self, watch):
+        watch['active'] = False
+
+    def schedule(self, watch, when):
+        with self.condition:
+            heapq.heappush(self.queue, (when, next(self.sequence), watch))
+            self.condition.notify()
+
+    def start(self):
+        with self.condition:
+            if self.thread is not None:
+                return
+            self.stopped = False
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def due_watches(self):
+        # Waits for watches to come due, then returns all of them
+        with self.condition:
+            while not self.stopped:
+                now = time.monotonic()
+                if len(self.queue) > 0 and self.queue[0][0] <= now:
+                    until = now + self.min_interval
+                    due = []
+                    while len(self.queue) > 0 and \
+                            self.queue[0][0] <= until:
+                        due.append(heapq.heappop(self.queue)[2])
+                    return due
+                timeout = None
+                if len(self.queue) > 0:
+                    timeout = self.queue[0][0] - now
+                self.condition.wait(timeout)
+            return []
+
+    def run(self):
+        while not self.stopped:
+            due = [watch for watch in self.due_watches() if watch['active']]
+            if len(due) == 0:
+                continue
+            # One bad check mustn't end the only thread polling every job
+            try:
+                self.tick(due)
+            except Exception as e:
+                self.log('info', 'Status check failed: %s', e)
+
+    def tick(self, due):
+        try:
+            collection = self.cluster_account.create_job_collection(
+                [watch['job'] for watch in due])
+            queue_statuses = collection.queue_status_hashes()
+        except Exception as e:
+            self.log('info', 'Status check failed: %s', e)
+            for watch in due:
+                self.schedule(watch, time.monotonic() + watch['interval'])
+            return
+
+        now = time.monotonic()
+        for watch in due:
+            try:
+                self.check(watch, queue_statuses, now)
+            except Exception as e:
+                # e.g. a state the job's status can't be worked out from
+                self.log('info', 'Status check of job %s failed: %s',
+                         watch['job'].jobid, e)
+                watch['interval'] = min(watch['interval'] * self.BACKOFF,
+                                        self.max_interval)
+                self.schedule(watch, now + watch['interval'])
+
+    def check(self, watch, queue_statuses, now):
+        job = watch['job']
+        status = job.status_from_queue_statuses(queue_statuses)
+        try:
+            watch['callback'](status)
+        except Exception as e:
+            self.log('info', 'Watch callback failed: %s', e)
+        if status['status'] == 'finished':
+            return
+        watch['interval'] = self.next_interval(
+            watch, status, job.queue_status_hash_from(queue_statuses))
+        self.schedule(watch, now + watch['interval'])
+
+    def next_interval(self, watch, status, queue_status):
+        if status['status'] == 'waiting':
+            until = self.seconds_until(queue_status.get('START_TIME'))
+            if until is None:
+                # No start estimate, back off while the job waits
+                return min(watch['interval'] * self.BACKOFF,
+                           self.max_interval)
+            return self.clamp(until / 2.0, self.max_interval)
+        if status['status'] == 'running':
+            until = self.seconds_until(queue_status.get('END_TIME'))
+            if until is None:
+                return self.clamp(self.default_interval,
+                                  self.max_running_interval)
+            return self.clamp(until / 2.0, self.max_running_interval)
+        return self.default_interval
+
+    def clamp(self, interval, maximum):
+        return max(self.min_interval, min(interval, maximum))
+
+    def seconds_until(self, remote_time):
+        if remote_time is None or remote_time in ('N/A', 'Unknown', ''):
+            return None
+        try:
+            when = datetime.fromisoformat(remote_time).timestamp()
+        except ValueError:
+            return None
+        return when - self.cluster_account.remote_now()
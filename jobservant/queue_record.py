@@ -0,0 +1,80 @@
+class QueueRecord:
+    # The squeue fields jobservant uses, keyed by their "%all" header name
+    # so records can stand in for the hashes from a "%all" query
+    FIELDS = {
+        'JOBID': '%i',
+        'ARRAY_JOB_ID': '%F',
+        'ARRAY_TASK_ID': '%K',
+        'ST': '%t',
+        'STATE': '%T',
+        'SUBMIT_TIME': '%V',
+        'START_TIME': '%S',
+        'END_TIME': '%e',
+        'ACCOUNT': '%a',
+        'PARTITION': '%P',
+        'NODELIST': '%N'
+    }
+    __slots__ = [field.lower() for field in FIELDS]
+
+    def __init__(self):
+        for slot in self.__slots__:
+            setattr(self, slot, None)
+
+    def __getitem__(self, field):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        return getattr(self, field.lower())
+
+    def __contains__(self, field):
+        return field in self.FIELDS and \
+            getattr(self, field.lower()) is not None
+
+    def get(self, field, default=None):
+        if field not in self:
+            return default
+        return getattr(self, field.lower())
+
+    def to_hash(self):
+        return dict((field, getattr(self, field.lower()))
+                    for field in self.FIELDS
+                    if getattr(self, field.lower()) is not None)
+
+    def __repr__(self):
+        return 'QueueRecord(%r)' % self.to_hash()
+
+
+class QueueRecordParser:
+    # Parses squeue output in a trimmed format with only the selected fields.
+    # None of the fields can contain '|', so unlike "%all" output a plain
+    # split is unambiguous.
+    REQUIRED_FIELDS = ['JOBID', 'ARRAY_JOB_ID', 'ARRAY_TASK_ID', 'ST']
+    DELIMITER = '|'
+
+    def __init__(self, fields=None):
+        if fields is None:
+            fields = list(QueueRecord.FIELDS)
+        for field in fields:
+            if field not in QueueRecord.FIELDS:
+                raise ValueError('Unknown squeue field ' + field)
+        self.fields = self.REQUIRED_FIELDS + \
+            [field for field in fields if field not in self.REQUIRED_FIELDS]
+        self.slots = [field.lower() for field in self.fields]
+        self.format = self.DELIMITER.join(QueueRecord.FIELDS[field]
+                                          for field in self.fields)
+
+    def parse(self, line):
+        values = line.rstrip('\n').split(self.DELIMITER)
+        if len(values) != len(self.slots):
+            return None
+        record = QueueRecord()
+        for slot, value in zip(self.slots, values):
+            setattr(record, slot, value)
+        return record
+
+    def parse_lines(self, lines):
+        records = []
+        for line in lines:
+            record = self.parse(line)
+            if record is not None:
+                records.append(record)
+        return records
@@ -0,0 +1,225 @@
+import base64
+import io
+import json
+import threading
+from concurrent.futures import Future
+from .has_a_logger import HasALogger
+
+
+# Runs on the cluster: reads one JSON request per line from stdin, runs the
+# commands (several at once) and writes each result as a JSON header line
+# followed by the command's stdout and stderr. Kept compatible with old
+# python3 versions.
+AGENT_SOURCE = '''
+import json, subprocess, sys, threading
+out = sys.stdout.buffer
+lock = threading.Lock()
+slots = threading.Semaphore(%(parallel)d)
+
+def run(request):
+    try:
+        process = subprocess.Popen(
+            request['command'], shell=True, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        code = process.returncode
+    except Exception as e:
+        stdout, stderr, code = b'', str(e).encode(), 255
+    header = json.dumps({'id': request['id'], 'code': code,
+                         'stdout': len(stdout), 'stderr': len(stderr)})
+    with lock:
+        out.write(header.encode() + b'\\n' + stdout + stderr)
+        out.flush()
+    slots.release()
+
+out.write(%(greeting)r)
+out.flush()
+for line in iter(sys.stdin.buffer.readline, b''):
+    slots.acquire()
+    thread = threading.Thread(target=run, args=(json.loads(line.decode()),))
+    thread.daemon = True
+    thread.start()
+for i in range(%(parallel)d):
+    slots.acquire()
+'''
+
+
+class AgentChannel:
+    # Stands in for the channel of a command run by the agent
+    def __init__(self, future):
+        self.future = future
+        self.closed = True
+
+    def result(self):
+        return self.future.result()
+
+    def recv_exit_status(self):
+        return self.result()[0]
+
+    def exit_status_ready(self):
+        return self.future.done()
+
+    def shutdown_write(self):
+        pass
+
+
+class AgentStream:
+    # stdout or stderr of a command run by the agent. Like paramiko's
+    # ChannelFile, read() gives bytes and readline() strings.
+    def __init__(self, channel, index):
+        self.channel = channel
+        self.index = index
+        self.buffer = None
+
+    def data(self):
+        if self.buffer is None:
+            self.buffer = io.BytesIO(self.channel.result()[self.index])
+        return self.buffer
+
+    def read(self, size=-1):
+        return self.data().read(size)
+
+    def readline(self):
+        return self.data().readline().decode('utf-8', errors='replace')
+
+    def readlines(self):
+        return [line.decode('utf-8', errors='replace')
+                for line in self.data().readlines()]
+
+    def __iter__(self):
+        return iter(self.readlines())
+
+
+class AgentStdin:
+    def __init__(self, channel):
+        self.channel = channel
+
+    def write(self, data):
+        raise ValueError('Commands run by the remote agent take no input, ' +
+                         'run them with direct=True')
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RemoteAgent(HasALogger):
+    # A long-lived process on the cluster running commands sent over one
+    # channel, so each command costs a round trip instead of a new channel
+    # and shell. Many commands can be in flight at once.
+    GREETING = b'jobservant-agent 1\n'
+    PARALLEL = 16
+    PYTHON = 'python3'
+
+    def __init__(self, cluster_account, **kwargs):
+        self.cluster_account = cluster_account
+        self.parallel = kwargs.get('parallel', self.PARALLEL)
+        self.python = kwargs.get('python', self.PYTHON)
+        self.lock = threading.Lock()
+        self.stdin = None
+        self.next_id = 0
+        # Request id => Future of (exit code, stdout bytes, stderr bytes)
+        self.pending = {}
+        self.alive = False
+        self.init_logging(**dict(cluster_account.logging_options(),
+                                 **kwargs))
+
+    def command(self):
+        source = AGENT_SOURCE % {'parallel': self.parallel,
+                                 'greeting': self.GREETING}
+        encoded = base64.b64encode(source.encode('utf-8')).decode('ascii')
+        return "%s -c 'import base64; exec(base64.b64decode(\"%s\"))'" % \
+            (self.python, encoded)
+
+    @classmethod
+    def is_agent_command(cls, command):
+        return ' -c \'import base64; exec(base64.b64decode("' in command
+
+    def start(self):
+        self.log('info', 'Starting remote agent ...')
+        stdin, stdout, stderr = \
+            self.cluster_account.connection_pool().exec_command(
+                self.command())
+        greeting = stdout.readline()
+        if isinstance(greeting, str):
+            greeting = greeting.encode('utf-8')
+        if greeting != self.GREETING:
+            raise ValueError('Remote agent did not start: ' +
+                             stderr.read().decode('utf-8', errors='replace'))
+        self.stdin = stdin
+        self.alive = True
+        thread = threading.Thread(target=self.read_results, args=(stdout,))
+        thread.daemon = True
+        thread.start()
+
+    def read_exactly(self, stream, size):
+        chunks = []
+        while size > 0:
+            chunk = stream.read(size)
+            if not chunk:
+                raise EOFError('Remote agent output ended early')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def read_results(self, stdout):
+        try:
+            while True:
+                line = stdout.readline()
+                if not line:
+                    break
+                header = json.loads(line)
+                out = self.read_exactly(stdout, header['stdout'])
+                err = self.read_exactly(stdout, header['stderr'])
+                with self.lock:
+                    future = self.pending.pop(header['id'], None)
+                if future is not None:
+                    future.set_result((header['code'], out, err))
+        except Exception as e:
+            self.log('info', 'Remote agent failed: %s', e)
+        self.stop()
+
+    def stop(self):
+        with self.lock:
+            self.alive = False
+            pending = list(self.pending.values())
+            self.pending = {}
+        for future in pending:
+            future.set_exception(ValueError('Remote agent stopped'))
+
+    def submit(self, command):
+        # Sends command to the agent, returning a Future of its result
+        future = Future()
+        with self.lock:
+            if not self.alive:
+                raise ValueError('Remote agent is not running')
+            self.next_id += 1
+            self.pending[self.next_id] = future
+            request = json.dumps({'id': self.next_id, 'command': command})
+            try:
+                self.stdin.write((request + '\n').encode('utf-8'))
+                self.stdin.flush()
+            except Exception as e:
+                del self.pending[self.next_id]
+                raise ValueError('Remote agent is not running') from e
+        return future
+
+    def exec_command(self, command):
+        # Same as ClusterAccount.exec_command() for commands that need no
+        # input: the (stdin, stdout, stderr) it returns can be used the same
+        # way
+        channel = AgentChannel(self.submit(command))
+        return AgentStdin(channel), AgentStream(channel, 1), \
+            AgentStream(channel, 2)
+
+    def close(self):
+        with self.lock:
+            stdin = self.stdin
+            self.stdin = None
+        if stdin is not None:
+            try:
+                stdin.channel.shutdown_write()
+            except Exception:
+                pass
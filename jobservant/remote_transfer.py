@@ -0,0 +1,286 @@
+import io
+import random
+import string
+import tarfile
+from .compression import codec
+from .has_a_logger import HasALogger
+
+
+class BufferReader:
+    # File-like reader over bytes-like buffers, reading chunks straight out
+    # of them without first copying them into one bytes object
+    def __init__(self, buffers):
+        self.buffers = [memoryview(buffer).cast('B') for buffer in buffers]
+        self.size = sum(len(buffer) for buffer in self.buffers)
+        self.index = 0
+        self.position = 0
+
+    def read(self, size=-1):
+        chunks = []
+        while self.index < len(self.buffers) and size != 0:
+            buffer = self.buffers[self.index]
+            end = len(buffer) if size < 0 else \
+                min(len(buffer), self.position + size)
+            chunks.append(bytes(buffer[self.position:end]))
+            if size > 0:
+                size -= end - self.position
+            self.position = end
+            if self.position >= len(buffer):
+                self.index += 1
+                self.position = 0
+        return b''.join(chunks)
+
+
+class StreamReader:
+    # File-like reader over a command's output, decompressing it on the way
+    def __init__(self, stream, decompressor=None, chunk_size=32768):
+        self.stream = stream
+        self.decompressor = decompressor
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.ended = False
+
+    def fill(self, size):
+        while not self.ended and (size < 0 or len(self.buffer) < size):
+            chunk = self.stream.read(self.chunk_size)
+            if not chunk:
+                self.ended = True
+                if self.decompressor is not None:
+                    self.buffer += self.decompressor.flush()
+                break
+            if self.decompressor is not None:
+                chunk = self.decompressor.decompress(chunk)
+            self.buffer += chunk
+
+    def read(self, size=-1):
+        self.fill(size)
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+class RemoteTransfer(HasALogger):
+    # Moves files to and from the cluster. With a compression codec set,
+    # transfers of at least compression_threshold bytes are compressed on
+    # the wire.
+    OPTIONS = ['chunk_size', 'compression', 'compression_threshold']
+    CHUNK_SIZE = 32768
+    TEMP_RANDOM_CHARACTERS = 10
+    COMPRESSION_THRESHOLD = 65536
+
+    def __init__(self, cluster_account, **kwargs):
+        self.cluster_account = cluster_account
+        self.chunk_size = kwargs.get('chunk_size', self.CHUNK_SIZE)
+        self.codec = None
+        if kwargs.get('compression'):
+            self.codec = codec(kwargs['compression'])
+        self.compression_threshold = kwargs.get('compression_threshold',
+                                                self.COMPRESSION_THRESHOLD)
+        self.sftp = None
+        self.init_logging(**dict(cluster_account.logging_options(),
+                                 **kwargs))
+
+    def sftp_client(self):
+        # One SFTP session is shared by all transfers for the account
+        if self.sftp is None or self.sftp.get_channel().closed:
+            self.sftp = self.cluster_account.open_sftp()
+        return self.sftp
+
+    def as_file(self, contents):
+        if isinstance(contents, str):
+            return io.BytesIO(contents.encode('utf-8'))
+        if isinstance(contents, (bytes, bytearray)):
+            return io.BytesIO(contents)
+        if isinstance(contents, memoryview):
+            return BufferReader([contents])
+        if hasattr(contents, 'read'):
+            return contents
+        raise ValueError('Can not upload contents of type ' +
+                         type(contents).__name__)
+
+    def content_size(self, contents):
+        # Size in bytes if known without reading the contents
+        if isinstance(contents, str):
+            return len(contents.encode('utf-8'))
+        if isinstance(contents, (bytes, bytearray)):
+            return len(contents)
+        if isinstance(contents, memoryview):
+            return contents.nbytes
+        if isinstance(contents, BufferReader):
+            return contents.size
+        return None
+
+    def choose_codec(self, compress, size=None):
+        # compress can force compression on (True) or off (False), or leave
+        # it to the account's settings and the size (None)
+        if compress is False:
+            return None
+        if compress is True:
+            return self.codec or codec('gzip')
+        if self.codec is None:
+            return None
+        if size is not None and size < self.compression_threshold:
+            return None
+        return self.codec
+
+    def temp_path(self, remote_path):
+        return remote_path + '.part_' + \
+            ''.join(random.choices(string.ascii_letters + string.digits,
+                                   k=self.TEMP_RANDOM_CHARACTERS))
+
+    def upload(self, remote_path, contents, compress=None):
+        # contents can be a string, bytes or a readable file-like object.
+        # The data is written in chunks to a temporary file which is renamed
+        # into place once complete, so readers never see a partial file.
+        upload_codec = self.choose_codec(compress,
+                                         self.content_size(contents))
+        if upload_codec is not None or self.cluster_account.daemon_socket:
+            # Through the daemon, SFTP would need an SSH connection of its own
+            return self.upload_exec(remote_path, contents, upload_codec)
+        return self.upload_sftp(remote_path, contents)
+
+    def upload_sftp(self, remote_path, contents):
+        source = self.as_file(contents)
+        temp_path = self.temp_path(remote_path)
+        sftp = self.sftp_client()
+
+        self.log('debug', 'Uploading %s via %s', remote_path, temp_path)
+        try:
+            with sftp.open(temp_path, 'wb') as remote_file:
+                remote_file.set_pipelined(True)
+                while True:
+                    chunk = source.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode('utf-8')
+                    remote_file.write(chunk)
+            sftp.posix_rename(temp_path, remote_path)
+        except IOError as e:
+            self.remove_quietly(temp_path)
+            raise ValueError('Could not upload file ' + remote_path) from e
+
+        return remote_path
+
+    def upload_exec(self, remote_path, contents, upload_codec=None):
+        # Sends the contents over an exec channel's stdin, compressed if
+        # upload_codec is set and decompressed on the cluster
+        source = self.as_file(contents)
+        temp_path = self.temp_path(remote_path)
+        receive_command = 'cat'
+        compressor = None
+        if upload_codec is not None:
+            receive_command = upload_codec.DECOMPRESS_COMMAND
+            compressor = upload_codec.compressor()
+        command = '{} > {} && mv {} {}'.format(
+            receive_command, temp_path, temp_path, remote_path)
+
+        self.log('debug', 'Uploading %s over stdin', remote_path)
+        stdin, stdout, stderr = self.cluster_account.exec_command(
+            command, 'upload', direct=True)
+        while True:
+            chunk = source.read(self.chunk_size)
+            if not chunk:
+                break
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            stdin.write(chunk)
+        if compressor is not None:
+            stdin.write(compressor.flush())
+        stdin.flush()
+        stdin.channel.shutdown_write()
+        if stdout.channel.recv_exit_status() > 0:
+            raise ValueError('Could not upload file ' + remote_path)
+        return remote_path
+
+    def download(self, remote_path, fileobj, compress=None):
+        # Writes the remote file into fileobj as it arrives, returning the
+        # number of bytes written
+        download_codec = self.choose_codec(compress)
+        if download_codec is None:
+            return self.stream_command('cat ' + remote_path, fileobj)
+        if compress is True:
+            command = download_codec.COMPRESS_COMMAND + ' ' + remote_path
+            return self.stream_command(command, fileobj, download_codec)
+
+        # The cluster decides from the file size, and says which it picked
+        # in the first line
+        command = ('if [ "$(stat -c %s {} 2>/dev/null || echo 0)" -ge {} ]; ' +
+                   'then echo z && {} {}; else echo r && cat {}; fi').format(
+                       remote_path, self.compression_threshold,
+                       download_codec.COMPRESS_COMMAND, remote_path,
+                       remote_path)
+        return self.stream_command(command, fileobj, download_codec, True)
+
+    def stream_command(self, command, fileobj, download_codec=None,
+                       marked=False):
+        stdin, stdout, stderr = self.cluster_account.exec_command(
+            command, 'download', direct=True)
+        if marked and stdout.read(2) != b'z\n':
+            download_codec = None
+        decompressor = None
+        if download_codec is not None:
+            decompressor = download_codec.decompressor()
+
+        size = 0
+        while True:
+            chunk = stdout.read(self.chunk_size)
+            if not chunk:
+                break
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            fileobj.write(chunk)
+            size += len(chunk)
+        if decompressor is not None:
+            chunk = decompressor.flush()
+            fileobj.write(chunk)
+            size += len(chunk)
+
+        if stdout.channel.recv_exit_status() > 0:
+            raise ValueError('Could not download with ' + command)
+        return size
+
+    def download_tar(self, remote_paths, compress=None):
+        # Generator of (remote path, file object) for the remote_paths that
+        # exist, fetched in one tar stream and unpacked as it arrives. Each
+        # file object has to be read before moving on to the next.
+        tar_codec = self.choose_codec(compress)
+        command = 'tar -C / -cf - --ignore-failed-read -T -'
+        if tar_codec is not None:
+            command += ' | ' + tar_codec.COMPRESS_COMMAND
+        stdin, stdout, stderr = self.cluster_account.exec_command(
+            command, 'download', direct=True)
+        # The paths go on stdin, so there is no limit on how many
+        stdin.write(''.join(path.lstrip('/') + '\n'
+                            for path in remote_paths).encode('utf-8'))
+        stdin.flush()
+        stdin.channel.shutdown_write()
+
+        reader = StreamReader(stdout, tar_codec and tar_codec.decompressor(),
+                              self.chunk_size)
+        with tarfile.open(fileobj=reader, mode='r|') as tar:
+            for member in tar:
+                if member.isfile():
+                    yield '/' + member.name, tar.extractfile(member)
+        if stdout.channel.recv_exit_status() > 0:
+            raise ValueError('Could not download with ' + command)
+
+    def read(self, remote_path, compress=None):
+        data = io.BytesIO()
+        self.download(remote_path, data, compress)
+        return data.getvalue()
+
+    def remove_quietly(self, remote_path):
+        try:
+            self.sftp_client().remove(remote_path)
+        except IOError:
+            pass
+
+    def close(self):
+        if self.sftp is not None:
+            self.sftp.close()
+            self.sftp = None
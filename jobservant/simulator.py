@@ -0,0 +1,840 @@
+import fnmatch
+import gzip
+import io
+import json
+import posixpath
+import re
+import shlex
+import tarfile
+import threading
+import time
+from datetime import datetime
+from .remote_agent import RemoteAgent
+
+
+class SimulatedJob:
+    def __init__(self, jobid, work_directory, submit_time, **kwargs):
+        self.jobid = jobid
+        self.array_job_id = kwargs.get('array_job_id', jobid)
+        self.array_task_id = kwargs.get('array_task_id', 'N/A')
+        self.work_directory = work_directory
+        self.account = kwargs.get('account') or 'def-simulated'
+        self.submit_time = submit_time
+        self.start_time = submit_time + kwargs['pending_seconds']
+        self.end_time = self.start_time + kwargs['run_seconds']
+        self.exit_code = kwargs.get('exit_code', 0)
+        self.cancelled = False
+        self.output_written = None
+
+    def state(self, now):
+        if self.cancelled:
+            return 'CANCELLED'
+        if now < self.start_time:
+            return 'PENDING'
+        if now < self.end_time:
+            return 'RUNNING'
+        if self.exit_code != 0:
+            return 'FAILED'
+        return 'COMPLETED'
+
+    def output_filename(self):
+        if self.array_task_id != 'N/A':
+            return 'slurm-{}_{}.out'.format(self.array_job_id,
+                                            self.array_task_id)
+        return 'slurm-{}.out'.format(self.jobid)
+
+
+class SimulatedCluster:
+    # An offline stand-in for a Slurm cluster reached over SSH. It answers
+    # the commands jobservant sends with a simulated filesystem and queue,
+    # on a simulated clock, and counts round trips, bytes and (simulated)
+    # latency per kind of command. Use it with
+    # ClusterAccount(server, client_factory=cluster.client).
+    STATE_CODES = {'PENDING': 'PD', 'RUNNING': 'R', 'COMPLETED': 'CD',
+                   'FAILED': 'F', 'CANCELLED': 'CA'}
+    SACCT_STATES = dict((code, state) for state, code in STATE_CODES.items())
+    SQUEUE_SPECIFIERS = {
+        '%i': 'jobid', '%F': 'array_job_id', '%K': 'array_task_id',
+        '%t': 'st', '%T': 'state', '%V': 'submit_time', '%S': 'start_time',
+        '%e': 'end_time', '%a': 'account', '%P': 'partition',
+        '%N': 'nodelist', '%Z': 'work_dir'
+    }
+    SQUEUE_ALL_FIELDS = ['ACCOUNT', 'FEATURES', 'JOBID', 'ST', 'ARRAY_JOB_ID',
+                         'ARRAY_TASK_ID', 'NODELIST', 'PARTITION',
+                         'START_TIME', 'STATE', 'SUBMIT_TIME', 'END_TIME']
+
+    def __init__(self, **kwargs):
+        self.username = kwargs.get('username', 'simulated')
+        self.workspace = kwargs.get('workspace', '/scratch/' + self.username)
+        # Symlink => target, followed by readlink -f and in the work
+        # directories squeue reports (files are only stored under the paths
+        # used to create them)
+        self.links = kwargs.get('links', {})
+        # Simulated seconds per round trip, and bytes per second
+        self.latency = kwargs.get('latency', 0.05)
+        self.bandwidth = kwargs.get('bandwidth', 10e6)
+        # Simulated seconds to start a shell for a command on a new channel
+        # (opening the channel itself costs another round trip)
+        self.exec_overhead = kwargs.get('exec_overhead', 0.02)
+        # Whether the remote agent can be started
+        self.python3 = kwargs.get('python3', True)
+        # Really sleep for the latency, for wall clock measurements
+        self.sleep = kwargs.get('sleep', False)
+        self.pending_seconds = kwargs.get('pending_seconds', 60.0)
+        self.run_seconds = kwargs.get('run_seconds', 600.0)
+        self.now = kwargs.get('now', time.time())
+
+        # path => contents, directory path => set of paths in it, and
+        # path => modification time
+        self.files = {}
+        self.directories = {'/': set()}
+        self.modified = {}
+        self.make_directory(self.workspace)
+        self.jobs = {}
+        # Array job id => tasks, and the jobs whose output may still change
+        self.arrays = {}
+        self.unsettled = {}
+        self.updated_at = None
+        self.next_jobid = kwargs.get('first_jobid', 1000)
+        self.temp_directories = 0
+        self.lock = threading.RLock()
+        self.reset_stats()
+
+        self.handlers = [
+            (r"^cd (\S+)$", self.cd),
+            (r"^d=\$\(mktemp -d (\S+)\)$", self.mktemp),
+            (r"^test -d (\S+)$", self.test_directory),
+            (r"^mkdir -p (\S+)$", self.mkdir),
+            (r"^rm -rf (.+)$", self.rm),
+            (r"^cat > (\S+)$", self.cat_to_file),
+            (r"^cat (\S+)$", self.cat),
+            (r"^tail -c \+(\d+) (\S+)$", self.tail),
+            (r"^echo \"directory=\$PWD\"$", self.echo_directory),
+            (r"^date --iso-8601=seconds$", self.date),
+            (r"^mv (\S+) (\S+)$", self.mv),
+            (r"^readlink -f (\S+)$", self.readlink),
+            (r"^du -sb( --time --time-style=\+%Y-%m-%dT%H:%M:%S)? (.+)$",
+             self.du),
+            (r"^gzip -dc > (\S+)$", self.gunzip_to_file),
+            (r"^gzip -c (\S+)$", self.gzip),
+            (r"^sbatch (\S+)$", self.sbatch),
+            (r"^squeue (.+)$", self.squeue),
+            (r"^sacct (.+)$", self.sacct),
+            (r"^seff -j (\S+)$", self.seff),
+            (r"^scancel (\S+)$", self.scancel),
+        ]
+
+    def client(self):
+        return SimulatedSSHClient(self)
+
+    def make_directory(self, path):
+        if path not in self.directories:
+            self.make_directory(posixpath.dirname(path))
+            self.directories[path] = set()
+            self.directories[posixpath.dirname(path)].add(path)
+            self.modified[path] = self.now
+
+    def write_file(self, path, contents):
+        self.make_directory(posixpath.dirname(path))
+        self.files[path] = contents
+        self.directories[posixpath.dirname(path)].add(path)
+        self.modified[path] = self.now
+
+    def remove_tree(self, path):
+        if path in self.directories:
+            for child in list(self.directories[path]):
+                self.remove_tree(child)
+            del self.directories[path]
+        elif path in self.files:
+            del self.files[path]
+        else:
+            return
+        self.modified.pop(path, None)
+        self.directories[posixpath.dirname(path)].discard(path)
+
+    def advance(self, seconds):
+        with self.lock:
+            self.now += seconds
+
+    def reset_stats(self):
+        with getattr(self, 'lock', threading.RLock()):
+            # kind => {'commands', 'channels', 'round_trips', 'bytes_out',
+            #          'bytes_in', 'seconds'}
+            self.stats = {}
+
+    def record(self, kind, round_trips, bytes_out, bytes_in, channels=0):
+        seconds = round_trips * self.latency + \
+            channels * (self.latency + self.exec_overhead) + \
+            (bytes_out + bytes_in) / self.bandwidth
+        with self.lock:
+            stat = self.stats.setdefault(kind, {
+                'commands': 0, 'channels': 0, 'round_trips': 0,
+                'bytes_out': 0, 'bytes_in': 0, 'seconds': 0.0})
+            stat['commands'] += 1
+            stat['channels'] += channels
+            stat['round_trips'] += round_trips
+            stat['bytes_out'] += bytes_out
+            stat['bytes_in'] += bytes_in
+            stat['seconds'] += seconds
+        if self.sleep:
+            time.sleep(seconds)
+
+    def totals(self):
+        with self.lock:
+            total = {'commands': 0, 'channels': 0, 'round_trips': 0,
+                     'bytes_out': 0, 'bytes_in': 0, 'seconds': 0.0}
+            for stat in self.stats.values():
+                for key in total:
+                    total[key] += stat[key]
+            return total
+
+    # Commands
+
+    def command_kind(self, command):
+        if command.startswith('if '):
+            return 'fetch'
+        words = command.split(' && ')[-1].split()
+        return words[0] if len(words) > 0 else ''
+
+    def run(self, command, stdin=b'', channels=1):
+        # Returns (exit code, stdout bytes, stderr bytes). Commands run by
+        # the remote agent don't open a channel.
+        with self.lock:
+            code, out, err = self.run_locked(command, stdin)
+        self.record(self.command_kind(command), 1,
+                    len(command) + len(stdin), len(out) + len(err), channels)
+        return code, out, err
+
+    def run_locked(self, command, stdin):
+        self.update_jobs()
+        m = re.match(r"^if \[ \"\$\(stat -c %s (\S+) 2>/dev/null \|\| " +
+                     r"echo 0\)\" -ge (\d+) \]; then echo z && (.+) \S+; " +
+                     r"else echo r && cat \S+; fi$", command)
+        if m is not None:
+            return self.compressed_or_plain(m.group(1), int(m.group(2)))
+        m = re.match(r"^tar -C (\S+) -cf - --ignore-failed-read -T -" +
+                     r"( \| gzip -c)?$", command)
+        if m is not None:
+            return self.tar(m.group(1), stdin, m.group(2) is not None)
+
+        shell = {'cwd': '/', 'env': {}, 'stdin': stdin, 'out': []}
+        for segment in command.split(' && '):
+            for name, value in shell['env'].items():
+                segment = segment.replace('"$%s"' % name, value)
+            code, err = self.run_segment(shell, segment.strip())
+            if code != 0:
+                return code, b''.join(shell['out']), err
+        return 0, b''.join(shell['out']), b''
+
+    def run_segment(self, shell, segment):
+        for regex, handler in self.handlers:
+            m = re.match(regex, segment)
+            if m is not None:
+                return handler(shell, *m.groups())
+        return 127, ('sh: %s: command not found\n' % segment).encode()
+
+    def path(self, shell, path):
+        return posixpath.normpath(posixpath.join(shell['cwd'], path))
+
+    def missing(self, path):
+        return 1, ('%s: No such file or directory\n' % path).encode()
+
+    def cd(self, shell, path):
+        path = self.path(shell, path)
+        if path not in self.directories:
+            return self.missing(path)
+        shell['cwd'] = path
+        return 0, b''
+
+    def mktemp(self, shell, template):
+        self.temp_directories += 1
+        random_length = len(template) - len(template.rstrip('X'))
+        suffix = ('%0' + str(random_length) + 'd') % self.temp_directories
+        path = self.path(shell, template.rstrip('X') + suffix)
+        self.make_directory(path)
+        shell['env']['d'] = path
+        return 0, b''
+
+    def test_directory(self, shell, path):
+        return (0 if self.path(shell, path) in self.directories else 1), b''
+
+    def mkdir(self, shell, path):
+        self.make_directory(self.path(shell, path))
+        return 0, b''
+
+    def rm(self, shell, paths):
+        for path in shlex.split(paths):
+            self.remove_tree(self.path(shell, path))
+        return 0, b''
+
+    def cat_to_file(self, shell, path):
+        self.write_file(self.path(shell, path), shell['stdin'])
+        return 0, b''
+
+    def cat(self, shell, path):
+        path = self.path(shell, path)
+        if path not in self.files:
+            return self.missing(path)
+        shell['out'].append(self.files[path])
+        return 0, b''
+
+    def tail(self, shell, start, path):
+        path = self.path(shell, path)
+        if path not in self.files:
+            return self.missing(path)
+        shell['out'].append(self.files[path][int(start) - 1:])
+        return 0, b''
+
+    def echo_directory(self, shell):
+        shell['out'].append(('directory=%s\n' % shell['cwd']).encode())
+        return 0, b''
+
+    def date(self, shell):
+        shell['out'].append(
+            (self.time_string(self.now) + '-00:00\n').encode())
+        return 0, b''
+
+    def mv(self, shell, source, destination):
+        source = self.path(shell, source)
+        if source not in self.files:
+            return self.missing(source)
+        self.write_file(self.path(shell, destination), self.files[source])
+        self.remove_tree(source)
+        return 0, b''
+
+    def resolve(self, path):
+        for link, target in self.links.items():
+            if path == link or path.startswith(link + '/'):
+                return self.resolve(target + path[len(link):])
+        return path
+
+    def readlink(self, shell, path):
+        path = self.resolve(self.path(shell, path))
+        shell['out'].append((path + '\n').encode())
+        return 0, b''
+
+    def tree_size(self, path):
+        if path in self.files:
+            return len(self.files[path])
+        return sum(self.tree_size(child)
+                   for child in self.directories.get(path, []))
+
+    def tree_modified(self, path):
+        return max([self.modified.get(path, 0)] +
+                   [self.tree_modified(child)
+                    for child in self.directories.get(path, [])])
+
+    def expand(self, shell, pattern):
+        # Shell globbing, of the last path component only
+        path = self.path(shell, pattern)
+        if '*' not in path:
+            return [path]
+        directory = posixpath.dirname(path)
+        matches = sorted(child for child in self.directories.get(directory, [])
+                         if fnmatch.fnmatch(child, path))
+        return matches or [path]
+
+    def du(self, shell, times, patterns):
+        code, err = 0, b''
+        for pattern in shlex.split(patterns):
+            for path in self.expand(shell, pattern):
+                if path not in self.files and path not in self.directories:
+                    code, err = self.missing(path)
+                    continue
+                fields = [str(self.tree_size(path))]
+                if times:
+                    fields.append(self.time_string(self.tree_modified(path)))
+                fields.append(path)
+                shell['out'].append(('\t'.join(fields) + '\n').encode())
+        return code, err
+
+    def gunzip_to_file(self, shell, path):
+        self.write_file(self.path(shell, path),
+                        gzip.decompress(shell['stdin']))
+        return 0, b''
+
+    def gzip(self, shell, path):
+        path = self.path(shell, path)
+        if path not in self.files:
+            return self.missing(path)
+        shell['out'].append(gzip.compress(self.files[path]))
+        return 0, b''
+
+    def compressed_or_plain(self, path, threshold):
+        if path not in self.files:
+            return 1, b'r\n', b''
+        if len(self.files[path]) >= threshold:
+            return 0, b'z\n' + gzip.compress(self.files[path]), b''
+        return 0, b'r\n' + self.files[path], b''
+
+    def tar(self, root, names, compress):
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            for name in names.decode('utf-8').splitlines():
+                path = posixpath.normpath(posixpath.join(root, name))
+                if path not in self.files:
+                    # Skipped with a warning, thanks to --ignore-failed-read
+                    continue
+                info = tarfile.TarInfo(name)
+                info.size = len(self.files[path])
+                info.mtime = self.now
+                tar.addfile(info, io.BytesIO(self.files[path]))
+        data = archive.getvalue()
+        if compress:
+            data = gzip.compress(data)
+        return 0, data, b''
+
+    # Slurm
+
+    def time_string(self, timestamp):
+        return datetime.fromtimestamp(timestamp).isoformat(
+            timespec='seconds')
+
+    def update_jobs(self):
+        # Nothing changes until the clock moves
+        if self.updated_at == self.now:
+            return
+        self.updated_at = self.now
+        for job in list(self.unsettled.values()):
+            self.update_job(job)
+
+    def update_job(self, job):
+        # Output files appear as jobs start and grow as they finish
+        state = job.state(self.now)
+        if state not in ['PENDING', 'RUNNING']:
+            self.unsettled.pop(job.jobid, None)
+        if state == 'PENDING' or job.output_written == state:
+            return
+        if job.cancelled and job.output_written is None:
+            # Cancelled before it started
+            return
+        if job.work_directory in self.directories:
+            path = job.work_directory + '/' + job.output_filename()
+            if job.output_written is None:
+                self.write_file(path, self.files.get(path, b'') +
+                                ('job %s started\n' % job.jobid).encode())
+            if state != 'RUNNING':
+                self.write_file(path, self.files.get(path, b'') +
+                                ('job %s %s\n' %
+                                 (job.jobid, state.lower())).encode())
+        job.output_written = state
+
+    def sbatch(self, shell, path):
+        path = self.path(shell, path)
+        if path not in self.files:
+            return 1, b'sbatch: error: Unable to open file\n'
+        script = self.files[path].decode('utf-8', errors='replace')
+        options = dict(re.findall(r"^#SBATCH --(\w+)=(\S+)$", script,
+                                  re.MULTILINE))
+        jobid = str(self.next_jobid)
+        self.next_jobid += 1
+        settings = {'pending_seconds': self.pending_seconds,
+                    'run_seconds': self.run_seconds,
+                    'account': options.get('account')}
+        if 'array' in options:
+            jobs = [SimulatedJob('%s_%s' % (jobid, task_id), shell['cwd'],
+                                 self.now, array_job_id=jobid,
+                                 array_task_id=task_id, **settings)
+                    for task_id in self.array_task_ids(options['array'])]
+            self.arrays[jobid] = jobs
+        else:
+            jobs = [SimulatedJob(jobid, shell['cwd'], self.now, **settings)]
+        for job in jobs:
+            self.jobs[job.jobid] = job
+            self.unsettled[job.jobid] = job
+            self.update_job(job)
+        shell['out'].append(('Submitted batch job %s\n' % jobid).encode())
+        return 0, b''
+
+    def array_task_ids(self, spec):
+        task_ids = []
+        for part in spec.split('%')[0].split(','):
+            m = re.match(r"^(\d+)(?:-(\d+)(?::(\d+))?)?$", part)
+            first, last, step = m.groups()
+            task_ids += [str(i) for i in range(int(first),
+                                               int(last or first) + 1,
+                                               int(step or 1))]
+        return task_ids
+
+    def find_jobs(self, jobids):
+        jobs = []
+        for jobid in jobids:
+            if jobid in self.jobs:
+                jobs.append(self.jobs[jobid])
+            jobs += self.arrays.get(jobid, [])
+        return jobs
+
+    def job_fields(self, job):
+        state = job.state(self.now)
+        return {
+            'jobid': job.jobid, 'array_job_id': job.array_job_id,
+            'array_task_id': job.array_task_id,
+            'st': self.STATE_CODES[state], 'state': state,
+            'submit_time': self.time_string(job.submit_time),
+            'start_time': self.time_string(job.start_time),
+            'end_time': self.time_string(job.end_time),
+            'account': job.account, 'partition': 'cpu',
+            'nodelist': 'node1' if state == 'RUNNING' else '',
+            'features': '(null)',
+            'work_dir': self.resolve(job.work_directory)
+        }
+
+    def squeue(self, shell, arguments):
+        arguments = shlex.split(arguments)
+        output_format = arguments[arguments.index('-o') + 1]
+        if '-j' in arguments:
+            jobids = arguments[arguments.index('-j') + 1].split(',')
+            jobs = self.find_jobs(jobids)
+        else:
+            # All the (one simulated) user's jobs
+            jobids = []
+            jobs = list(self.jobs.values())
+        jobs = [job for job in jobs
+                if job.state(self.now) in ['PENDING', 'RUNNING']]
+        if len(jobs) == 0 and len(jobids) == 1:
+            return 1, b'slurm_load_jobs error: Invalid job id specified\n'
+
+        lines = []
+        if output_format == '%all':
+            lines.append('|'.join(self.SQUEUE_ALL_FIELDS))
+            for job in jobs:
+                fields = self.job_fields(job)
+                lines.append('|'.join(fields[field.lower()]
+                                      for field in self.SQUEUE_ALL_FIELDS))
+        else:
+            specifiers = re.findall(r"%\w", output_format)
+            for job in jobs:
+                fields = self.job_fields(job)
+                lines.append('|'.join(
+                    fields[self.SQUEUE_SPECIFIERS[specifier]]
+                    for specifier in specifiers))
+        shell['out'].append(''.join(line + '\n' for line in lines).encode())
+        return 0, b''
+
+    def sacct_fields(self, job, step=None):
+        state = job.state(self.now)
+        elapsed = max(0, min(self.now, job.end_time) - job.start_time)
+        return {
+            'JobID': job.jobid + ('.' + step if step else ''),
+            'State': state, 'ExitCode': '%d:0' % job.exit_code,
+            'Elapsed': self.duration(elapsed),
+            'TotalCPU': self.duration(elapsed / 2),
+            'AllocCPUS': '1', 'NNodes': '1',
+            'MaxRSS': '102400K' if step else '', 'ReqMem': '1G',
+            'Submit': self.time_string(job.submit_time),
+            'Start': self.time_string(job.start_time),
+            'End': self.time_string(job.end_time)
+            if state not in ['PENDING', 'RUNNING'] else 'Unknown'
+        }
+
+    def duration(self, seconds):
+        seconds = int(seconds)
+        return '%02d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60,
+                                   seconds % 60)
+
+    def sacct(self, shell, arguments):
+        arguments = shlex.split(arguments)
+        fields = [argument.split('=', 1)[1].split(',')
+                  for argument in arguments
+                  if argument.startswith('--format=')][0]
+        if '-j' in arguments:
+            jobids = arguments[arguments.index('-j') + 1].split(',')
+            jobs = self.find_jobs(jobids)
+        else:
+            jobs = self.window_jobs(arguments)
+        lines = []
+        for job in jobs:
+            rows = [self.sacct_fields(job)]
+            if '-X' not in arguments and self.now >= job.start_time and \
+               job.end_time >= job.start_time:
+                rows.append(self.sacct_fields(job, 'batch'))
+            for row in rows:
+                lines.append('|'.join(row.get(field, '')
+                                      for field in fields) + '\n')
+        shell['out'].append(''.join(lines).encode())
+        return 0, b''
+
+    def window_jobs(self, arguments):
+        # Jobs in one of the -s states at some point between -S and -E
+        start = datetime.fromisoformat(
+            arguments[arguments.index('-S') + 1]).timestamp()
+        end = datetime.fromisoformat(
+            arguments[arguments.index('-E') + 1]).timestamp()
+        end = min(end, self.now)
+        states = set(self.SACCT_STATES.get(code, code) for code in
+                     arguments[arguments.index('-s') + 1].split(','))
+        jobs = []
+        for job in self.jobs.values():
+            state = job.state(self.now)
+            if 'PENDING' in states and job.submit_time <= end and \
+               job.start_time >= start and not job.cancelled:
+                jobs.append(job)
+            elif 'RUNNING' in states and job.start_time <= end and \
+                    job.end_time >= start and not job.cancelled:
+                jobs.append(job)
+            elif state in states and start <= job.end_time <= end:
+                jobs.append(job)
+        return sorted(jobs, key=lambda job: job.end_time)
+
+    def seff(self, shell, jobid):
+        if jobid not in self.jobs:
+            return 1, b'Job not found.\n'
+        job = self.jobs[jobid]
+        fields = self.sacct_fields(job, 'batch')
+        state = job.state(self.now)
+        if state == 'COMPLETED':
+            state += ' (exit code %d)' % job.exit_code
+        shell['out'].append(('Job ID: %s\nState: %s\n' % (jobid, state) +
+                             'CPU Utilized: %s\n' % fields['TotalCPU'] +
+                             'CPU Efficiency: 50.00%% of %s core-walltime\n' %
+                             fields['Elapsed'] +
+                             'Job Wall-clock time: %s\n' % fields['Elapsed'] +
+                             'Memory Utilized: 100.00 MB\n' +
+                             'Memory Efficiency: 9.77% of 1.00 GB\n'
+                             ).encode())
+        return 0, b''
+
+    def scancel(self, shell, jobid):
+        jobs = self.find_jobs([jobid])
+        if len(jobs) == 0:
+            return 1, b'scancel: error: Invalid job id specified\n'
+        for job in jobs:
+            if job.state(self.now) in ['PENDING', 'RUNNING']:
+                job.cancelled = True
+                job.end_time = self.now
+                self.update_job(job)
+        return 0, b''
+
+
+class SimulatedTransport:
+    def __init__(self):
+        self.active = True
+        self.keepalive = None
+
+    def is_active(self):
+        return self.active
+
+    def set_keepalive(self, interval):
+        self.keepalive = interval
+
+
+class SimulatedChannel:
+    # Runs the command the first time its output or exit status is needed,
+    # so anything written to stdin before then is seen by the command
+    def __init__(self, cluster, command):
+        self.cluster = cluster
+        self.command = command
+        self.stdin = io.BytesIO()
+        self.stdout = None
+        self.stderr = None
+        self.exit_status = None
+        self.closed = False
+
+    def run(self):
+        if self.exit_status is None:
+            self.exit_status, out, err = self.cluster.run(
+                self.command, self.stdin.getvalue())
+            self.stdout = io.BytesIO(out)
+            self.stderr = io.BytesIO(err)
+            self.closed = True
+
+    def shutdown_write(self):
+        pass
+
+    def exit_status_ready(self):
+        return self.exit_status is not None
+
+    def recv_exit_status(self):
+        self.run()
+        return self.exit_status
+
+
+class SimulatedAgent:
+    # Speaks the remote agent's protocol, running each request on the
+    # cluster. Serves as the agent's stdin, stdout and their channel.
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.channel = self
+        self.condition = threading.Condition()
+        self.input = b''
+        self.output = RemoteAgent.GREETING
+        self.stderr = io.BytesIO()
+        self.closed = False
+
+    def run(self):
+        pass
+
+    def write(self, data):
+        self.input += data
+        while b'\n' in self.input:
+            line, self.input = self.input.split(b'\n', 1)
+            request = json.loads(line.decode('utf-8'))
+            code, out, err = self.cluster.run(request['command'],
+                                              channels=0)
+            header = json.dumps({'id': request['id'], 'code': code,
+                                 'stdout': len(out), 'stderr': len(err)})
+            with self.condition:
+                self.output += header.encode('utf-8') + b'\n' + out + err
+                self.condition.notify_all()
+
+    def flush(self):
+        pass
+
+    def shutdown_write(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def take(self, size):
+        data, self.output = self.output[:size], self.output[size:]
+        return data
+
+    def read(self, size=-1):
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.closed or (size >= 0 and len(self.output) > 0))
+            return self.take(len(self.output) if size < 0 else size)
+
+    def readline(self):
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.closed or b'\n' in self.output)
+            end = self.output.find(b'\n') + 1 or len(self.output)
+            return self.take(end).decode('utf-8')
+
+    def exit_status_ready(self):
+        return self.closed
+
+    def recv_exit_status(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.closed)
+        return 0
+
+
+class SimulatedStdin:
+    def __init__(self, channel):
+        self.channel = channel
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.channel.stdin.write(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SimulatedChannelFile:
+    # Like paramiko's ChannelFile: read() gives bytes, readlines() strings
+    def __init__(self, channel, stream):
+        self.channel = channel
+        self.stream = stream
+
+    def buffer(self):
+        self.channel.run()
+        return getattr(self.channel, self.stream)
+
+    def read(self, size=-1):
+        return self.buffer().read(size)
+
+    def readline(self):
+        return self.buffer().readline().decode('utf-8')
+
+    def readlines(self):
+        return [line.decode('utf-8') for line in self.buffer().readlines()]
+
+    def __iter__(self):
+        return iter(self.readlines())
+
+
+class SimulatedSSHClient:
+    # Stands in for paramiko.SSHClient
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.transport = None
+
+    def load_system_host_keys(self):
+        pass
+
+    def connect(self, server, **kwargs):
+        self.cluster.record('connect', 3, 0, 0)
+        self.transport = SimulatedTransport()
+
+    def get_transport(self):
+        return self.transport
+
+    def exec_command(self, command):
+        if self.cluster.python3 and RemoteAgent.is_agent_command(command):
+            self.cluster.record('agent', 1, len(command), 0, 1)
+            agent = SimulatedAgent(self.cluster)
+            return agent, agent, SimulatedChannelFile(agent, 'stderr')
+        channel = SimulatedChannel(self.cluster, command)
+        return (SimulatedStdin(channel),
+                SimulatedChannelFile(channel, 'stdout'),
+                SimulatedChannelFile(channel, 'stderr'))
+
+    def open_sftp(self):
+        self.cluster.record('sftp', 1, 0, 0)
+        return SimulatedSFTP(self.cluster)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.active = False
+
+
+class SimulatedSFTPFile(io.BytesIO):
+    def __init__(self, sftp, path):
+        super().__init__()
+        self.sftp = sftp
+        self.path = path
+
+    def set_pipelined(self, pipelined=True):
+        pass
+
+    def close(self):
+        if not self.closed:
+            data = self.getvalue()
+            self.sftp.cluster.record('sftp', 2, len(data), 0)
+            with self.sftp.cluster.lock:
+                self.sftp.cluster.write_file(self.path, data)
+        super().close()
+
+
+class SimulatedSFTP:
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.channel = SimulatedChannel(cluster, None)
+
+    def get_channel(self):
+        return self.channel
+
+    def open(self, path, mode='r'):
+        directory = posixpath.dirname(path)
+        if directory not in self.cluster.directories:
+            raise IOError('No such file')
+        return SimulatedSFTPFile(self, path)
+
+    def posix_rename(self, old_path, new_path):
+        self.cluster.record('sftp', 1, 0, 0)
+        with self.cluster.lock:
+            self.cluster.write_file(new_path, self.cluster.files[old_path])
+            self.cluster.remove_tree(old_path)
+
+    def remove(self, path):
+        self.cluster.record('sftp', 1, 0, 0)
+        with self.cluster.lock:
+            self.cluster.remove_tree(path)
+
+    def getfo(self, path, fileobj):
+        if path not in self.cluster.files:
+            raise IOError('No such file')
+        data = self.cluster.files[path]
+        self.cluster.record('sftp', 3, 0, len(data))
+        fileobj.write(data)
+        return len(data)
+
+    def close(self):
+        self.channel.closed = True
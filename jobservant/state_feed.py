@@ -0,0 +1,92 @@
+from datetime import datetime
+from .has_a_logger import HasALogger
+
+
+class StateFeed(HasALogger):
+    # Jobs that changed state since the last poll, from one sacct query over
+    # just that time window, so polling costs grow with the number of
+    # changes rather than the number of jobs watched. Unlike an empty squeue
+    # result, sacct says how a job ended (COMPLETED, FAILED, TIMEOUT, ...).
+    SACCT_FIELDS = ['JobID', 'State', 'ExitCode', 'End']
+    # sacct's abbreviations of the states reported by default, all of which
+    # are final
+    STATES = {'COMPLETED': 'CD', 'FAILED': 'F', 'TIMEOUT': 'TO',
+              'OUT_OF_MEMORY': 'OOM', 'CANCELLED': 'CA', 'NODE_FAIL': 'NF',
+              'BOOT_FAIL': 'BF', 'DEADLINE': 'DL', 'PREEMPTED': 'PR'}
+    # Also accepted, but sacct reports jobs in these states at any point in
+    # the window, not only those entering them
+    OTHER_STATES = {'PENDING': 'PD', 'RUNNING': 'R', 'SUSPENDED': 'S',
+                    'REQUEUED': 'RQ'}
+    # Seconds each window reaches back into the previous one, for accounting
+    # records written late
+    OVERLAP = 60.0
+    TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+    def __init__(self, cluster_account, **kwargs):
+        self.cluster_account = cluster_account
+        self.states = kwargs.get('states') or list(self.STATES)
+        for state in self.states:
+            if state not in self.STATES and state not in self.OTHER_STATES:
+                raise ValueError('Unknown job state ' + state)
+        self.overlap = kwargs.get('overlap', self.OVERLAP)
+        # Remote timestamp the next window starts at, by default when the
+        # feed is first polled
+        self.since = kwargs.get('since')
+        # jobid => (state, remote timestamp last seen), to report each
+        # change once across overlapping windows
+        self.seen = {}
+        self.init_logging(**dict(cluster_account.logging_options(),
+                                 **kwargs))
+
+    def time_string(self, timestamp):
+        return datetime.fromtimestamp(timestamp).strftime(self.TIME_FORMAT)
+
+    def command(self, start, end):
+        codes = [self.STATES.get(state) or self.OTHER_STATES[state]
+                 for state in self.states]
+        return 'sacct -X -P -n -u %s -S %s -E %s -s %s --format=%s' % \
+            (self.cluster_account.username, self.time_string(start),
+             self.time_string(end), ','.join(codes),
+             ','.join(self.SACCT_FIELDS))
+
+    def poll(self, jobids=None):
+        # Returns a hash of jobid => {'state', 'exit_code', 'end'} for jobs
+        # (only those in jobids, if set) whose state changed since the last
+        # poll. Array tasks are keyed jobid_taskid.
+        now = self.cluster_account.remote_now()
+        if self.since is None:
+            self.since = now
+        start = self.since - self.overlap
+        stdin, stdout, stderr = self.cluster_account.exec_command(
+            self.command(start, now))
+        out = stdout.readlines()
+        if stdout.channel.recv_exit_status() > 0:
+            raise ValueError('sacct failed: ' +
+                             stderr.read().decode('utf-8', errors='replace'))
+        self.log('debug', lambda: 'sacct output:\n' + ''.join(out))
+        self.since = now
+
+        wanted = None if jobids is None else set(jobids)
+        changes = {}
+        for line in out:
+            fields = line.rstrip('\n').split('|')
+            if len(fields) != len(self.SACCT_FIELDS):
+                continue
+            row = dict(zip(self.SACCT_FIELDS, fields))
+            jobid = row['JobID']
+            state = row['State'].split()[0]
+            if wanted is not None and jobid not in wanted and \
+               jobid.split('_')[0] not in wanted:
+                continue
+            previous = self.seen.get(jobid)
+            self.seen[jobid] = (state, now)
+            if previous is not None and previous[0] == state:
+                continue
+            changes[jobid] = {'state': state,
+                              'exit_code': row['ExitCode'].split(':')[0],
+                              'end': row['End']}
+
+        # Nothing seen before this window can be reported twice
+        self.seen = dict((jobid, seen) for jobid, seen in self.seen.items()
+                         if seen[1] >= start)
+        return changes
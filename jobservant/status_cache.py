@@ -0,0 +1,157 @@
+import threading
+import time
+from .has_a_logger import HasALogger
+
+
+class StatusCache(HasALogger):
+    # Shares squeue results between callers for ttl seconds. Callers asking
+    # for stale jobs at the same time are served by one squeue call.
+    STATES = {'PD': 'waiting', 'R': 'running', 'CG': 'running'}
+    # Seconds a job no one asks about is remembered, so that a long-lived
+    # cache (the daemon's) doesn't grow with every job it has ever seen
+    EXPIRY = 3600.0
+
+    def __init__(self, cluster_account, ttl, **kwargs):
+        self.cluster_account = cluster_account
+        self.ttl = ttl
+        self.expiry = max(kwargs.get('expiry', self.EXPIRY), ttl)
+        self.expired_at = time.monotonic()
+        # jobid => (fetched at, arrays expanded, hash of jobid => fields)
+        self.entries = {}
+        # jobid => state, for jobs and array tasks seen so far
+        self.states = {}
+        self.subscribers = []
+        # Jobs waiting for a query, as an ordered set
+        self.wanted = {}
+        self.wanted_expanded = False
+        self.lock = threading.Lock()
+        self.query_lock = threading.Lock()
+        self.init_logging(**dict(cluster_account.logging_options(),
+                                 **kwargs))
+
+    def is_fresh(self, jobid, expand_arrays, now):
+        # you are holding the lock
+        entry = self.entries.get(jobid)
+        return entry is not None and now - entry[0] < self.ttl and \
+            (entry[1] or not expand_arrays)
+
+    def stale_jobids(self, jobids, expand_arrays):
+        # you are holding the lock
+        now = time.monotonic()
+        return [jobid for jobid in jobids
+                if not self.is_fresh(jobid, expand_arrays, now)]
+
+    def queue_status_hashes(self, jobids, expand_arrays=False):
+        with self.lock:
+            stale = self.stale_jobids(jobids, expand_arrays)
+            asked_at = time.monotonic()
+            self.wanted.update(dict.fromkeys(stale))
+            self.wanted_expanded = self.wanted_expanded or \
+                (expand_arrays and len(stale) > 0)
+        while True:
+            if len(stale) > 0:
+                with self.query_lock:
+                    # Whoever gets here first queries for everyone waiting
+                    with self.lock:
+                        query_jobids = list(self.wanted)
+                        query_expanded = self.wanted_expanded
+                        self.wanted = {}
+                        self.wanted_expanded = False
+                    if len(query_jobids) > 0:
+                        self.refresh(query_jobids, query_expanded)
+            with self.lock:
+                # Stale jobs not queried since we asked (their query failed)
+                # and jobs invalidated meanwhile are asked for again
+                was_stale = set(stale)
+                stale = [jobid for jobid in jobids
+                         if jobid not in self.entries or
+                         (jobid in was_stale and
+                          self.entries[jobid][0] < asked_at)]
+                if len(stale) == 0:
+                    output_hash = {}
+                    for jobid in jobids:
+                        output_hash.update(self.entries[jobid][2])
+                    return output_hash
+                self.wanted.update(dict.fromkeys(stale))
+                self.wanted_expanded = self.wanted_expanded or expand_arrays
+
+    def refresh(self, jobids, expand_arrays):
+        fetched_at = time.monotonic()
+        queue_status = self.cluster_account.query_queue_status_hashes(
+            jobids, expand_arrays)
+
+        # Array tasks (jobid_taskid) are filed under their job
+        by_job = dict((jobid, {}) for jobid in jobids)
+        for key, fields in queue_status.items():
+            jobid = key.split('_')[0]
+            if jobid in by_job:
+                by_job[jobid][key] = fields
+
+        transitions = []
+        with self.lock:
+            for jobid, job_status in by_job.items():
+                previous = self.entries.get(jobid)
+                self.entries[jobid] = (fetched_at, expand_arrays, job_status)
+                keys = set(job_status)
+                if previous is not None:
+                    keys.update(previous[2])
+                if len(keys) == 0:
+                    keys.add(jobid)
+                for key in keys:
+                    state = 'finished'
+                    if key in job_status:
+                        state = self.STATES.get(job_status[key]['ST'],
+                                                job_status[key]['ST'])
+                    old_state = self.states.get(key)
+                    if old_state != state:
+                        self.states[key] = state
+                        transitions.append((key, old_state, state))
+            if fetched_at - self.expired_at >= self.expiry:
+                self.expire(fetched_at)
+        self.notify(transitions)
+
+    def expire(self, now):
+        # you are holding the lock
+        self.expired_at = now
+        expired = set(jobid for jobid, entry in self.entries.items()
+                      if now - entry[0] > self.expiry)
+        if len(expired) == 0:
+            return
+        self.log('debug', 'Forgetting %d jobs', len(expired))
+        for jobid in expired:
+            del self.entries[jobid]
+        self.states = dict((key, state) for key, state in self.states.items()
+                           if key.split('_')[0] not in expired)
+
+    def invalidate(self, jobids=None):
+        with self.lock:
+            if jobids is None:
+                self.entries = {}
+            for jobid in jobids or []:
+                self.entries.pop(jobid, None)
+
+    def subscribe(self, callback, jobids=None):
+        # callback(jobid, old_state, new_state) is called when a job (or
+        # array task) is seen changing state, e.g. waiting -> running.
+        # old_state is None the first time a job is seen.
+        subscriber = (callback, None if jobids is None else set(jobids))
+        with self.lock:
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def notify(self, transitions):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for jobid, old_state, new_state in transitions:
+            for callback, jobids in subscribers:
+                if jobids is None or jobid in jobids or \
+                   jobid.split('_')[0] in jobids:
+                    try:
+                        callback(jobid, old_state, new_state)
+                    except Exception as e:
+                        self.log('info', 'Status subscriber failed: %s', e)
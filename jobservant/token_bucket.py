@@ -0,0 +1,32 @@
+import threading
+import time
+
+
+class TokenBucket:
+    # Allows rate acquisitions per second on average, with bursts of up to
+    # capacity acquisitions
+    def __init__(self, rate, capacity=1):
+        if rate <= 0:
+            raise ValueError('Rate must be positive')
+        self.rate = float(rate)
+        self.capacity = float(max(capacity, 1))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        # Blocks until a token is available
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,126 @@
+import io
+from jobservant.cluster_account import ClusterAccount
+
+
+class FakeChannel:
+    def __init__(self, code):
+        self.code = code
+
+    def recv_exit_status(self):
+        return self.code
+
+
+class FakeStream(io.BytesIO):
+    # Like paramiko's ChannelFile: read() gives bytes, readlines() strings
+    def __init__(self, text, code=0):
+        if isinstance(text, str):
+            text = text.encode('utf-8')
+        super().__init__(text)
+        self.channel = FakeChannel(code)
+
+    def readlines(self):
+        return [line.decode('utf-8') for line in super().readlines()]
+
+
+class FakeStdin(io.BytesIO):
+    def __init__(self):
+        super().__init__()
+        self.channel = self
+
+    def shutdown_write(self):
+        pass
+
+
+class FakeClusterAccount(ClusterAccount):
+    # Answers commands from a hash of command prefix => output, where the
+    # output can also be a function of the command returning (output, code)
+    def __init__(self, outputs, **kwargs):
+        kwargs.setdefault('log_level', 'none')
+        super().__init__('some.cluster', **kwargs)
+        self.outputs = outputs
+        self.commands = []
+        self.stdins = []
+
+    def connect(self):
+        if self.ssh is None:
+            self.ssh = FakeSSHClient()
+
+    def open_sftp(self):
+        self.connect()
+        return self.ssh.open_sftp()
+
+    def exec_command(self, command, kind=None, direct=False):
+        self.commands.append(command)
+        output, code = '', 0
+        for prefix in self.outputs:
+            if command.startswith(prefix):
+                output = self.outputs[prefix]
+        if callable(output):
+            output, code = output(command)
+        stdin = FakeStdin()
+        self.stdins.append(stdin)
+        return stdin, FakeStream(output, code), FakeStream('')
+
+
+class FakeSFTPFile(io.BytesIO):
+    def __init__(self, sftp, path):
+        super().__init__()
+        self.sftp = sftp
+        self.path = path
+
+    def set_pipelined(self, pipelined=True):
+        pass
+
+    def close(self):
+        self.sftp.files[self.path] = self.getvalue()
+        super().close()
+
+
+class FakeSFTP:
+    def __init__(self):
+        self.files = {}
+        self.opened = 0
+        self.channel = FakeChannel(0)
+        self.channel.closed = False
+
+    def get_channel(self):
+        return self.channel
+
+    def open(self, path, mode='r'):
+        self.opened += 1
+        return FakeSFTPFile(self, path)
+
+    def getfo(self, path, fileobj):
+        if path not in self.files:
+            raise IOError('No such file')
+        fileobj.write(self.files[path])
+        return len(self.files[path])
+
+    def posix_rename(self, old_path, new_path):
+        self.files[new_path] = self.files.pop(old_path)
+
+    def remove(self, path):
+        self.files.pop(path, None)
+
+    def close(self):
+        pass
+
+
+class FakeSSHClient:
+    def __init__(self):
+        self.sftp_sessions = 0
+
+    def open_sftp(self):
+        self.sftp_sessions += 1
+        return FakeSFTP()
+
+
+def simulated_account(cluster, **kwargs):
+    # A ClusterAccount on a SimulatedCluster, submitting with one command
+    # and querying squeue afresh for every status (tests move the simulated
+    # clock), with kwargs for the options under test
+    options = {'username': cluster.username, 'workspace': cluster.workspace,
+               'client_factory': cluster.client, 'fast_submit': True,
+               'status_cache_ttl': 0, 'log_level': 'none'}
+    options.update(kwargs)
+    return ClusterAccount('simulated.cluster', **options)
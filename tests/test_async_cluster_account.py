@@ -0,0 +1,36 @@
+import asyncio
+from fake_ssh import FakeClusterAccount
+from jobservant.async_cluster_account import AsyncClusterAccount
+
+
+class TestAsyncClusterAccount:
+    def setup_method(self):
+        self.cluster_account = FakeClusterAccount({
+            'cd /scratch/me': 'directory=/scratch/me/cluster_job_a\n' +
+            'Submitted batch job 5\n',
+            'squeue': '5|5|N/A|CG|COMPLETING|N/A|N/A|N/A|def-me|cpu|n1\n',
+            'echo': 'hello\n',
+        }, workspace='/scratch/me', fast_submit=True)
+        self.account = AsyncClusterAccount(
+            cluster_account=self.cluster_account)
+
+    def teardown_method(self):
+        self.account.close()
+
+    def test_run(self):
+        code, out, err = asyncio.run(self.account.run('echo hello'))
+        assert (code, out, err) == (0, b'hello\n', b'')
+
+    def test_submit_and_status(self):
+        async def submit_and_poll():
+            jobs = await asyncio.gather(*[
+                self.account.submit_job(text='echo hi\n', account='def-me')
+                for i in range(3)])
+            return jobs, await self.account.statuses(jobs)
+
+        jobs, statuses = asyncio.run(submit_and_poll())
+        assert [job.jobid for job in jobs] == ['5', '5', '5']
+        assert [stat['status'] for stat in statuses] == ['running'] * 3
+        squeue_commands = [command for command in self.cluster_account.commands
+                           if command.startswith('squeue')]
+        assert len(squeue_commands) == 1
@@ -1,3 +1,6 @@
+import logging
+from datetime import datetime
+from fake_ssh import FakeClusterAccount
 from jobservant.cluster_account import ClusterAccount
 
 
@@ -26,3 +29,50 @@ class TestClusterAccount:
 
         captured = capsys.readouterr()
         assert captured.out == ""
+
+    def test_clock_offset_is_cached(self):
+        cluster_account = FakeClusterAccount({
+            'date': '2000-01-01T00:00:00-07:00\n'
+        })
+        offset = cluster_account.clock_offset()
+        assert cluster_account.clock_offset() == offset
+        assert cluster_account.commands == ['date --iso-8601=seconds']
+
+        remote_now = datetime(2000, 1, 1).timestamp()
+        assert abs(cluster_account.remote_now() - remote_now) < 5.0
+
+    def test_clock_offset_refresh(self):
+        cluster_account = FakeClusterAccount({
+            'date': '2000-01-01T00:00:00-07:00\n'
+        }, clock_offset_refresh=0.0)
+        cluster_account.clock_offset()
+        cluster_account.clock_offset()
+        assert len(cluster_account.commands) == 2
+
+    def test_lazy_log_messages(self, capsys):
+        cluster_account = ClusterAccount('some.cluster', log_level='info')
+        calls = []
+
+        def message():
+            calls.append(1)
+            return 'built'
+
+        cluster_account.log('debug', message)
+        cluster_account.log('debug', 'not %s', 'formatted')
+        assert calls == []
+        cluster_account.log('info', message)
+        cluster_account.log('info', '%d%%', 50)
+        assert calls == [1]
+        assert capsys.readouterr().out == "INFO: built\nINFO: 50%\n"
+
+    def test_logging_module_bridge(self, caplog, capsys):
+        cluster_account = ClusterAccount('some.cluster', log_level='debug',
+                                         logger='jobservant.test')
+        collection = cluster_account.create_job_collection()
+        with caplog.at_level(logging.INFO, logger='jobservant.test'):
+            collection.log('info', 'to %s', 'logging')
+            collection.log('debug', 'filtered out by the logger')
+        assert [(r.name, r.levelname, r.getMessage())
+                for r in caplog.records] == \
+            [('jobservant.test', 'INFO', 'to logging')]
+        assert capsys.readouterr().out == ""
@@ -0,0 +1,136 @@
+import pytest
+from fake_ssh import FakeClusterAccount, FakeSSHClient
+from jobservant.cluster_job import ClusterJob
+
+
+class FakeOutputFile:
+    def __init__(self):
+        self.data = b''
+
+    def tail(self, command):
+        if len(self.data) == 0:
+            return '', 1
+        start = int(command.split()[2][1:]) - 1
+        return self.data[start:], 0
+
+
+class TestClusterJob:
+    def setup_method(self):
+        self.output_file = FakeOutputFile()
+        self.cluster_account = FakeClusterAccount({
+            'tail': self.output_file.tail,
+        })
+        self.job = ClusterJob(cluster_account=self.cluster_account,
+                              text='echo hi\n')
+        self.job.jobid = '42'
+        self.job.work_directory = '/scratch/cluster_job_x'
+
+    def test_tail_output_missing_file(self):
+        assert self.job.tail_output(0) == (b'', 0)
+        assert self.cluster_account.commands == [
+            'tail -c +1 /scratch/cluster_job_x/slurm-42.out'
+        ]
+
+    def test_new_output_only_returns_new_text(self):
+        self.output_file.data = b'first\n'
+        assert self.job.new_output() == 'first\n'
+        assert self.job.new_output() == ''
+        self.output_file.data += 'second é\n'.encode('utf-8')
+        assert self.job.new_output() == 'second é\n'
+        assert self.cluster_account.commands[-1] == \
+            'tail -c +7 /scratch/cluster_job_x/slurm-42.out'
+
+    def test_new_output_split_character(self):
+        data = 'é'.encode('utf-8')
+        self.output_file.data = data[:1]
+        assert self.job.new_output() == ''
+        self.output_file.data = data + b'\xff'
+        assert self.job.new_output(final=True) == 'é�'
+
+    def test_fast_submit_is_one_command(self):
+        cluster_account = FakeClusterAccount({
+            'cd /scratch/me': 'directory=/scratch/me/cluster_job_abc\n' +
+            'Submitted batch job 1234\n'
+        }, workspace='/scratch/me', fast_submit=True)
+        job = cluster_account.submit_job(text='echo hi\n', account='def-me')
+
+        assert len(cluster_account.commands) == 1
+        assert 'mktemp -d cluster_job_' in cluster_account.commands[0]
+        assert cluster_account.stdins[0].getvalue() == \
+            b'#!/bin/sh\n#SBATCH --account=def-me\necho hi\n'
+        assert job.jobid == '1234'
+        assert job.work_directory == '/scratch/me/cluster_job_abc'
+        assert job.submit_script_path == \
+            '/scratch/me/cluster_job_abc/job_submit.sh'
+
+    def test_fast_submit_failure(self):
+        cluster_account = FakeClusterAccount({
+            'cd /scratch/me': 'directory=/scratch/me/cluster_job_abc\n'
+        }, workspace='/scratch/me')
+        job = ClusterJob(cluster_account=cluster_account, text='echo hi\n',
+                         account='def-me')
+        try:
+            job.submit(fast=True)
+            assert False
+        except ValueError:
+            pass
+        assert job.jobid is None
+        assert job.work_directory == '/scratch/me/cluster_job_abc'
+
+    def test_array_task_ids(self):
+        job = ClusterJob(cluster_account=self.cluster_account, text='',
+                         account='def-me', array='1,3,10-16:3%2')
+        assert job.task_ids() == ['1', '3', '10', '13', '16']
+        assert '#SBATCH --array=1,3,10-16:3%2\n' in \
+            job.construct_submit_file_contents()
+
+    def test_array_task_statuses(self):
+        header = 'JOBID|ARRAY_JOB_ID|ARRAY_TASK_ID|ST|START_TIME|' + \
+            'SUBMIT_TIME|END_TIME\n'
+        cluster_account = FakeClusterAccount({
+            'squeue': header +
+            '7_1|7|1|CG|N/A|N/A|N/A\n' +
+            '7_2|7|2|PD|N/A|N/A|N/A\n'
+        }, squeue_format='all')
+        job = ClusterJob(cluster_account=cluster_account, text='',
+                         array='0-2')
+        job.jobid = '7'
+
+        stat = job.status()
+        assert cluster_account.commands == ['squeue -j 7 -o "%all" -r']
+        assert stat['status'] == 'running'
+        assert stat['tasks'] == {'finished': 1, 'running': 1, 'waiting': 1}
+        assert stat['done'] == 2.0 / 3.0
+
+        statuses = job.task_statuses()
+        assert statuses['0']['status'] == 'finished'
+        assert statuses['2']['jobid'] == '7_2'
+        assert statuses['2']['status'] == 'waiting'
+        assert job.output_filename('2') == 'slurm-7_2.out'
+
+    def test_array_staging(self):
+        numpy = pytest.importorskip('numpy')
+        self.cluster_account.ssh = FakeSSHClient()
+        sftp = self.cluster_account.remote_transfer().sftp_client()
+        self.cluster_account.outputs['cat '] = \
+            lambda command: (sftp.files[command[4:]], 0)
+        array = numpy.arange(12, dtype=numpy.float64).reshape(3, 4).T
+
+        self.job.upload_array('points', array)
+        assert '/scratch/cluster_job_x/points.npy' in sftp.files
+
+        fetched = self.job.fetch_array('points')
+        assert numpy.array_equal(fetched, array)
+        assert not isinstance(fetched, numpy.memmap)
+
+        mapped = self.job.fetch_array('points.npy', mmap=True)
+        assert isinstance(mapped, numpy.memmap)
+        assert numpy.array_equal(mapped, array)
+
+        # dtypes the buffer protocol can't export
+        for dtype in ['datetime64[s]', 'timedelta64[ms]']:
+            array = numpy.arange(6).astype(dtype).reshape(2, 3)
+            self.job.upload_array('times', array)
+            fetched = self.job.fetch_array('times')
+            assert fetched.dtype == array.dtype
+            assert numpy.array_equal(fetched, array)
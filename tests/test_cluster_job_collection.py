@@ -0,0 +1,125 @@
+import threading
+from fake_ssh import FakeClusterAccount, simulated_account
+from jobservant.simulator import SimulatedCluster
+
+
+SQUEUE_HEADER = 'JOBID|FEATURES|ST|START_TIME|SUBMIT_TIME|END_TIME\n'
+
+
+class FakeJob:
+    def __init__(self, jobid):
+        self.jobid = jobid
+
+    def status(self):
+        return {'status': 'not_submitted'}
+
+    def is_array(self):
+        return False
+
+    def status_from_queue_statuses(self, queue_statuses):
+        return queue_statuses.get(self.jobid, {})
+
+
+class TestClusterJobCollection:
+    def test_single_squeue_call(self):
+        cluster_account = FakeClusterAccount({
+            'squeue': SQUEUE_HEADER +
+            '12|(null)|R|N/A|N/A|N/A\n' +
+            '13|a|b|PD|N/A|N/A|N/A\n'}, squeue_format='all')
+        collection = cluster_account.create_job_collection(
+            [FakeJob('12'), FakeJob('13'), FakeJob('14'), FakeJob(None)])
+
+        statuses = collection.statuses()
+        assert cluster_account.commands == ['squeue -j 12,13,14 -o "%all"']
+        assert statuses[0]['ST'] == 'R'
+        assert statuses[0]['FEATURES'] == '(null)'
+        assert statuses[1]['ST'] == 'PD'
+        assert statuses[1]['FEATURES'] == 'a|b'
+        assert statuses[2] == {}
+        assert statuses[3] == {'status': 'not_submitted'}
+
+    def test_empty_collection(self):
+        cluster_account = FakeClusterAccount({})
+        collection = cluster_account.create_job_collection()
+        assert collection.statuses() == []
+        assert cluster_account.commands == []
+
+    def test_submit_many(self):
+        lock = threading.Lock()
+        submitted = []
+
+        def fast_submit(command):
+            with lock:
+                submitted.append(command)
+                jobid = len(submitted)
+            reply = 'directory=/scratch/me/cluster_job_%d\n' % jobid
+            if jobid % 3 > 0:
+                reply += 'Submitted batch job %d\n' % jobid
+            return reply, 0
+
+        cluster_account = FakeClusterAccount({'cd /scratch/me': fast_submit},
+                                             workspace='/scratch/me')
+        specs = [{'text': 'echo %d\n' % i, 'account': 'def-me'}
+                 for i in range(10)]
+        collection = cluster_account.submit_many(specs, max_concurrency=4)
+
+        assert len(collection) == 10
+        assert len(submitted) == 10
+        assert len(collection.failed()) == 3
+        assert len(collection.succeeded()) == 7
+        for job in collection.failed():
+            assert isinstance(collection.errors[job], ValueError)
+
+    def test_submit_many_with_bad_specs(self, tmp_path):
+        cluster_account = FakeClusterAccount(
+            {'cd /scratch/me': 'directory=/scratch/me/cluster_job_1\n'
+                               'Submitted batch job 1\n'},
+            workspace='/scratch/me', log_level='none')
+        specs = [{'text': 'echo 0\n', 'account': 'def-me'},
+                 {'account': 'def-me'},
+                 {'script': str(tmp_path / 'missing.sh'),
+                  'account': 'def-me'},
+                 {'text': 'echo 3\n', 'account': 'def-me'}]
+        collection = cluster_account.submit_many(specs)
+
+        assert len(collection) == 4
+        assert collection.failed() == collection.jobs[1:3]
+        assert collection.succeeded() == [collection.jobs[0],
+                                          collection.jobs[3]]
+        assert isinstance(collection.errors[collection.jobs[1]], ValueError)
+        assert isinstance(collection.errors[collection.jobs[2]], OSError)
+        assert collection.jobs[3].text == 'echo 3\n'
+
+    def test_fetch_files_in_one_stream(self, tmp_path):
+        cluster = SimulatedCluster(pending_seconds=10, run_seconds=100)
+        cluster_account = simulated_account(cluster)
+        specs = [{'text': 'echo %d\n' % i, 'account': 'def-me'}
+                 for i in range(20)]
+        specs.append({'text': 'echo task\n', 'account': 'def-me',
+                      'array': '1-2'})
+        collection = cluster_account.submit_many(specs)
+        cluster.advance(200)
+        cluster_account.measure_clock_offset()
+        cluster.reset_stats()
+
+        outputs = collection.fetch_files(compress=True)
+        assert cluster.totals()['round_trips'] == 2
+        assert len(outputs) == 21
+        # Submitted concurrently, so in no particular jobid order
+        first = collection.jobs[0].jobid
+        array = collection.jobs[-1].jobid
+        assert outputs[first] == {
+            'slurm-%s.out' % first:
+            'job %s started\njob %s completed\n' % (first, first)}
+        assert sorted(outputs[array]) == ['slurm-%s_1.out' % array,
+                                          'slurm-%s_2.out' % array]
+
+        paths = collection.fetch_files(['job_submit.sh', 'missing.txt'],
+                                       directory=str(tmp_path),
+                                       only_finished=False)
+        jobid = collection.jobs[3].jobid
+        path = paths[jobid]['job_submit.sh']
+        assert path == str(tmp_path / jobid / 'job_submit.sh')
+        with open(path) as local_file:
+            assert local_file.read().endswith('echo 3\n')
+        assert 'missing.txt' not in paths[jobid]
@@ -0,0 +1,40 @@
+from fake_ssh import simulated_account
+from jobservant.cluster_account import ClusterAccount
+from jobservant.command_stats import CommandStats
+from jobservant.simulator import SimulatedCluster
+
+
+class TestCommandStats:
+    def test_command_kind(self):
+        assert CommandStats.command_kind('squeue -h -j 1') == 'squeue'
+        assert CommandStats.command_kind('cd /a && sbatch job.sh') == 'sbatch'
+        assert CommandStats.command_kind(
+            'cd /a && d=$(mktemp -d x) && cd "$d" && cat > x') == 'cat'
+        assert CommandStats.command_kind('') == ''
+
+    def test_account_statistics(self):
+        cluster = SimulatedCluster()
+        account = simulated_account(
+            cluster, status_cache_ttl=ClusterAccount.STATUS_CACHE_TTL)
+        job = account.submit_job(text='echo hi\n', account='def-me')
+        job.status()
+        account.simple_exec('test -d /nowhere')
+        cluster.advance(cluster.pending_seconds + cluster.run_seconds)
+        account.status_cache.invalidate()
+        output = job.fetch_output()
+
+        stats = account.command_statistics()
+        assert set(stats) == set(['sbatch', 'squeue', 'date', 'test',
+                                  'download'])
+        assert stats['sbatch']['count'] == 1
+        assert stats['sbatch']['exit_codes'] == {0: 1}
+        assert stats['sbatch']['bytes_out'] > len('#!/bin/sh\n')
+        assert stats['test']['exit_codes'] == {1: 1}
+        assert stats['squeue']['count'] == 2
+        assert stats['download']['bytes_in'] == len(output)
+        histogram = stats['squeue']['histogram']
+        assert histogram[-1][0] == float('inf')
+        assert sum(count for bound, count in histogram) == 2
+
+        account.reset_command_statistics()
+        assert account.command_statistics() == {}
@@ -0,0 +1,118 @@
+import paramiko
+import threading
+from jobservant.cluster_account import ClusterAccount
+
+
+class PoolChannel:
+    def __init__(self):
+        self.closed = False
+
+
+class PoolStream:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class PoolTransport:
+    def __init__(self):
+        self.active = True
+        self.keepalive = None
+
+    def is_active(self):
+        return self.active
+
+    def set_keepalive(self, interval):
+        self.keepalive = interval
+
+
+class PoolClient:
+    # Stand in for paramiko.SSHClient, refusing sessions past server_limit
+    instances = []
+    server_limit = 100
+    lock = threading.Lock()
+
+    def __init__(self):
+        self.transport = PoolTransport()
+        self.channels = []
+        with self.lock:
+            self.instances.append(self)
+
+    def load_system_host_keys(self):
+        pass
+
+    def connect(self, server, username=None):
+        self.server = server
+
+    def get_transport(self):
+        return self.transport
+
+    def exec_command(self, command):
+        open_channels = [channel for channel in self.channels
+                         if not channel.closed]
+        if len(open_channels) >= self.server_limit:
+            raise paramiko.ChannelException(1, 'Administratively prohibited')
+        channel = PoolChannel()
+        self.channels.append(channel)
+        stream = PoolStream(channel)
+        return stream, stream, stream
+
+    def close(self):
+        self.transport.active = False
+
+
+class TestConnectionPool:
+    def setup_method(self):
+        PoolClient.instances = []
+        PoolClient.server_limit = 100
+
+    def make_account(self, **kwargs):
+        return ClusterAccount('some.cluster', log_level='none',
+                              client_factory=PoolClient,
+                              reconnect_backoff=0.0, instrument=False,
+                              **kwargs)
+
+    def test_keepalive_and_reuse(self):
+        account = self.make_account(keepalive=15)
+        account.exec_command('true')
+        account.exec_command('true')
+        assert len(PoolClient.instances) == 1
+        assert PoolClient.instances[0].transport.keepalive == 15
+
+    def test_sessions_spill_to_second_connection(self):
+        account = self.make_account(max_sessions=2, pool_size=2)
+        streams = [account.exec_command('true') for i in range(4)]
+        assert len(PoolClient.instances) == 2
+        assert [len(client.channels) for client in PoolClient.instances] == \
+            [2, 2]
+
+        # A fifth command has to wait for a channel to close
+        finished = threading.Event()
+
+        def run():
+            account.exec_command('true')
+            finished.set()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        assert not finished.wait(0.2)
+        streams[0][1].channel.closed = True
+        assert finished.wait(2.0)
+        thread.join()
+
+    def test_reconnect_after_drop(self):
+        account = self.make_account()
+        account.exec_command('true')
+        PoolClient.instances[0].transport.active = False
+        account.exec_command('true')
+        assert len(PoolClient.instances) == 2
+        assert len(PoolClient.instances[1].channels) == 1
+
+    def test_server_session_limit(self):
+        PoolClient.server_limit = 1
+        account = self.make_account(pool_size=2)
+        account.exec_command('true')
+        account.exec_command('true')
+        pool = account.connection_pool()
+        assert pool.session_limits[0] == 1
+        assert [len(client.channels) for client in PoolClient.instances] == \
+            [1, 1]
@@ -0,0 +1,97 @@
+import threading
+from fake_ssh import simulated_account
+from jobservant.daemon import JobservantDaemon
+from jobservant.simulator import SimulatedCluster
+
+
+class TestDaemon:
+    def setup_method(self, method):
+        self.cluster = SimulatedCluster(pending_seconds=10, run_seconds=100)
+        self.daemon = None
+
+    def teardown_method(self, method):
+        if self.daemon is not None:
+            self.daemon.stop()
+
+    def start_daemon(self, path):
+        self.daemon = JobservantDaemon(
+            path, log_level='none',
+            account_options={'client_factory': self.cluster.client,
+                             'status_cache_ttl': 60})
+        self.daemon.start()
+
+    def make_account(self, path, fast_submit=True):
+        # Without the simulator's client, so only the daemon can connect
+        return simulated_account(self.cluster, client_factory=None,
+                                 fast_submit=fast_submit, daemon_socket=path)
+
+    def test_clients_share_squeue(self, tmp_path):
+        path = str(tmp_path / 'daemon.sock')
+        self.start_daemon(path)
+        accounts = [self.make_account(path) for i in range(5)]
+        jobs = [account.submit_job(text='echo hi\n', account='def-me')
+                for account in accounts]
+        assert self.cluster.stats['sbatch']['commands'] == 5
+
+        # One squeue for all the clients' jobs, as long as it is fresh
+        self.cluster.reset_stats()
+        for i in range(3):
+            assert [job.status()['status'] for job in jobs] == \
+                ['waiting'] * 5
+        assert self.cluster.stats['squeue']['commands'] == 1
+        assert accounts[0].remote_now() > 0
+        assert accounts[0].command_statistics()['date']['count'] == 1
+
+        # Files still come back through the daemon
+        self.cluster.advance(200)
+        self.daemon.accounts[('simulated.cluster',
+                              self.cluster.username)].snapshot_at = None
+        assert jobs[1].status()['status'] == 'finished'
+        assert jobs[1].fetch_output() == \
+            'job 1001 started\njob 1001 completed\n'
+        # None of the clients opened an SSH connection of its own
+        assert all(account.pool is None for account in accounts)
+        for account in accounts:
+            account.daemon_client().close()
+
+    def test_uploads_and_submit_many(self, tmp_path):
+        path = str(tmp_path / 'daemon.sock')
+        self.start_daemon(path)
+        account = self.make_account(path, fast_submit=False)
+        job = account.submit_job(text='echo hi\n', account='def-me',
+                                 inputs={'data.txt': 'one\n'})
+        assert self.cluster.files[job.submit_script_path].startswith(
+            b'#!/bin/sh')
+        assert self.cluster.files[job.work_directory + '/data.txt'] == \
+            b'one\n'
+        collection = account.submit_many(
+            [{'text': 'echo %d\n' % i, 'account': 'def-me'}
+             for i in range(3)])
+        assert len(collection.jobids()) == 3
+        assert account.pool is None
+        account.daemon_client().close()
+
+    def test_watch(self, tmp_path):
+        path = str(tmp_path / 'daemon.sock')
+        self.start_daemon(path)
+        account = self.make_account(path)
+        job = account.submit_job(text='echo hi\n', account='def-me')
+        self.cluster.advance(200)
+        finished = threading.Event()
+        statuses = []
+
+        def callback(status):
+            statuses.append(status)
+            if status['status'] == 'finished':
+                finished.set()
+
+        account.watch(job, callback)
+        assert finished.wait(5)
+        assert statuses == [{'jobid': job.jobid, 'status': 'finished'}]
+        account.daemon_client().close()
+
+    def test_falls_back_without_daemon(self, tmp_path):
+        account = simulated_account(
+            self.cluster, daemon_socket=str(tmp_path / 'none.sock'))
+        job = account.submit_job(text='echo hi\n', account='def-me')
+        assert job.status()['status'] == 'waiting'
@@ -0,0 +1,46 @@
+from fake_ssh import FakeClusterAccount
+
+
+SACCT_OUTPUT = '''12|COMPLETED|0:0|00:02:00|00:03:00|4|1||4000Mc
+12.batch|COMPLETED|0:0|00:02:00|00:03:00|4|1|1048576K|4000Mc
+12.extern|COMPLETED|0:0|00:02:00|00:00:00|4|1|1024K|4000Mc
+13|FAILED|2:0|1-00:00:10|05:00.500|1|1||1G
+13.batch|FAILED|2:0|1-00:00:10|05:00.500|1|1|2G|
+14|RUNNING|0:0|00:01:00|00:00:00|1|1||1G
+'''
+
+
+class TestJobAccounting:
+    def setup_method(self):
+        self.cluster_account = FakeClusterAccount({'sacct': SACCT_OUTPUT})
+
+    def test_one_query_for_many_jobs(self):
+        efficiency = self.cluster_account.efficiency_hashes(['12', '13',
+                                                             '14'])
+        assert self.cluster_account.commands == [
+            'sacct -P -n -j 12,13,14 --format=JobID,State,ExitCode,' +
+            'Elapsed,TotalCPU,AllocCPUS,NNodes,MaxRSS,ReqMem'
+        ]
+        assert efficiency['12'] == {
+            'state': 'COMPLETED (exit code 0)',
+            'exit_code': '0',
+            'walltime': '00:02:00',
+            'cpu_utilized': '00:03:00',
+            'cpu_efficiency': '37.50% of 00:08:00 core-walltime',
+            'memory_utilized': '1.00 GB',
+            'memory_efficiency': '6.40% of 15.62 GB'
+        }
+        assert efficiency['13']['exit_code'] == '2'
+        assert efficiency['13']['walltime'] == '1-00:00:10'
+        assert efficiency['13']['cpu_utilized'] == '00:05:00'
+        assert efficiency['13']['memory_efficiency'] == '200.00% of 1.00 GB'
+        assert efficiency['14']['state'] == 'RUNNING'
+        assert 'exit_code' not in efficiency['14']
+
+    def test_finished_jobs_are_cached(self):
+        self.cluster_account.efficiency_hashes(['12', '13', '14'])
+        self.cluster_account.efficiency_hashes(['12', '13', '14'])
+        assert self.cluster_account.commands[-1].startswith(
+            'sacct -P -n -j 14 ')
+        self.cluster_account.efficiency_hashes(['12', '13'])
+        assert len(self.cluster_account.commands) == 2
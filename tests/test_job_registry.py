@@ -0,0 +1,81 @@
+import pytest
+from fake_ssh import simulated_account
+from jobservant.job_registry import JobRegistry
+from jobservant.simulator import SimulatedCluster
+
+
+class TestJobRegistry:
+    def setup_method(self):
+        self.cluster = SimulatedCluster(pending_seconds=10, run_seconds=100)
+
+    def make_account(self, registry):
+        return simulated_account(self.cluster, registry=registry)
+
+    def test_reattach_after_restart(self, tmp_path):
+        path = str(tmp_path / 'registry.sqlite3')
+        account = self.make_account(path)
+        job = account.submit_job(text='echo hi\n', account='def-me',
+                                 time='1:00:00')
+        account.submit_job(text='echo %j\n', account='def-me', array='1-2')
+        assert job.status()['status'] == 'waiting'
+        account.registry.close()
+
+        # A new session, with nothing but the registry to go on
+        account = self.make_account(path)
+        jobs = account.registered_jobs()
+        assert [job.jobid for job in jobs] == ['1000', '1001']
+        assert jobs[0].work_directory == job.work_directory
+        assert jobs[0].submit_script_path == job.submit_script_path
+        assert jobs[0].job_params['time'] == '1:00:00'
+        assert jobs[1].task_ids() == ['1', '2']
+        assert len(account.registered_jobs(state='waiting')) == 1
+
+        self.cluster.advance(200)
+        assert [stat['status'] for stat in jobs.statuses()] == \
+            ['finished', 'finished']
+        assert len(account.registered_jobs(state='finished')) == 2
+
+    def test_finished_jobs_are_not_queried_again(self):
+        account = self.make_account(JobRegistry(':memory:'))
+        job = account.submit_job(text='echo hi\n', account='def-me')
+        self.cluster.advance(200)
+        assert job.status()['status'] == 'finished'
+        assert job.efficiency_hash()['state'] == 'COMPLETED (exit code 0)'
+
+        self.cluster.reset_stats()
+        job = account.registered_job(job.jobid)
+        assert job.status()['status'] == 'finished'
+        assert job.efficiency_hash()['state'] == 'COMPLETED (exit code 0)'
+        assert self.cluster.stats == {}
+
+    def test_running_accounting_is_not_stored(self):
+        registry = JobRegistry(':memory:')
+        account = self.make_account(registry)
+        job = account.submit_job(text='echo hi\n', account='def-me')
+        self.cluster.advance(20)
+        assert job.efficiency_hash()['state'] == 'RUNNING'
+        assert registry.efficiencies(account.server, [job.jobid]) == {}
+
+        registry.forget(account.server, [job.jobid])
+        assert len(account.registered_jobs()) == 0
+
+    def test_failed_squeue_does_not_finish_jobs(self):
+        registry = JobRegistry(':memory:')
+        account = self.make_account(registry)
+        job = account.submit_job(text='echo hi\n', account='def-me')
+        self.cluster.advance(20)
+        handlers = list(self.cluster.handlers)
+        self.cluster.handlers = [
+            (regex, handler) if not regex.startswith('^squeue') else
+            (regex, lambda shell, arguments: (
+                1, b'slurm_load_jobs error: Socket timed out\n'))
+            for regex, handler in handlers]
+        with pytest.raises(ValueError):
+            job.status()
+        assert registry.states(account.server, [job.jobid]) == \
+            {job.jobid: 'submitted'}
+
+        self.cluster.handlers = handlers
+        self.cluster.reset_stats()
+        assert job.status()['status'] == 'running'
+        assert self.cluster.stats['squeue']['commands'] == 1
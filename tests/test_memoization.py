@@ -0,0 +1,59 @@
+from fake_ssh import simulated_account
+from jobservant.job_registry import JobRegistry
+from jobservant.simulator import SimulatedCluster
+
+
+class TestMemoization:
+    def setup_method(self):
+        self.cluster = SimulatedCluster(pending_seconds=10, run_seconds=100)
+        self.account = simulated_account(self.cluster, memoize=True,
+                                         registry=JobRegistry(':memory:'))
+
+    def submit(self, text='echo hi\n', **kwargs):
+        return self.account.submit_job(text=text, account='def-me', **kwargs)
+
+    def test_attach_to_queued_job(self):
+        job = self.submit(inputs={'data.txt': 'one\n'})
+        assert self.cluster.files[job.work_directory + '/data.txt'] == \
+            b'one\n'
+        assert self.submit(inputs={'data.txt': 'one\n'}).jobid == job.jobid
+        assert self.submit(inputs={'data.txt': 'two\n'}).jobid != job.jobid
+        assert self.submit(text='echo bye\n').jobid != job.jobid
+        assert self.submit(memoize=False).jobid != job.jobid
+        assert len(self.cluster.jobs) == 4
+
+    def test_reuse_finished_job(self):
+        job = self.submit()
+        self.cluster.advance(200)
+        reused = self.submit()
+        assert reused.jobid == job.jobid
+        assert reused.fetch_output() == \
+            'job 1000 started\njob 1000 completed\n'
+
+        # Not once its work directory is gone
+        reused.cleanup()
+        assert self.submit().jobid != job.jobid
+
+    def test_failed_job_is_resubmitted(self):
+        job = self.submit()
+        self.cluster.jobs[job.jobid].exit_code = 1
+        self.cluster.advance(200)
+        assert self.submit().jobid != job.jobid
+
+    def test_evict_by_age_and_size(self):
+        jobs = [self.submit(text='echo %d\n' % i) for i in range(3)]
+        self.cluster.advance(200)
+        assert [job.status()['status'] for job in jobs] == ['finished'] * 3
+        sizes = self.account.directory_sizes([job.work_directory
+                                              for job in jobs])
+        assert len(sizes) == 3
+
+        evicted = self.account.evict_memoized(
+            max_bytes=sum(sizes.values()) - 1)
+        assert evicted == [jobs[0].jobid]
+        assert jobs[0].work_directory not in self.cluster.directories
+        assert jobs[1].work_directory in self.cluster.directories
+        assert self.account.evict_memoized(max_age=3600) == []
+        assert self.account.evict_memoized(max_age=-1) == \
+            [jobs[1].jobid, jobs[2].jobid]
+        assert self.cluster.directories[self.cluster.workspace] == set()
@@ -0,0 +1,138 @@
+import threading
+import time
+from datetime import datetime
+from fake_ssh import FakeClusterAccount
+from jobservant.cluster_job import ClusterJob
+from jobservant.polling_scheduler import PollingScheduler
+
+
+class TestPollingScheduler:
+    def make_job(self, cluster_account, jobid):
+        job = ClusterJob(cluster_account=cluster_account, text='')
+        job.jobid = jobid
+        return job
+
+    def test_due_jobs_share_one_query(self):
+        queue = {'1': 'R', '2': 'R'}
+
+        def squeue(command):
+            return ''.join('%s|%s|N/A|%s|STATE|N/A|N/A|N/A|def|cpu|n1\n' %
+                           (jobid, jobid, state)
+                           for jobid, state in queue.items()), 0
+
+        cluster_account = FakeClusterAccount(
+            {'squeue': squeue}, status_cache_ttl=0,
+            polling={'min_interval': 0.01, 'default_interval': 0.01,
+                     'max_running_interval': 0.01})
+        seen = {'1': [], '2': []}
+        finished = threading.Event()
+
+        def callback(status):
+            seen[status['jobid']].append(status['status'])
+            if status['status'] == 'running' and len(seen['1']) == 3:
+                queue.clear()
+            if all(statuses and statuses[-1] == 'finished'
+                   for statuses in seen.values()):
+                finished.set()
+
+        scheduler = cluster_account.polling_scheduler()
+        # Both jobs are due before the scheduler thread can look
+        with scheduler.condition:
+            for jobid in ['1', '2']:
+                cluster_account.watch(self.make_job(cluster_account, jobid),
+                                      callback)
+        assert finished.wait(5.0)
+        scheduler.stop()
+
+        squeue_commands = [command for command in cluster_account.commands
+                           if command.startswith('squeue')]
+        assert all(' -j 1,2 ' in command for command in squeue_commands)
+        assert seen['1'] == seen['2']
+        assert seen['1'][-1] == 'finished'
+
+    def test_staggered_watches_come_to_share_queries(self):
+        jobids = [str(i) for i in range(1, 6)]
+
+        def squeue(command):
+            return ''.join('%s|%s|N/A|R|RUNNING|N/A|N/A|N/A|def|cpu|n1\n' %
+                           (jobid, jobid) for jobid in jobids), 0
+
+        cluster_account = FakeClusterAccount(
+            {'squeue': squeue}, status_cache_ttl=0,
+            polling={'min_interval': 0.1, 'default_interval': 0.1,
+                     'max_running_interval': 0.1})
+        seen = dict((jobid, 0) for jobid in jobids)
+        checked = threading.Event()
+
+        def callback(status):
+            seen[status['jobid']] += 1
+            if min(seen.values()) >= 5:
+                checked.set()
+
+        # Watched from different cells, a moment apart
+        for jobid in jobids:
+            cluster_account.watch(self.make_job(cluster_account, jobid),
+                                  callback)
+            time.sleep(0.02)
+        assert checked.wait(5.0)
+        cluster_account.polling_scheduler().stop()
+
+        squeue_commands = [command for command in cluster_account.commands
+                           if command.startswith('squeue')]
+        assert len(squeue_commands) < sum(seen.values()) / 2
+        last = squeue_commands[-1].split(' -j ')[1].split()[0]
+        assert sorted(last.split(',')) == jobids
+
+    def test_bad_job_state_does_not_stop_polling(self):
+        queue = {'1': 'CF', '2': 'R'}
+
+        def squeue(command):
+            return ''.join('%s|%s|N/A|%s|STATE|N/A|N/A|N/A|def|cpu|n1\n' %
+                           (jobid, jobid, state)
+                           for jobid, state in queue.items()), 0
+
+        cluster_account = FakeClusterAccount(
+            {'squeue': squeue}, status_cache_ttl=0, log_level='none',
+            polling={'min_interval': 0.01, 'default_interval': 0.01,
+                     'max_running_interval': 0.01})
+        seen = {'1': [], '2': []}
+        checked = threading.Event()
+
+        def callback(status):
+            seen[status['jobid']].append(status['status'])
+            if len(seen['2']) == 3:
+                queue['1'] = 'R'
+            if len(seen['1']) > 0:
+                checked.set()
+
+        scheduler = cluster_account.polling_scheduler()
+        for jobid in ['1', '2']:
+            cluster_account.watch(self.make_job(cluster_account, jobid),
+                                  callback)
+        # Job 1 is checked again once its state makes sense, and job 2
+        # never stops being checked
+        assert checked.wait(5.0)
+        scheduler.stop()
+        assert seen['1'][0] == 'running'
+        assert len(seen['2']) >= 3
+
+    def test_next_interval(self):
+        cluster_account = FakeClusterAccount({})
+        cluster_account.remote_now = lambda: \
+            datetime(2020, 1, 1, 12, 0, 0).timestamp()
+        scheduler = PollingScheduler(cluster_account)
+        watch = {'interval': 20.0}
+
+        waiting = {'status': 'waiting'}
+        assert scheduler.next_interval(
+            watch, waiting, {'START_TIME': '2020-01-01T13:00:00'}) == 600.0
+        assert scheduler.next_interval(
+            watch, waiting, {'START_TIME': '2020-01-01T12:01:00'}) == 30.0
+        assert scheduler.next_interval(
+            watch, waiting, {'START_TIME': 'N/A'}) == 30.0
+
+        running = {'status': 'running'}
+        assert scheduler.next_interval(
+            watch, running, {'END_TIME': '2020-01-01T12:00:02'}) == 5.0
+        assert scheduler.next_interval(
+            watch, running, {'END_TIME': '2020-01-02T12:00:00'}) == 120.0
@@ -0,0 +1,51 @@
+from fake_ssh import FakeClusterAccount
+from jobservant.queue_record import QueueRecordParser
+
+
+class TestQueueRecord:
+    def test_parse(self):
+        parser = QueueRecordParser()
+        record = parser.parse('12|12|N/A|R|RUNNING|2020-01-01T00:00:00|' +
+                              'N/A|2020-01-01T01:00:00|def-me|cpu|n[1-2]\n')
+        assert record['ST'] == 'R'
+        assert record['NODELIST'] == 'n[1-2]'
+        assert record.get('FEATURES') is None
+        assert record.to_hash()['ACCOUNT'] == 'def-me'
+        assert not hasattr(record, '__dict__')
+
+    def test_parse_bad_line(self):
+        assert QueueRecordParser().parse('12|R\n') is None
+
+    def test_selected_fields(self):
+        parser = QueueRecordParser(['STATE'])
+        assert parser.format == '%i|%F|%K|%t|%T'
+        record = parser.parse('7_1|7|1|PD|PENDING')
+        assert record['STATE'] == 'PENDING'
+        assert record.get('NODELIST', 'none') == 'none'
+
+    def test_unknown_field(self):
+        try:
+            QueueRecordParser(['FEATURES'])
+            assert False
+        except ValueError:
+            pass
+
+    def test_compact_query(self):
+        cluster_account = FakeClusterAccount({
+            'squeue': '7_1|7|1|R|RUNNING\n8|8|N/A|PD|PENDING\n'
+        }, queue_fields=['STATE'])
+        records = cluster_account.queue_status_hashes(['7', '8'],
+                                                      expand_arrays=True)
+        assert cluster_account.commands == [
+            "squeue -h -j 7,8 -o '%i|%F|%K|%t|%T' -r"
+        ]
+        assert sorted(records) == ['7_1', '8']
+        assert records['7_1']['STATE'] == 'RUNNING'
+
+        cluster_account = FakeClusterAccount({
+            'squeue': '7_1|7|1|R|RUNNING|N/A|N/A|N/A|def-me|cpu|n1\n' +
+            '8|8|N/A|PD|PENDING|N/A|N/A|N/A|def-me|cpu|\n'
+        })
+        records = cluster_account.queue_status_hashes(['7', '8'])
+        assert sorted(records) == ['7_1', '8']
+        assert records['8']['ST'] == 'PD'
@@ -0,0 +1,63 @@
+import json
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from fake_ssh import FakeClusterAccount, simulated_account
+from jobservant.remote_agent import RemoteAgent
+from jobservant.simulator import SimulatedCluster
+
+
+class TestRemoteAgent:
+    def make_account(self, cluster):
+        return simulated_account(cluster, agent=True)
+
+    def test_agent_program(self):
+        # The program the cluster runs, run here
+        agent = RemoteAgent(FakeClusterAccount({}))
+        process = subprocess.Popen(['sh', '-c', agent.command()],
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE)
+        assert process.stdout.readline() == RemoteAgent.GREETING
+        requests = [{'id': 1, 'command': 'sleep 0.2; echo slow'},
+                    {'id': 2, 'command': 'echo out; echo err >&2; exit 3'}]
+        for request in requests:
+            process.stdin.write(json.dumps(request).encode() + b'\n')
+        process.stdin.close()
+
+        results = []
+        for request in requests:
+            header = json.loads(process.stdout.readline())
+            results.append((header['id'], header['code'],
+                            process.stdout.read(header['stdout']),
+                            process.stdout.read(header['stderr'])))
+        assert process.wait() == 0
+        # The quick command doesn't wait for the slow one
+        assert results == [(2, 3, b'out\n', b'err\n'),
+                           (1, 0, b'slow\n', b'')]
+
+    def test_commands_share_one_channel(self):
+        cluster = SimulatedCluster()
+        account = self.make_account(cluster)
+        job = account.submit_job(text='echo hi\n', account='def-me')
+        assert cluster.stats['sbatch']['channels'] == 1
+
+        cluster.reset_stats()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            exists = list(executor.map(
+                account.does_directory_exist,
+                [job.work_directory, '/nowhere'] * 10))
+        assert exists == [True, False] * 10
+        assert job.status()['status'] == 'waiting'
+        assert cluster.stats['agent']['channels'] == 1
+        assert cluster.totals()['channels'] == 1
+        assert cluster.stats['test']['commands'] == 20
+
+        stats = account.command_statistics()
+        assert stats['test']['exit_codes'] == {0: 10, 1: 10}
+        account.agent.close()
+
+    def test_falls_back_without_python(self):
+        cluster = SimulatedCluster(python3=False)
+        account = self.make_account(cluster)
+        assert account.does_directory_exist(cluster.workspace)
+        assert not account.use_agent
+        assert cluster.stats['test']['channels'] == 1
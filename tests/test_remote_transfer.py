@@ -0,0 +1,104 @@
+import gzip
+import io
+from fake_ssh import FakeClusterAccount, FakeSSHClient
+from jobservant.remote_transfer import BufferReader
+
+
+class TestRemoteTransfer:
+    def setup_method(self):
+        self.cluster_account = FakeClusterAccount({})
+        self.cluster_account.ssh = FakeSSHClient()
+        self.transfer = self.cluster_account.remote_transfer()
+
+    def test_upload_bytes(self):
+        data = bytes(range(256)) * 1000
+        self.cluster_account.upload_file('/scratch/a.bin', data)
+        assert self.transfer.sftp.files == {'/scratch/a.bin': data}
+
+    def test_upload_text_and_file_objects(self):
+        self.cluster_account.upload_file('/scratch/a.txt', 'héllo')
+        self.cluster_account.upload_file('/scratch/b.txt',
+                                         io.StringIO('hello'))
+        assert self.transfer.sftp.files == {
+            '/scratch/a.txt': 'héllo'.encode('utf-8'),
+            '/scratch/b.txt': b'hello'
+        }
+
+    def test_session_is_reused(self):
+        for i in range(3):
+            self.cluster_account.upload_file('/scratch/%d' % i, 'x')
+        assert self.cluster_account.ssh.sftp_sessions == 1
+        assert self.transfer.sftp.opened == 3
+
+    def test_bad_contents(self):
+        try:
+            self.cluster_account.upload_file('/scratch/a', 12)
+            assert False
+        except ValueError:
+            pass
+
+    def test_upload_memoryview_in_chunks(self):
+        self.transfer.chunk_size = 7
+        data = bytearray(range(100))
+        self.cluster_account.upload_file('/scratch/a', memoryview(data))
+        assert self.transfer.sftp.files['/scratch/a'] == bytes(data)
+
+    def test_upload_compressed(self):
+        data = b'a,b,c\n' * 1000
+        self.cluster_account.upload_file('/scratch/a.csv', data,
+                                         compress=True)
+        command = self.cluster_account.commands[-1]
+        assert command.startswith('gzip -dc > /scratch/a.csv.part_')
+        assert command.endswith(' /scratch/a.csv')
+        sent = self.cluster_account.stdins[-1].getvalue()
+        assert len(sent) < len(data) / 10
+        assert gzip.decompress(sent) == data
+
+    def test_download(self):
+        self.cluster_account.outputs['cat /scratch/a'] = \
+            lambda command: (b'abc', 0)
+        local_file = io.BytesIO()
+        assert self.cluster_account.download_file('/scratch/a',
+                                                  local_file) == 3
+        assert local_file.getvalue() == b'abc'
+
+    def test_download_compressed(self):
+        data = b'line\n' * 10000
+        self.cluster_account.outputs['gzip -c'] = \
+            lambda command: (gzip.compress(data), 0)
+        local_file = io.BytesIO()
+        size = self.cluster_account.download_file('/scratch/a', local_file,
+                                                  compress=True)
+        assert size == len(data)
+        assert local_file.getvalue() == data
+
+    def test_automatic_compression(self):
+        cluster_account = FakeClusterAccount({}, compression='gzip',
+                                             compression_threshold=100)
+        cluster_account.upload_file('/scratch/small', b'x' * 99)
+        assert cluster_account.commands == []
+        cluster_account.upload_file('/scratch/big', b'x' * 100)
+        assert cluster_account.commands[-1].startswith('gzip -dc > ')
+        cluster_account.upload_file('/scratch/small.bin',
+                                    BufferReader([b'x' * 50, b'x' * 49]))
+        assert len(cluster_account.commands) == 1
+        cluster_account.upload_file('/scratch/big.bin',
+                                    BufferReader([b'x' * 50, b'x' * 50]))
+        assert len(cluster_account.commands) == 2
+
+        data = b'x' * 1000
+        cluster_account.outputs['if [ '] = \
+            lambda command: (b'z\n' + gzip.compress(data), 0)
+        assert cluster_account.read_file('/scratch/big') == data
+        assert '-ge 100 ]' in cluster_account.commands[-1]
+
+        cluster_account.outputs['if [ '] = lambda command: (b'r\nsmall', 0)
+        assert cluster_account.read_file('/scratch/small') == b'small'
+
+    def test_unknown_compression(self):
+        cluster_account = FakeClusterAccount({}, compression='rar')
+        try:
+            cluster_account.remote_transfer()
+            assert False
+        except ValueError:
+            pass
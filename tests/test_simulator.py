@@ -0,0 +1,81 @@
+from fake_ssh import simulated_account
+from jobservant.cluster_account import ClusterAccount
+from jobservant.simulator import SimulatedCluster
+
+
+class TestSimulator:
+    # Round trips per operation are pinned down here, so changes that add
+    # remote commands to the job lifecycle show up as failures
+    def setup_method(self):
+        self.cluster = SimulatedCluster(pending_seconds=10, run_seconds=100)
+        self.account = simulated_account(
+            self.cluster, status_cache_ttl=ClusterAccount.STATUS_CACHE_TTL)
+        self.account.connect()
+        self.account.measure_clock_offset()
+        self.cluster.reset_stats()
+
+    def teardown_method(self):
+        self.account.pool.close()
+
+    def round_trips(self):
+        return self.cluster.totals()['round_trips']
+
+    def test_job_lifecycle(self):
+        job = self.account.submit_job(text='echo hi\n', account='def-me')
+        assert self.round_trips() == 1
+        assert job.jobid == '1000'
+        assert job.work_directory in self.cluster.directories
+
+        self.cluster.reset_stats()
+        assert job.status()['status'] == 'waiting'
+        self.cluster.advance(20)
+        self.account.status_cache.invalidate()
+        assert job.status()['status'] == 'running'
+        assert self.round_trips() == 2
+
+        self.cluster.advance(100)
+        self.account.status_cache.invalidate()
+        self.cluster.reset_stats()
+        assert job.fetch_output() == 'job 1000 started\njob 1000 completed\n'
+        assert self.round_trips() == 2
+        assert job.efficiency_hash()['state'] == 'COMPLETED (exit code 0)'
+
+        self.cluster.reset_stats()
+        job.cleanup()
+        assert self.round_trips() == 1
+        assert job.work_directory not in self.cluster.directories
+
+    def test_collection_status_is_one_round_trip(self):
+        specs = [{'text': 'echo %d\n' % i, 'account': 'def-me'}
+                 for i in range(50)]
+        collection = self.account.submit_many(specs)
+        assert len(collection.succeeded()) == 50
+        assert self.cluster.stats['sbatch']['round_trips'] == 50
+
+        self.cluster.reset_stats()
+        statuses = collection.statuses()
+        assert [stat['status'] for stat in statuses] == ['waiting'] * 50
+        assert self.cluster.stats == {'squeue': self.cluster.stats['squeue']}
+        assert self.round_trips() == 1
+
+    def test_cancel_and_arrays(self):
+        job = self.account.submit_job(text='echo hi\n', account='def-me',
+                                      array='1-3')
+        self.cluster.advance(20)
+        self.account.status_cache.invalidate()
+        assert job.status()['tasks'] == {'running': 3}
+
+        job.cancel()
+        assert job.status()['status'] == 'finished'
+        states = self.account.efficiency_hashes(
+            [job.task_jobid(task_id) for task_id in job.task_ids()])
+        assert [stat['state'] for stat in states.values()] == \
+            ['CANCELLED (exit code 0)'] * 3
+
+    def test_file_transfers(self):
+        job = self.account.submit_job(text='echo hi\n', account='def-me')
+        self.cluster.reset_stats()
+        path = job.create_remote_file('input.txt', 'some input\n')
+        assert self.cluster.files[path] == b'some input\n'
+        assert job.fetch_file('input.txt') == 'some input\n'
+        assert self.cluster.stats['cat']['round_trips'] == 1
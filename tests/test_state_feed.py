@@ -0,0 +1,82 @@
+import pytest
+from fake_ssh import simulated_account
+from jobservant.job_registry import JobRegistry
+from jobservant.simulator import SimulatedCluster
+from jobservant.state_feed import StateFeed
+
+
+class TestStateFeed:
+    def setup_method(self):
+        self.cluster = SimulatedCluster(pending_seconds=10, run_seconds=100)
+        # The simulated clock only moves when asked, so it is read each time
+        self.account = simulated_account(self.cluster,
+                                         clock_offset_refresh=0,
+                                         registry=JobRegistry(':memory:'))
+
+    def submit(self, **kwargs):
+        return self.account.submit_job(text='echo hi\n', account='def-me',
+                                       **kwargs)
+
+    def test_terminal_states(self):
+        assert self.account.state_changes() == {}
+        ok, failed, slow = [self.submit() for i in range(3)]
+        self.cluster.jobs[failed.jobid].exit_code = 2
+        self.cluster.jobs[slow.jobid].end_time += 10000
+        assert self.account.state_changes() == {}
+
+        self.cluster.advance(200)
+        changes = self.account.state_changes()
+        assert sorted(changes) == [ok.jobid, failed.jobid]
+        assert changes[ok.jobid]['state'] == 'COMPLETED'
+        assert changes[failed.jobid]['state'] == 'FAILED'
+        assert changes[failed.jobid]['exit_code'] == '2'
+        assert self.account.registry.states(
+            self.account.server, [ok.jobid, slow.jobid]) == \
+            {ok.jobid: 'finished', slow.jobid: 'submitted'}
+
+        # Reported once, even though the windows overlap
+        self.cluster.advance(30)
+        assert self.account.state_changes() == {}
+
+        slow.cancel()
+        self.cluster.advance(5)
+        assert self.account.state_changes() == \
+            {slow.jobid: {'state': 'CANCELLED', 'exit_code': '0',
+                          'end': self.cluster.time_string(
+                              self.cluster.now - 5)}}
+
+    def test_cost_grows_with_changes(self):
+        self.account.state_changes()
+        jobs = [self.submit() for i in range(20)]
+        for job in jobs[1:]:
+            self.cluster.jobs[job.jobid].end_time += 10000
+        self.cluster.advance(200)
+        self.cluster.reset_stats()
+        assert list(self.account.state_changes()) == [jobs[0].jobid]
+        assert self.cluster.stats['sacct']['commands'] == 1
+        assert self.cluster.stats['sacct']['bytes_in'] < 100
+
+    def test_array_tasks_and_jobid_filter(self):
+        self.account.state_changes()
+        array = self.submit(array='1-3')
+        other = self.submit()
+        self.cluster.advance(200)
+        changes = self.account.state_changes([array.jobid])
+        assert sorted(changes) == [array.task_jobid(i) for i in [1, 2, 3]]
+        assert other.jobid not in changes
+
+    def test_running_transitions(self):
+        self.account.feed_options = {'states': ['RUNNING', 'COMPLETED']}
+        self.account.state_changes()
+        job = self.submit()
+        self.cluster.advance(20)
+        assert self.account.state_changes()[job.jobid]['state'] == 'RUNNING'
+        self.cluster.advance(20)
+        assert self.account.state_changes() == {}
+        self.cluster.advance(200)
+        assert self.account.state_changes()[job.jobid]['state'] == \
+            'COMPLETED'
+
+    def test_unknown_state(self):
+        with pytest.raises(ValueError):
+            StateFeed(self.account, states=['DONE'])
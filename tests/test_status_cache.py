@@ -0,0 +1,133 @@
+import threading
+import time
+from fake_ssh import FakeClusterAccount
+
+
+class FakeQueue:
+    def __init__(self, delay=0.0):
+        self.states = {}
+        self.delay = delay
+
+    def squeue(self, command):
+        time.sleep(self.delay)
+        jobids = command.split()[3].split(',')
+        lines = ['%s|%s|N/A|%s|STATE|N/A|N/A|N/A|def|cpu|n1\n' %
+                 (jobid, jobid, self.states[jobid])
+                 for jobid in jobids if jobid in self.states]
+        return ''.join(lines), 0
+
+
+class TestStatusCache:
+    def make_account(self, queue, **kwargs):
+        return FakeClusterAccount({'squeue': queue.squeue}, **kwargs)
+
+    def squeue_commands(self, cluster_account):
+        return [command for command in cluster_account.commands
+                if command.startswith('squeue')]
+
+    def test_results_are_shared_within_ttl(self):
+        queue = FakeQueue()
+        queue.states = {'1': 'PD', '2': 'R'}
+        cluster_account = self.make_account(queue, status_cache_ttl=60.0)
+        cluster_account.queue_status_hashes(['1', '2'])
+        assert cluster_account.queue_status_hashes(['2'])['2']['ST'] == 'R'
+        assert len(self.squeue_commands(cluster_account)) == 1
+
+        cluster_account.status_cache.invalidate(['2'])
+        cluster_account.queue_status_hashes(['1', '2'])
+        assert self.squeue_commands(cluster_account)[-1].startswith(
+            'squeue -h -j 2 ')
+
+    def test_no_cache(self):
+        queue = FakeQueue()
+        cluster_account = self.make_account(queue, status_cache_ttl=0)
+        cluster_account.queue_status_hashes(['1'])
+        cluster_account.queue_status_hashes(['1'])
+        assert len(self.squeue_commands(cluster_account)) == 2
+
+    def test_concurrent_callers_are_merged(self):
+        queue = FakeQueue(delay=0.2)
+        queue.states = dict((str(i), 'R') for i in range(10))
+        cluster_account = self.make_account(queue, status_cache_ttl=60.0)
+        results = {}
+
+        def poll(jobid):
+            results[jobid] = cluster_account.queue_status_hashes([jobid])
+
+        threads = [threading.Thread(target=poll, args=(str(i),))
+                   for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(results) == 10
+        assert all(results[jobid][jobid]['ST'] == 'R' for jobid in results)
+        # The first caller queries alone, the rest share the second query
+        assert len(self.squeue_commands(cluster_account)) <= 2
+
+    def test_subscribe_to_transitions(self):
+        queue = FakeQueue()
+        queue.states = {'1': 'PD', '2': 'PD'}
+        cluster_account = self.make_account(queue, status_cache_ttl=0.0001)
+        transitions = []
+        cluster_account.subscribe(
+            lambda *transition: transitions.append(transition), ['1'])
+
+        cluster_account.queue_status_hashes(['1', '2'])
+        queue.states['1'] = 'R'
+        time.sleep(0.01)
+        cluster_account.queue_status_hashes(['1', '2'])
+        del queue.states['1']
+        time.sleep(0.01)
+        cluster_account.queue_status_hashes(['1', '2'])
+
+        assert transitions == [('1', None, 'waiting'),
+                               ('1', 'waiting', 'running'),
+                               ('1', 'running', 'finished')]
+
+    def test_subscribe_without_cache(self):
+        queue = FakeQueue()
+        queue.states = {'1': 'PD'}
+        cluster_account = self.make_account(queue, status_cache_ttl=0)
+        transitions = []
+        cluster_account.subscribe(
+            lambda *transition: transitions.append(transition))
+        cluster_account.queue_status_hashes(['1'])
+        queue.states['1'] = 'R'
+        cluster_account.queue_status_hashes(['1'])
+        assert transitions == [('1', None, 'waiting'),
+                               ('1', 'waiting', 'running')]
+
+    def test_jobs_no_one_asks_about_are_forgotten(self):
+        queue = FakeQueue()
+        queue.states = {'1': 'R', '2': 'PD'}
+        cluster_account = self.make_account(queue, status_cache_ttl=0)
+        cache = cluster_account.status_cache
+        cache.expiry = 0.01
+        cluster_account.queue_status_hashes(['1', '2'])
+        del queue.states['2']
+        cluster_account.queue_status_hashes(['2'])
+        assert cache.states == {'1': 'running', '2': 'finished'}
+
+        time.sleep(0.02)
+        cluster_account.queue_status_hashes(['1'])
+        assert list(cache.entries) == ['1']
+        assert cache.states == {'1': 'running'}
+
+    def test_invalidated_while_querying(self):
+        queue = FakeQueue()
+        queue.states = {'1': 'R', '2': 'PD'}
+        cluster_account = self.make_account(queue, status_cache_ttl=60.0)
+        cluster_account.queue_status_hashes(['1'])
+
+        def invalidate(jobid, old_state, new_state):
+            # As a cancel() in another thread might, while job 2 is queried
+            cluster_account.status_cache.invalidate(['1'])
+
+        cluster_account.subscribe(invalidate, ['2'])
+        statuses = cluster_account.queue_status_hashes(['1', '2'])
+        assert statuses['1']['ST'] == 'R'
+        assert statuses['2']['ST'] == 'PD'
+        assert [command.split()[3] for command in
+                self.squeue_commands(cluster_account)] == ['1', '2', '1']
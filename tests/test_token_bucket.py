@@ -0,0 +1,25 @@
+import time
+from jobservant.token_bucket import TokenBucket
+
+
+class TestTokenBucket:
+    def test_burst_is_immediate(self):
+        bucket = TokenBucket(1.0, 5)
+        start = time.monotonic()
+        for i in range(5):
+            bucket.acquire()
+        assert time.monotonic() - start < 0.5
+
+    def test_rate_is_respected(self):
+        bucket = TokenBucket(50.0, 1)
+        start = time.monotonic()
+        for i in range(6):
+            bucket.acquire()
+        assert time.monotonic() - start >= 0.09
+
+    def test_bad_rate(self):
+        try:
+            TokenBucket(0)
+            assert False
+        except ValueError:
+            pass
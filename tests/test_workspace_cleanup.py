@@ -0,0 +1,111 @@
+import pytest
+from fake_ssh import simulated_account
+from jobservant.job_registry import JobRegistry
+from jobservant.simulator import SimulatedCluster
+
+
+class TestWorkspaceCleanup:
+    def setup_method(self):
+        self.cluster = SimulatedCluster(pending_seconds=10, run_seconds=100)
+        self.registry = JobRegistry(':memory:')
+        self.account = simulated_account(self.cluster)
+        self.account.measure_clock_offset()
+
+    def submit_many(self, count):
+        return self.account.submit_many(
+            [{'text': 'echo %d\n' % i, 'account': 'def-me'}
+             for i in range(count)])
+
+    def orphan(self, name, age):
+        # A work directory left behind by some earlier session
+        directory = self.cluster.workspace + '/cluster_job_' + name
+        self.cluster.make_directory(directory)
+        self.cluster.write_file(directory + '/slurm-1.out', b'x' * 100)
+        self.cluster.modified[directory] -= age
+        self.cluster.modified[directory + '/slurm-1.out'] -= age
+        return directory
+
+    def test_collection_cleanup_is_one_command(self):
+        collection = self.submit_many(20)
+        self.cluster.reset_stats()
+        assert collection.cleanup()
+        assert self.cluster.stats['rm']['commands'] == 1
+        assert not any(job.work_directory in self.cluster.directories
+                       for job in collection)
+
+    def test_background_cleanup(self):
+        collection = self.submit_many(3)
+        future = collection.cleanup(background=True)
+        assert future.result()
+        assert not any(job.work_directory in self.cluster.directories
+                       for job in collection)
+
+    def test_remove_directories_in_batches(self):
+        directories = [self.orphan(str(i), 0) for i in range(5)]
+        self.account.REMOVE_BATCH = 2
+        self.cluster.reset_stats()
+        assert self.account.remove_directories(directories)
+        assert self.cluster.stats['rm']['commands'] == 3
+        assert not any(directory in self.cluster.directories
+                       for directory in directories)
+
+    def test_collect_workspace(self):
+        queued = self.submit_many(1).jobs[0]
+        old = self.orphan('old', 7200)
+        older = self.orphan('older', 9000)
+        recent = self.orphan('recent', 60)
+        kept = self.orphan('kept', 9000)
+        self.cluster.modified[queued.work_directory] -= 9000
+        for path in [old, older, recent, kept]:
+            assert path in self.cluster.directories
+
+        self.cluster.reset_stats()
+        removed = self.account.collect_workspace(keep=[kept])
+        assert sorted(removed) == [old, older]
+        assert self.cluster.totals()['commands'] == 3
+        for path in [queued.work_directory, recent, kept]:
+            assert path in self.cluster.directories
+        assert old not in self.cluster.directories
+
+    def test_collect_by_age_and_size(self):
+        directories = [self.orphan(str(i), 4000 + 1000 * i)
+                       for i in range(4)]
+        assert self.account.collect_workspace(max_age=5500) == \
+            [directories[3], directories[2]]
+        sizes = self.account.workspace_directories()
+        removed = self.account.collect_workspace(
+            max_bytes=sum(size for size, modified in sizes.values()) - 1)
+        assert removed == [directories[1]]
+        assert directories[0] in self.cluster.directories
+
+    def test_registered_jobs_are_kept(self):
+        self.account.registry = self.registry
+        job = self.submit_many(1).jobs[0]
+        self.cluster.advance(200)
+        self.cluster.modified[job.work_directory] -= 9000
+        orphan = self.orphan('old', 9000)
+        assert self.account.collect_workspace() == [orphan]
+        assert job.work_directory in self.cluster.directories
+
+    def test_failed_squeue_removes_nothing(self):
+        queued = self.submit_many(1).jobs[0]
+        self.cluster.modified[queued.work_directory] -= 9000
+        orphan = self.orphan('old', 9000)
+        self.cluster.handlers = [
+            (regex, handler) if not regex.startswith('^squeue') else
+            (regex, lambda shell, arguments: (
+                1, b'slurm_load_jobs error: Socket timed out\n'))
+            for regex, handler in self.cluster.handlers]
+        with pytest.raises(ValueError):
+            self.account.collect_workspace()
+        assert queued.work_directory in self.cluster.directories
+        assert orphan in self.cluster.directories
+
+    def test_symlinked_workspace(self):
+        # squeue reports the job's directory under /lustre
+        self.cluster.links['/scratch'] = '/lustre/scratch'
+        queued = self.submit_many(1).jobs[0]
+        self.cluster.modified[queued.work_directory] -= 9000
+        orphan = self.orphan('old', 9000)
+        assert self.account.collect_workspace() == [orphan]
+        assert queued.work_directory in self.cluster.directories